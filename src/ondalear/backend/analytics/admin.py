@@ -8,7 +8,7 @@ This module contains analytics admin abstractions.
 import logging
 
 from ondalear.backend.core.django.admin import register, AbstractModelAdmin
-from ondalear.backend.analytics.models import  AnalysisResults
+from ondalear.backend.analytics.models import  AnalysisJob, AnalysisResults
 
 _logger = logging.getLogger(__name__)
 
@@ -24,8 +24,20 @@ class AnalysisResultsAdmin(AbstractModelAdmin):
          {'fields': _analysis_results_fields}),
     ) + AbstractModelAdmin.field_sets()     # pylint: disable=no-member
 
+_analysis_job_fields = ('client', 'name', 'status', 'request', 'output', 'error',
+                        'results', 'start_time', 'end_time')
+
+class AnalysisJobAdmin(AbstractModelAdmin):
+    """AnalysisJob model admin class.
+    """
+    list_display = AbstractModelAdmin.list_display + ('name', 'status')
+    fieldsets = (
+        ('Analysis job',
+         {'fields': _analysis_job_fields}),
+    ) + AbstractModelAdmin.field_sets()     # pylint: disable=no-member
+
 # Register the models and admin classes
-model_classes = (AnalysisResults,)
-admin_classes = (AnalysisResultsAdmin,)
+model_classes = (AnalysisResults, AnalysisJob)
+admin_classes = (AnalysisResultsAdmin, AnalysisJobAdmin)
 
 register(model_classes, admin_classes)
@@ -11,3 +11,7 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     """Analyticst app class definition"""
     name = 'analytics'
+
+    def ready(self):
+        """connect the analytics signal handlers"""
+        from ondalear.backend.analytics import signals  # pylint: disable=unused-import,import-outside-toplevel
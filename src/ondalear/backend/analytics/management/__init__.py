@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.analytics.management
+   :synopsis: analytics management package
+
+"""
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.analytics.management.commands
+   :synopsis: analytics management commands package
+
+"""
@@ -0,0 +1,243 @@
+"""
+.. module:: ondalear.backend.analytics.management.commands.benchmark_analysis
+   :synopsis: analysis request path benchmark command module
+
+Drives the analysis view and the text analytics service with the stub
+model family at several concurrency levels, reporting the throughput,
+the latency percentiles, the cache hit rate, and the db queries per
+request.  Results are saved as json, and may be compared with a previous
+run.  The configured analysis cache is cleared before each level, which
+empties a shared cache for all the processes on the node.
+
+"""
+import json
+import logging
+import os
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ondalear.backend.core.django.utils import current_site
+from ondalear.backend.core.python.utils import mkdir, utc_now
+from ondalear.backend.docmgmt.models import ClientUser
+from ondalear.backend.api.analytics.views import NLPAnalysisView
+from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE
+from ondalear.backend.services.stub_models import (register_stub_models,
+                                                   STUB_MODEL_FAMILY,
+                                                   STUB_MODEL_READING_COMPREHENSION)
+
+_logger = logging.getLogger(__name__)
+
+TARGET_VIEW = 'view'
+TARGET_SERVICE = 'service'
+TARGETS = (TARGET_VIEW, TARGET_SERVICE)
+
+# pylint: disable=no-member,broad-except
+
+def percentile(values, fraction):
+    """return the percentile of sorted values"""
+    if not values:
+        return None
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def source_version():
+    """return the source revision, if available"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    """db query counter, installed on a connection using execute_wrapper"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):    # pylint: disable=too-many-arguments
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """Analysis benchmark command"""
+    help = 'Benchmark the analysis request path using the stub model family'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='client user issuing the analysis requests')
+        parser.add_argument('--target', choices=TARGETS, nargs='+', default=list(TARGETS),
+                            help='benchmark the analysis view and/or the service')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                            help='concurrency levels')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per concurrency level')
+        parser.add_argument('--distinct', type=int, default=50,
+                            help='distinct analysis inputs, controlling the cache hit rate')
+        parser.add_argument('--latency', type=float, default=0.01,
+                            help='stub model latency in seconds')
+        parser.add_argument('--output-size', type=int, default=256,
+                            help='stub model output size')
+        parser.add_argument('--use-cache', action='store_true',
+                            help='use the analysis cache')
+        parser.add_argument('--output', help='results file path')
+        parser.add_argument('--compare', help='previous results file path')
+
+    def handle(self, *args, **options):
+        register_stub_models()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('unknown user {}'.format(options['username']))
+        client_user = ClientUser.objects.get_or_none(user=user)
+        if not client_user:
+            raise CommandError('user {} is not a client user'.format(user.username))
+
+        service = find(TEXT_ANALYTICS_SERVICE)
+        results = []
+        for target in options['target']:
+            for concurrency in options['concurrency']:
+                # each level starts with an empty cache, whichever the backend
+                service.cache.clear()
+                result = self.run_level(target, concurrency, user, client_user.client,
+                                        service, options)
+                results.append(result)
+                self.report(result)
+
+        parameters = {name: options[name] for name in
+                      ('requests', 'distinct', 'latency', 'output_size', 'use_cache')}
+        data = dict(version=source_version(),
+                    timestamp=utc_now().isoformat(),
+                    parameters=parameters,
+                    results=results)
+        output = options['output'] or os.path.join(
+            settings.BENCHMARK_DIR, 'analysis_{}.json'.format(utc_now().strftime('%Y%m%d%H%M%S')))
+        mkdir(os.path.dirname(os.path.abspath(output)))
+        with open(output, 'w') as output_file:
+            json.dump(data, output_file, indent=2)
+        self.stdout.write('results saved to {}'.format(output))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def request_data(self, index, options):     # pylint: disable=no-self-use
+        """return the analysis request data"""
+        variant = index % options['distinct']
+        text_reference = ' '.join('passage{}-word{}'.format(variant, word) for word in range(200))
+        return dict(
+            model_descriptor=dict(model_family=STUB_MODEL_FAMILY,
+                                  model_name=STUB_MODEL_READING_COMPREHENSION),
+            model_input=dict(text_reference=text_reference,
+                             text_auxiliary='question {}'.format(variant)),
+            model_params=dict(params=dict(latency=options['latency'],
+                                          output_size=options['output_size'])),
+            processing_instructions=dict(use_cache=options['use_cache'],
+                                         force_analysis=False,
+                                         save_results=False,
+                                         analysis_name='benchmark'))
+
+    def run_request(self, target, index, user, client, service, options):   # pylint: disable=too-many-arguments
+        """run a request, returning its latency, query count, and error flag"""
+        request_data = self.request_data(index, options)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        error = False
+        with connection.execute_wrapper(counter):
+            try:
+                if target == TARGET_VIEW:
+                    request = APIRequestFactory().post('/analyze/', request_data, format='json')
+                    force_authenticate(request, user=user)
+                    response = NLPAnalysisView.as_view()(request)
+                    error = response.status_code != status.HTTP_200_OK
+                else:
+                    request_context = dict(request_data, user=user, client=client,
+                                           site=current_site())
+                    service.analyze(request_context)
+            except Exception:
+                _logger.exception('benchmark request failed')
+                error = True
+        return (time.perf_counter() - start) * 1000, counter.count, error
+
+    def run_worker(self, target, worker, concurrency, user, client, service, options):  # pylint: disable=too-many-arguments
+        """run a worker thread share of the requests, closing its db connection"""
+        try:
+            return [self.run_request(target, index, user, client, service, options)
+                    for index in range(worker, options['requests'], concurrency)]
+        finally:
+            connection.close()
+
+    def run_level(self, target, concurrency, user, client, service, options):   # pylint: disable=too-many-arguments,too-many-locals
+        """run a concurrency level"""
+        cache_before = service.cache.stats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            worker_samples = list(executor.map(
+                lambda worker: self.run_worker(target, worker, concurrency, user, client,
+                                               service, options),
+                range(concurrency)))
+        samples = [sample for samples in worker_samples for sample in samples]
+        duration = time.perf_counter() - start
+
+        cache_after = service.cache.stats()
+        hits = cache_after.get('hits', 0) - cache_before.get('hits', 0)
+        misses = cache_after.get('misses', 0) - cache_before.get('misses', 0)
+        latencies = sorted(sample[0] for sample in samples)
+        queries = [sample[1] for sample in samples]
+        return dict(
+            target=target,
+            concurrency=concurrency,
+            requests=len(samples),
+            errors=sum(1 for sample in samples if sample[2]),
+            duration=round(duration, 3),
+            throughput=round(len(samples) / duration, 3),
+            latency=dict(mean=round(statistics.mean(latencies), 3),
+                         p50=round(percentile(latencies, 0.50), 3),
+                         p95=round(percentile(latencies, 0.95), 3),
+                         p99=round(percentile(latencies, 0.99), 3),
+                         max=round(latencies[-1], 3)),
+            queries_per_request=dict(mean=round(statistics.mean(queries), 3),
+                                     max=max(queries)),
+            cache_hit_rate=round(hits / (hits + misses), 3) if hits + misses else None)
+
+    def report(self, result):
+        """report a concurrency level result"""
+        latency = result['latency']
+        self.stdout.write(
+            '{target:8} concurrency: {concurrency:3} throughput: {throughput:9.2f}/s '
+            'p50: {p50:8.2f}ms p95: {p95:8.2f}ms p99: {p99:8.2f}ms '
+            'queries: {queries:6.2f} cache hit rate: {hit_rate} errors: {errors}'.format(
+                target=result['target'], concurrency=result['concurrency'],
+                throughput=result['throughput'], p50=latency['p50'], p95=latency['p95'],
+                p99=latency['p99'], queries=result['queries_per_request']['mean'],
+                hit_rate=result['cache_hit_rate'], errors=result['errors']))
+
+    def compare(self, path, results):
+        """compare the results with a previous run"""
+        with open(path) as input_file:
+            previous = json.load(input_file)
+        previous_results = {(result['target'], result['concurrency']): result
+                            for result in previous['results']}
+        self.stdout.write('compared with version {} of {}'.format(previous.get('version'),
+                                                                  previous.get('timestamp')))
+        for result in results:
+            before = previous_results.get((result['target'], result['concurrency']))
+            if not before:
+                continue
+            self.stdout.write(
+                '{:8} concurrency: {:3} throughput: {:+.1%} p95: {:+.1%}'.format(
+                    result['target'], result['concurrency'],
+                    result['throughput'] / before['throughput'] - 1,
+                    result['latency']['p95'] / before['latency']['p95'] - 1))
@@ -0,0 +1,40 @@
+"""
+.. module:: ondalear.backend.analytics.management.commands.recover_analysis_jobs
+   :synopsis: interrupted analysis jobs recovery command module
+
+Recovers the analysis jobs left behind by stopped or restarted workers.
+Jobs running for longer than the stale threshold are marked as failed, so
+that clients polling them see them finish, and pending jobs are processed
+again by the command.
+
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Interrupted analysis jobs recovery command"""
+    help = 'Fail the interrupted analysis jobs and process the pending ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='only fail the jobs running for more than these seconds, '
+                                 'ANALYTICS_JOB_STALE_AFTER by default')
+        parser.add_argument('--no-requeue', action='store_true',
+                            help='leave the pending jobs as they are')
+
+    def handle(self, *args, **options):
+        executor = find(TEXT_ANALYTICS_SERVICE).job_executor
+        failed, job_ids = executor.recover(options['stale_after'])
+        if not options['no_requeue']:
+            for job_id in job_ids:
+                executor.submit(job_id)
+            executor.shutdown(wait=True)
+
+        self.stdout.write('failed: {} requeued: {}'.format(
+            failed, 0 if options['no_requeue'] else len(job_ids)))
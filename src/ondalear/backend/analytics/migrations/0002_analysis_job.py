@@ -0,0 +1,52 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docmgmt', '0010_non_unique_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sites', '0002_alter_domain_unique'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, unique=True)),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('version', models.IntegerField(default=0)),
+                ('is_enabled', models.BooleanField(default=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(blank=True, max_length=256, null=True)),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('failed', 'Failed'), ('pending', 'Pending'), ('running', 'Running')], default='pending', max_length=16)),
+                ('request', jsonfield.fields.JSONField()),
+                ('output', jsonfield.fields.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='docmgmt.Client')),
+                ('creation_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analytics_analysisjob_related_creation_user', to=settings.AUTH_USER_MODEL)),
+                ('effective_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analytics_analysisjob_related_effective_user', to=settings.AUTH_USER_MODEL)),
+                ('results', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='analytics.AnalysisResults')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analytics_analysisjob_related_site', to='sites.Site')),
+                ('update_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analytics_analysisjob_related_update_user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Analysis job',
+                'verbose_name_plural': 'Analysis jobs',
+                'db_table': 'ondalear_analytics_analysis_job',
+                'get_latest_by': 'update_time',
+                'abstract': False,
+            },
+        ),
+    ]
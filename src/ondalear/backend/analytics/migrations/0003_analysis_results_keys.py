@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_analysis_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisresults',
+            name='input_key',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisresults',
+            name='model_key',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True),
+        ),
+    ]
@@ -4,3 +4,4 @@
 
 """
 from ondalear.backend.analytics.models.analysis_results import AnalysisResults
+from ondalear.backend.analytics.models.analysis_job import AnalysisJob
@@ -0,0 +1,63 @@
+"""
+.. module:: ondalear.backend.analytics.models.analysis_job
+   :synopsis: ondalear backend analysis job  module.
+
+The *analysis job* module contains the persisted state of asynchronous
+analysis requests, allowing any web worker to answer a status poll.
+
+"""
+import logging
+from inflection import humanize, pluralize, underscore
+from django.db.models import CASCADE, SET_NULL
+from django.utils.translation import ugettext_lazy as _
+
+from ondalear.backend.core.django import fields
+from ondalear.backend.core.django.models import db_table
+
+from ondalear.backend.docmgmt.models import constants as docmgmt_constants
+from ondalear.backend.docmgmt.models.client import Client
+from ondalear.backend.analytics.models import constants
+from ondalear.backend.analytics.models.analysis_results import AnalysisResults
+from ondalear.backend.analytics.models.base import app_label, AbstractAnalyticsModel
+
+
+_logger = logging.getLogger(__name__)
+
+_analysis_job = 'AnalysisJob'
+_analysis_job_verbose = humanize(underscore(_analysis_job))
+
+class AnalysisJob(AbstractAnalyticsModel):
+    """ Analysis job model class
+
+    Captures the analysis request, its processing status and its outcome.
+    """
+    name = fields.char_field(blank=True, null=True,
+                             max_length=docmgmt_constants.NAME_FIELD_MAX_LENGTH)
+    status = fields.char_field(
+        blank=False, null=False, default=constants.JOB_STATUS_PENDING,
+        choices=constants.JOB_STATUS_CHOICES,
+        max_length=constants.JOB_STATUS_FIELD_MAX_LENGTH)
+    request = fields.json_field(blank=False, null=False)
+    output = fields.json_field(blank=True, null=True)
+    error = fields.text_field(blank=True, null=True)
+    start_time = fields.datetime_field(blank=True, null=True)
+    end_time = fields.datetime_field(blank=True, null=True)
+
+    # deletion of client will result in deletion of its associated jobs
+    client = fields.foreign_key_field(Client, on_delete=CASCADE)
+    results = fields.foreign_key_field(AnalysisResults, on_delete=SET_NULL,
+                                       blank=True, null=True)
+
+    class Meta(AbstractAnalyticsModel.Meta):
+        """Meta class definition"""
+        db_table = db_table(app_label, _analysis_job)
+        verbose_name = _(_analysis_job_verbose)
+        verbose_name_plural = _(pluralize(_analysis_job_verbose))
+
+    def __str__(self):
+        """pretty format instance as string"""
+        return '{}:{}'.format(self.name or self.id, self.status)
+
+    def is_done(self):
+        """return True if the job has reached a final status"""
+        return self.status in constants.JOB_FINAL_STATUSES
@@ -12,10 +12,13 @@ from django.utils.translation import ugettext_lazy as _
 
 from ondalear.backend.core.django import fields
 from ondalear.backend.core.django.models import db_table
+from ondalear.backend.core.python.utils import content_hash
 
 from ondalear.backend.docmgmt.models import constants
 from ondalear.backend.docmgmt.models.client import Client
-from ondalear.backend.docmgmt.models import DocumentAssociation
+from ondalear.backend.docmgmt.models import (AuxiliaryDocument,
+                                             DocumentAssociation,
+                                             ReferenceDocument)
 from ondalear.backend.analytics.models.base import app_label, AbstractAnalyticsModel
 
 
@@ -44,6 +47,18 @@ class AbstractResultsModel(AbstractAnalyticsModel):
         return self.name if self.name else super().__str__()
 
 
+ANALYSIS_KEY_MAX_LENGTH = 128
+
+# model input texts saved by reference: (input name, derived document class)
+INPUT_DOCUMENTS = (('text_reference', ReferenceDocument),
+                   ('text_auxiliary', AuxiliaryDocument))
+
+def document_input(document, text):
+    """return the compact input of a document text"""
+    return dict(document_id=document.id,
+                version=document.version,
+                content_hash=content_hash(text or ''))
+
 _analysis_results = 'AnalysisResults'
 _analysis_results_verbose = humanize(underscore(_analysis_results))
 
@@ -52,6 +67,12 @@ class AnalysisResults(AbstractResultsModel):
     """
     documents = fields.foreign_key_field(DocumentAssociation,
                                          on_delete=CASCADE, blank=True, null=True)
+    # hash of model descriptor and model parameters
+    model_key = fields.char_field(blank=True, null=True, db_index=True,
+                                  max_length=ANALYSIS_KEY_MAX_LENGTH)
+    # hash of model key and input texts
+    input_key = fields.char_field(blank=True, null=True, db_index=True,
+                                  max_length=ANALYSIS_KEY_MAX_LENGTH)
 
 
     class Meta(AbstractResultsModel.Meta):
@@ -74,3 +95,47 @@ class AnalysisResults(AbstractResultsModel):
                                        self.documents.to_document.name)
         return super(AnalysisResults, self).save(force_insert, force_update,
                                                  using, update_fields)
+
+    @classmethod
+    def compact_input(cls, model_input, doc_assoc=None):
+        """return the input to be saved
+
+        Texts fetched from a document association are saved by reference,
+        as document id, version, and content hash, while texts passed by
+        value are saved inline.
+        """
+        if not doc_assoc:
+            return dict(model_input)
+        documents = (doc_assoc.from_document, doc_assoc.to_document)
+        compact = dict(resource_id=doc_assoc.id)
+        for (name, _), document in zip(INPUT_DOCUMENTS, documents):
+            compact[name] = document_input(document, model_input[name])
+        return compact
+
+    def hydrated_input(self):
+        """return the input, re-hydrating the texts saved by reference
+
+        Each document reference is extended with the document current text,
+        and whether it has changed since the analysis.
+        """
+        if 'resource_id' not in self.input:
+            return self.input
+        hydrated = dict(self.input)
+        for name, model_class in INPUT_DOCUMENTS:
+            reference = dict(hydrated[name])
+            # pylint: disable=no-member
+            instance = model_class.objects.filter(pk=reference['document_id']).first()
+            text = instance.get_text() if instance else None
+            reference.update(text=text,
+                             content_changed=(text is None or instance.get_text_hash() !=
+                                              reference['content_hash']))
+            hydrated[name] = reference
+        return hydrated
+
+    def is_stale(self):
+        """return True if the associated documents changed after the analysis"""
+        if not self.documents:
+            return False
+        # pylint: disable=no-member
+        documents = (self.documents.from_document, self.documents.to_document)
+        return any(document.update_time > self.creation_time for document in documents)
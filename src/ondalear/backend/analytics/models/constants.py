@@ -0,0 +1,29 @@
+"""
+.. module:: ondalear.backend.analytics.models.constants
+   :synopsis: ondalear backend analytics models constants  module.
+
+The *constants* module contains *analytics* public constants.
+
+"""
+
+JOB_STATUS_PENDING = 'pending'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_COMPLETED = 'completed'
+JOB_STATUS_FAILED = 'failed'
+JOB_STATUSES = (
+    JOB_STATUS_COMPLETED,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_PENDING,
+    JOB_STATUS_RUNNING,
+)
+JOB_STATUS_CHOICES = (
+    (JOB_STATUS_COMPLETED, JOB_STATUS_COMPLETED.title()),
+    (JOB_STATUS_FAILED, JOB_STATUS_FAILED.title()),
+    (JOB_STATUS_PENDING, JOB_STATUS_PENDING.title()),
+    (JOB_STATUS_RUNNING, JOB_STATUS_RUNNING.title()),
+)
+JOB_FINAL_STATUSES = (
+    JOB_STATUS_COMPLETED,
+    JOB_STATUS_FAILED,
+)
+JOB_STATUS_FIELD_MAX_LENGTH = 16
@@ -0,0 +1,93 @@
+"""
+.. module:: ondalear.backend.analytics.signals
+   :synopsis: ondalear backend analytics signals module.
+
+The *signals* module precomputes the analysis of question document
+associations in the background, when enabled in settings.  The analysis is
+submitted as an *AnalysisJob* when an association is saved, and again when
+one of its derived documents is saved, so that a later analysis request
+for the association finds saved results.
+
+"""
+import logging
+
+from django.conf import settings
+from django.db.models import Q, signals
+from django.dispatch import receiver
+
+from ondalear.backend.core.django.utils import current_site
+from ondalear.backend.docmgmt.models import (AuxiliaryDocument,
+                                             DocumentAssociation,
+                                             ReferenceDocument)
+from ondalear.backend.docmgmt.models.constants import DOCUMENT_ASSOCIATION_PURPOSE_QUESTION
+from ondalear.backend.analytics.models import AnalysisJob, constants
+
+_logger = logging.getLogger(__name__)
+
+PRECOMPUTE_NAME = 'precompute:{}'
+
+# pylint: disable=no-member,unused-argument
+
+def precompute_request_context(doc_assoc):
+    """build the precompute request context of a document association"""
+    user = doc_assoc.effective_user
+    processing_instructions = dict(
+        use_cache=True,
+        force_analysis=False,
+        save_results=True,
+        run_async=True,
+        analysis_name=PRECOMPUTE_NAME.format(doc_assoc.id),
+        analysis_description='precomputed analysis')
+    return dict(model_descriptor=settings.ANALYTICS_PRECOMPUTE_MODEL,
+                model_input=dict(resource_id=doc_assoc.id),
+                model_params=settings.ANALYTICS_PRECOMPUTE_PARAMS,
+                processing_instructions=processing_instructions,
+                user=user,
+                client=doc_assoc.client,
+                site=doc_assoc.site or current_site())
+
+
+def precompute(doc_assoc):
+    """submit the precompute analysis of a document association
+
+    A job still pending for the association already covers the change.
+    """
+    name = PRECOMPUTE_NAME.format(doc_assoc.id)
+    if AnalysisJob.objects.filter(client=doc_assoc.client_id, name=name,
+                                  status=constants.JOB_STATUS_PENDING).exists():
+        return None
+
+    # imported here as loading the service loads the analytics libraries
+    from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE  # pylint: disable=import-outside-toplevel
+    job = find(TEXT_ANALYTICS_SERVICE).submit(precompute_request_context(doc_assoc))
+    _logger.info('precompute analysis job %s submitted for DocumentAssociation %s',
+                 job.id, doc_assoc.id)
+    return job
+
+
+def precompute_enabled():
+    """return True if precompute is enabled"""
+    return settings.ANALYTICS_PRECOMPUTE and settings.ANALYTICS_PRECOMPUTE_MODEL
+
+
+@receiver(signals.post_save, sender=DocumentAssociation)
+def precompute_document_association(sender, instance, raw=False, **kwargs):
+    """precompute the analysis of a saved question association"""
+    if raw or not precompute_enabled():
+        return
+    if instance.purpose == DOCUMENT_ASSOCIATION_PURPOSE_QUESTION:
+        precompute(instance)
+
+
+@receiver(signals.post_save, sender=ReferenceDocument)
+@receiver(signals.post_save, sender=AuxiliaryDocument)
+def precompute_derived_document(sender, instance, created=False, raw=False, **kwargs):
+    """precompute the analysis of the question associations of a changed document"""
+    if raw or created or not precompute_enabled():
+        return
+    doc_assocs = DocumentAssociation.objects.filter(
+        Q(from_document=instance.document_id) | Q(to_document=instance.document_id),
+        purpose=DOCUMENT_ASSOCIATION_PURPOSE_QUESTION).select_related(
+            'client', 'effective_user', 'site')
+    for doc_assoc in doc_assocs:
+        precompute(doc_assoc)
@@ -4,12 +4,17 @@
 
 """
 import logging
+from django.conf import settings
 from rest_framework import serializers
 
 from ondalear.backend.docmgmt.models import constants
-from ondalear.backend.analytics.models import AnalysisResults
+from ondalear.backend.analytics.models import AnalysisJob, AnalysisResults
 from ondalear.backend.api.base_serializers import AbstratModelSerializer
 from ondalear.backend.docmgmt.models import DocumentAssociation
+from ondalear.backend.services.chunking import (CHUNK_SIZE,
+                                                WINDOW_PARAMS,
+                                                WINDOW_SIZE,
+                                                WINDOW_STRIDE)
 
 
 _logger = logging.getLogger(__name__)
@@ -56,11 +61,31 @@ class ModelParamsSerializer(serializers.Serializer):
         """Meta class"""
         fields = ('params')
 
+    def validate_params(self, value):    # pylint: disable=no-self-use
+        """
+        Check that the window params are positive integers, windows and
+        chunks being exclusive.
+        """
+        for name in WINDOW_PARAMS:
+            if name in value and (not isinstance(value[name], int) or
+                                  isinstance(value[name], bool) or value[name] < 1):
+                raise serializers.ValidationError('{} must be a positive integer'.format(name))
+        if CHUNK_SIZE in value:
+            if WINDOW_SIZE in value or WINDOW_STRIDE in value:
+                raise serializers.ValidationError('{} excludes {} and {}'.format(
+                    CHUNK_SIZE, WINDOW_SIZE, WINDOW_STRIDE))
+        elif set(WINDOW_PARAMS).intersection(value) and WINDOW_SIZE not in value:
+            raise serializers.ValidationError('{} is required with window params'.format(
+                WINDOW_SIZE))
+        return value
+
 class ProcessingInstructionsSerializer(serializers.Serializer):
     """Processing instructions serializer"""
     use_cache = serializers.BooleanField(default=False)
     force_analysis = serializers.BooleanField(default=False)
     save_results = serializers.BooleanField(default=False)
+    run_async = serializers.BooleanField(default=False)
+    include_timing = serializers.BooleanField(default=False)
     analysis_name = serializers.CharField(max_length=constants.NAME_FIELD_MAX_LENGTH,
                                           min_length=None, allow_blank=False, allow_null=True)
     analysis_description = serializers.CharField(required=False,
@@ -70,7 +95,8 @@ class ProcessingInstructionsSerializer(serializers.Serializer):
 
     class Meta:
         """Meta class"""
-        fields = ('analysis_name', 'force_analysis', 'save_results', 'use_cache')
+        fields = ('analysis_name', 'force_analysis', 'include_timing', 'run_async',
+                  'save_results', 'use_cache')
 
     def validate(self, attrs):
         """
@@ -93,6 +119,109 @@ class NLPAnalysisSerializer(serializers.Serializer):
         """Meta class"""
         model = DocumentAssociation
 
+class BatchItemSerializer(ModelInputSerializer):
+    """Batch analysis item serializer
+
+    The item level model descriptor overrides the batch level one.
+    """
+    model_descriptor = ModelDescriptorSerializer(required=False)
+
+    class Meta:
+        """Meta class"""
+        fields = ModelInputSerializer.Meta.fields + ('model_descriptor',)
+
+    def validate(self, attrs):
+        """
+        Check that instance is properly configured.
+        """
+        model_descriptor = attrs.pop('model_descriptor', None)
+        attrs = super(BatchItemSerializer, self).validate(attrs)
+        if model_descriptor:
+            attrs['model_descriptor'] = model_descriptor
+        return attrs
+
+class NLPBatchAnalysisSerializer(serializers.Serializer):
+    """NLP batch analysis serializer class"""
+    model_descriptor = ModelDescriptorSerializer(required=True)
+    items = BatchItemSerializer(many=True, allow_empty=False)
+    model_params = ModelParamsSerializer(required=False)
+
+    class Meta:
+        """Meta class"""
+        model = DocumentAssociation
+
+    def validate_items(self, value):    # pylint: disable=no-self-use
+        """
+        Check that the batch size is within limits.
+        """
+        if len(value) > settings.ANALYTICS_BATCH_MAX_ITEMS:
+            raise serializers.ValidationError(
+                'batch is limited to {} items'.format(settings.ANALYTICS_BATCH_MAX_ITEMS))
+        return value
+
+class ReferenceInputSerializer(serializers.Serializer):
+    """Reference input serializer"""
+    text_reference = serializers.CharField(required=False)
+    reference_id = serializers.IntegerField(min_value=1, required=False)
+
+    class Meta:
+        """Meta class"""
+        fields = ('text_reference', 'reference_id')
+
+    def validate(self, attrs):
+        """
+        Check that instance is properly configured.
+        """
+        if len(attrs) != 1:
+            raise serializers.ValidationError(
+                'text_reference or reference_id must be defined')
+        return attrs
+
+class QuestionInputSerializer(serializers.Serializer):
+    """Question input serializer"""
+    text_auxiliary = serializers.CharField(required=False)
+    auxiliary_id = serializers.IntegerField(min_value=1, required=False)
+
+    class Meta:
+        """Meta class"""
+        fields = ('text_auxiliary', 'auxiliary_id')
+
+    def validate(self, attrs):
+        """
+        Check that instance is properly configured.
+        """
+        if len(attrs) != 1:
+            raise serializers.ValidationError(
+                'text_auxiliary or auxiliary_id must be defined')
+        return attrs
+
+class NLPQuestionsAnalysisSerializer(serializers.Serializer):
+    """NLP questions analysis serializer class
+
+    Questions asked against a single reference.
+    """
+    model_descriptor = ModelDescriptorSerializer(required=True)
+    reference = ReferenceInputSerializer(required=True)
+    questions = QuestionInputSerializer(many=True, allow_empty=False)
+    model_params = ModelParamsSerializer(required=False)
+
+    class Meta:
+        """Meta class"""
+        model = DocumentAssociation
+
+    def validate_questions(self, value):    # pylint: disable=no-self-use
+        """
+        Check that the number of questions is within limits.
+        """
+        if len(value) > settings.ANALYTICS_BATCH_MAX_ITEMS:
+            raise serializers.ValidationError(
+                'questions are limited to {}'.format(settings.ANALYTICS_BATCH_MAX_ITEMS))
+        return value
+
+# query parameter requesting the input texts saved by reference
+INCLUDE_TEXT_PARAM = 'include_text'
+TRUE_VALUES = ('true', '1', 'yes')
+
 analysis_results_fields = (
     'client', 'description', 'documents', 'input', 'name', 'output')
 
@@ -108,3 +237,31 @@ class AnalysisResultsSerializer(AbstratModelSerializer):
         model = AnalysisResults
         fields = AbstratModelSerializer.Meta.fields + analysis_results_fields
         read_only_fields = AbstratModelSerializer.Meta.fields + ('client', 'input', 'output')
+
+    def to_representation(self, instance):
+        """
+        Re-hydrate the input texts saved by reference if requested.
+        """
+        data = super(AnalysisResultsSerializer, self).to_representation(instance)
+        request = self.context.get('request')
+        if request and request.query_params.get(INCLUDE_TEXT_PARAM, '').lower() in TRUE_VALUES:
+            data['input'] = instance.hydrated_input()
+        return data
+
+analysis_job_fields = (
+    'client', 'name', 'status', 'request', 'model_output', 'error',
+    'analysis_results_id', 'start_time', 'end_time')
+
+
+class AnalysisJobSerializer(AbstratModelSerializer):
+    """Analysis job serializer class.
+    """
+    request = serializers.JSONField(read_only=True)
+    model_output = serializers.JSONField(source='output', read_only=True)
+    analysis_results_id = serializers.IntegerField(source='results_id', read_only=True)
+
+    class Meta(AbstratModelSerializer.Meta):
+        """Meta class"""
+        model = AnalysisJob
+        fields = AbstratModelSerializer.Meta.fields + analysis_job_fields
+        read_only_fields = AbstratModelSerializer.Meta.fields + analysis_job_fields
@@ -16,5 +16,12 @@ router.register(r'analysis-results/crud',
 
 urlpatterns = [
     url(r'analyze/$', views.NLPAnalysisView.as_view(), name='analyze'),
+    url(r'analyze/batch/$', views.NLPBatchAnalysisView.as_view(), name='analyze-batch'),
+    url(r'analyze/questions/$', views.NLPQuestionsAnalysisView.as_view(),
+        name='analyze-questions'),
+    url(r'analyze/jobs/(?P<pk>[0-9]+)/$', views.NLPAnalysisJobView.as_view(),
+        name='analyze-job'),
+    url(r'analyze/metrics/$', views.NLPAnalysisMetricsView.as_view(), name='analyze-metrics'),
+    url(r'analyze/ready/$', views.NLPAnalysisReadinessView.as_view(), name='analyze-ready'),
     path('', include(router.urls)),
 ]
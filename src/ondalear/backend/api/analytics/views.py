@@ -4,15 +4,20 @@
 
 """
 import logging
+from contextlib import contextmanager
 
 import rest_framework_filters as filters
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework.exceptions import NotFound, Throttled
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import permissions, status
 from rest_framework.generics import GenericAPIView
 
 from ondalear.backend.core.django.utils import current_site
-from ondalear.backend.analytics.models import AnalysisResults
+from ondalear.backend.analytics.models import AnalysisJob, AnalysisResults
 from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE
+from ondalear.backend.services.admission import AdmissionException
+from ondalear.backend.services.metrics import StageTimings
 from ondalear.backend.api import constants
 from ondalear.backend.api.base_queries import AbstractQueryMixin
 from ondalear.backend.api.docmgmt.views.queries import DocumentAssociationQueryMixin
@@ -20,13 +25,29 @@ from ondalear.backend.api.base_views import (response_header,
                                              AbstractModelViewSet,
                                              DRFMixin,
                                              PermissionsMixin)
-from ondalear.backend.api.analytics.serializers import (AnalysisResultsSerializer,
-                                                        NLPAnalysisSerializer)
+from ondalear.backend.api.analytics.serializers import (AnalysisJobSerializer,
+                                                        AnalysisResultsSerializer,
+                                                        NLPAnalysisSerializer,
+                                                        NLPBatchAnalysisSerializer,
+                                                        NLPQuestionsAnalysisSerializer)
 
 _logger = logging.getLogger(__name__)
 
 # pylint: disable=too-many-ancestors,no-self-use
 
+@contextmanager
+def admission(service, client):
+    """run a synchronous analysis within the service admission limits
+
+    A rejected request raises Throttled, returning a 429 status with a
+    Retry-After header.
+    """
+    try:
+        with service.admission.admit(client.id):
+            yield
+    except AdmissionException as ex:
+        raise Throttled(wait=ex.retry_after)
+
 class NLPAnalysisView(PermissionsMixin, DRFMixin,
                       DocumentAssociationQueryMixin, GenericAPIView):
     """ NLP Analysis view class
@@ -41,6 +62,8 @@ class NLPAnalysisView(PermissionsMixin, DRFMixin,
                                  username=self.request.user.username,
                                  api_status=api_status)
 
+        # results may be shared with the cache
+        results = dict(results)
         results['analysis_results_id'] = saved_results.id if saved_results else None
         data = {
             'header': header,
@@ -48,6 +71,19 @@ class NLPAnalysisView(PermissionsMixin, DRFMixin,
         }
         return data
 
+    def _build_job_response_data(self, job, msg=None, api_status=None):
+        """build asynchronous request response data"""
+        msg = msg or 'Analysis request accepted.'
+        api_status = api_status or constants.STATUS_OK
+        header = response_header(msg=msg,
+                                 username=self.request.user.username,
+                                 api_status=api_status)
+        data = {
+            'header': header,
+            'detail': dict(job_id=job.id, status=job.status)
+        }
+        return data
+
     def post(self, request, *args, **kwargs): # pylint: disable=unused-argument
         """Handle analysis post request"""
         # If  a valid token has been defined, the user will be authenticated
@@ -76,17 +112,168 @@ class NLPAnalysisView(PermissionsMixin, DRFMixin,
                                                      default_processing_instructions),
             user=self.request.user,
             client=self.request.client,
-            site=current_site()
+            site=current_site(),
+            timings=StageTimings()
         )
         service = find(TEXT_ANALYTICS_SERVICE)
-        results, saved_results = service.analyze(request_context)
+
+        if request_context['processing_instructions'].get('run_async'):
+            # return the job id immediately, results are fetched by polling
+            job = service.submit(request_context)
+            return Response(data=self._build_job_response_data(job),
+                            status=status.HTTP_202_ACCEPTED)
+
+        with admission(service, self.request.client):
+            results, saved_results = service.analyze(request_context)
 
         # save the results if required and user is allowed to save the results
-        response = Response(data=self._build_response_data(results, saved_results),
-                            status=status.HTTP_200_OK)
+        data = self._build_response_data(results, saved_results)
+        if request_context['processing_instructions'].get('include_timing'):
+            data['header']['timing'] = request_context['timings'].as_dict()
+        response = Response(data=data, status=status.HTTP_200_OK)
 
         return response
 
+class NLPBatchAnalysisView(NLPAnalysisView):
+    """ NLP batch analysis view class
+
+    Analyzes a list of items, each defined by a resource id or by value,
+    returning one result per item in request order.
+    """
+    serializer_class = NLPBatchAnalysisSerializer
+
+    def _build_batch_response_data(self, results, msg=None, api_status=None):
+        """build batch response data"""
+        msg = msg or 'Batch analysis request successfully processed.'
+        api_status = api_status or constants.STATUS_OK
+        header = response_header(msg=msg,
+                                 username=self.request.user.username,
+                                 api_status=api_status)
+        for result in results:
+            result['api_status'] = (constants.STATUS_ERROR if result['error']
+                                    else constants.STATUS_OK)
+        data = {
+            'header': header,
+            'detail': results
+        }
+        return data
+
+    def analyze(self, request_data):
+        """Handle batch analysis"""
+        request_context = dict(
+            model_descriptor=request_data['model_descriptor'],
+            items=request_data['items'],
+            model_params=request_data.get('model_params', dict()),
+            user=self.request.user,
+            client=self.request.client,
+            site=current_site()
+        )
+        service = find(TEXT_ANALYTICS_SERVICE)
+        with admission(service, self.request.client):
+            results = service.analyze_batch(request_context)
+
+        return Response(data=self._build_batch_response_data(results),
+                        status=status.HTTP_200_OK)
+
+class NLPQuestionsAnalysisView(NLPBatchAnalysisView):
+    """ NLP questions analysis view class
+
+    Analyzes a list of questions asked against a single reference,
+    returning one result per question in request order.  The reference is
+    read once; its converted passage is only reused by models converting a
+    passage on their own, which the AllenNLP models do not.
+    """
+    serializer_class = NLPQuestionsAnalysisSerializer
+
+    def analyze(self, request_data):
+        """Handle questions analysis"""
+        request_context = dict(
+            model_descriptor=request_data['model_descriptor'],
+            reference=request_data['reference'],
+            questions=request_data['questions'],
+            model_params=request_data.get('model_params', dict()),
+            user=self.request.user,
+            client=self.request.client,
+            site=current_site()
+        )
+        service = find(TEXT_ANALYTICS_SERVICE)
+        try:
+            with admission(service, self.request.client):
+                results = service.analyze_questions(request_context)
+        except ObjectDoesNotExist:
+            raise NotFound('ReferenceDocument resource {} not found'.format(
+                request_data['reference'].get('reference_id')))
+
+        return Response(
+            data=self._build_batch_response_data(
+                results, msg='Questions analysis request successfully processed.'),
+            status=status.HTTP_200_OK)
+
+class AnalysisJobQueryMixin(AbstractQueryMixin):
+    """Analysis job query mixin class"""
+
+class NLPAnalysisJobView(PermissionsMixin, DRFMixin,
+                         AnalysisJobQueryMixin, GenericAPIView):
+    """ NLP Analysis job view class
+
+    Returns the status of an asynchronous analysis request, and its
+    results once completed.
+    """
+    queryset = AnalysisJob.objects.all()
+    serializer_class = AnalysisJobSerializer
+
+    def get(self, request, *args, **kwargs): # pylint: disable=unused-argument
+        """Handle analysis job status request"""
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        data = {
+            'header': response_header(msg='Analysis job request successfully processed.',
+                                      username=request.user.username,
+                                      api_status=constants.STATUS_OK),
+            'detail': serializer.data
+        }
+        return Response(data=data, status=status.HTTP_200_OK)
+
+class NLPAnalysisReadinessView(DRFMixin, GenericAPIView):
+    """ NLP Analysis readiness view class
+
+    Reports whether the text analytics service models have been loaded,
+    allowing traffic to be held back until the warm up completes.
+    """
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, *args, **kwargs): # pylint: disable=unused-argument
+        """Handle analysis readiness request"""
+        ready = find(TEXT_ANALYTICS_SERVICE).is_ready()
+        msg = 'Analysis service is ready.' if ready else 'Analysis service is warming up.'
+        data = {
+            'header': response_header(msg=msg,
+                                      username=request.user.username,
+                                      api_status=(constants.STATUS_OK if ready
+                                                  else constants.STATUS_ERROR)),
+            'detail': dict(ready=ready)
+        }
+        return Response(data=data, status=(status.HTTP_200_OK if ready
+                                           else status.HTTP_503_SERVICE_UNAVAILABLE))
+
+class NLPAnalysisMetricsView(DRFMixin, GenericAPIView):
+    """ NLP Analysis metrics view class
+
+    Returns the text analytics service statistics, including the per model
+    and stage latency histograms, for scraping by monitoring tools.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs): # pylint: disable=unused-argument
+        """Handle analysis metrics request"""
+        data = {
+            'header': response_header(msg='Analysis metrics request successfully processed.',
+                                      username=request.user.username,
+                                      api_status=constants.STATUS_OK),
+            'detail': find(TEXT_ANALYTICS_SERVICE).stats()
+        }
+        return Response(data=data, status=status.HTTP_200_OK)
+
 class AnalysisResultsFilter(filters.FilterSet):
     """AnalysisResults filter class"""
     class Meta:
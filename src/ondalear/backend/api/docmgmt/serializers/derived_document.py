@@ -9,7 +9,8 @@ from django.http import QueryDict
 from rest_framework.utils import json
 from rest_framework.serializers import (FileField,
                                         ModelSerializer,
-                                        SerializerMethodField)
+                                        SerializerMethodField,
+                                        ValidationError)
 
 from ondalear.backend.docmgmt.models import (constants,
                                              AuxiliaryDocument,
@@ -23,6 +24,26 @@ _logger = logging.getLogger(__name__)
 
 # pylint: disable=too-many-ancestors
 
+# query parameter requesting the uploaded file contents, otherwise fetched
+# using the download endpoint
+INCLUDE_FILE_CONTENTS_PARAM = 'include_file_contents'
+TRUE_VALUES = ('true', '1', 'yes')
+# query parameters limiting the file contents to character offsets
+FILE_CONTENTS_START_PARAM = 'file_contents_start'
+FILE_CONTENTS_END_PARAM = 'file_contents_end'
+
+def offset_param(request, name):
+    """return the character offset query parameter, if set"""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        offset = int(value)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise ValidationError({name: ['A non negative integer is required.']})
+    return offset
 
 class AbstractDerivedDocumentModelSerializer(RequestContextMixin, ModelSerializer):
     """Base document serializer class.
@@ -38,9 +59,15 @@ class AbstractDerivedDocumentModelSerializer(RequestContextMixin, ModelSerialize
         """Meta class"""
         fields = ('content', 'document', 'dir_path', 'upload', 'file_contents')
 
-    def get_file_contents(self, instance):  # pylint: disable=no-self-use
-        """get file contents if file has been uploaded"""
-        return instance.get_file_contents()
+    def get_file_contents(self, instance):
+        """get file contents if file has been uploaded and contents requested"""
+        request = self.context.get('request')
+        if (request and
+                request.query_params.get(INCLUDE_FILE_CONTENTS_PARAM, '').lower() in TRUE_VALUES):
+            start = offset_param(request, FILE_CONTENTS_START_PARAM) or 0
+            end = offset_param(request, FILE_CONTENTS_END_PARAM)
+            return instance.get_file_contents(start, end)
+        return None
 
     def _document_type(self):
         """get document type"""
@@ -58,10 +85,13 @@ class AbstractDerivedDocumentModelSerializer(RequestContextMixin, ModelSerialize
         # need to massage the request data to pass validation
         # the request data is flat, while we have a nested document model
         doc_fields = DocumentSerializer.field_names()
-        initial_data = self.initial_data.copy()
+        initial_data = self.initial_data
         if isinstance(initial_data, (QueryDict,)):
             # @TODO: this is required for multi part request - cannot handle QueryDict
+            # not copying the QueryDict, which deep copies streamed uploaded files
             initial_data = initial_data.dict()
+        else:
+            initial_data = initial_data.copy()
 
         document_data = initial_data.pop('document', None)
         if document_data and isinstance(document_data, (str,)):
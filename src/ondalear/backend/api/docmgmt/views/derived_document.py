@@ -5,11 +5,19 @@
 """
 import logging
 
+from django.conf import settings
+from rest_framework.decorators import action
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import NotFound, ParseError
 from rest_framework.parsers import FileUploadParser, JSONParser, MultiPartParser
-from rest_framework.mixins import UpdateModelMixin
 
-from ondalear.backend.core.python.utils import file_exists, remove
-from ondalear.backend.docmgmt.models import (AuxiliaryDocument,
+from ondalear.backend.core.django.download import (content_disposition,
+                                                   file_response,
+                                                   sendfile_response)
+from ondalear.backend.core.django.uploads import HashingFileUploadHandler
+from ondalear.backend.core.python.utils import file_exists
+from ondalear.backend.docmgmt.models import (constants,
+                                             AuxiliaryDocument,
                                              ReferenceDocument)
 from ondalear.backend.api.base_views import AbstractModelViewSet
 from ondalear.backend.api.docmgmt.serializers import (AuxiliaryDocumentSerializer,
@@ -21,39 +29,54 @@ _logger = logging.getLogger(__name__)
 # pylint: disable=too-many-ancestors,attribute-defined-outside-init,no-member
 
 
+class DocumentFileUploadParser(FileUploadParser):
+    """Document file upload parser, reporting upload handler errors as parse errors"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """parse the raw file upload"""
+        try:
+            return super(DocumentFileUploadParser, self).parse(stream, media_type, parser_context)
+        except MultiPartParserError as ex:
+            raise ParseError(f'FileUpload parse error - {ex}')
+
+
 class DerivedDocumentViewSet(AbstractModelViewSet):
     """Derived document view set"""
-    parser_classes = (JSONParser, MultiPartParser, FileUploadParser)
+    parser_classes = (JSONParser, MultiPartParser, DocumentFileUploadParser)
+
+    def initialize_request(self, request, *args, **kwargs):
+        """stream uploaded files to disk, hashing them and enforcing the size limit"""
+        request.upload_handlers = [
+            HashingFileUploadHandler(request, max_size=constants.UPLOAD_FIELD_MAX_FILE_SIZE)]
+        return super(DerivedDocumentViewSet, self).initialize_request(request, *args, **kwargs)
 
     def perform_destroy(self, instance):
         """actual instance destroy"""
         # delete the underlying document triggering deletion of derived instance
         return instance.document.delete()
 
-    def prepare_update(self, request, *args, **kwargs):
-        """prepare update hook for subclassing"""
-        serializer, instance = super(DerivedDocumentViewSet, self).prepare_update(
-            request, *args, **kwargs)
-        if instance.upload:
-            self.before_save_instance = instance
-            self.before_save_path = instance.upload.path
-            self.before_save_content = instance.content
-        return serializer, instance
-
-    def perform_update(self, serializer):
-        """perform update """
-        UpdateModelMixin.perform_update(self, serializer)
-
-        # need to remove files if no longer needed
-        if hasattr(self, 'before_save_instance'):
-            instance = self.before_save_instance
-            saved_path = self.before_save_path
-
-            if instance.upload.path != saved_path or instance.content:
-                # uploaded file name has changed, or content
-                # was defined - need to remove old file if it exists
-                if file_exists(saved_path):
-                    remove(saved_path)
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        """Download the uploaded file.
+
+        Called on GET request for specific instance, the file is streamed, or the
+        single byte range requested, unless handed over to the front web server
+        """
+        instance = self.get_object()
+        if not instance.upload or not file_exists(instance.upload.path):
+            raise NotFound(detail='No uploaded file')
+
+        content_type = instance.document.mime_type
+        sendfile = settings.DOCUMENT_DOWNLOAD_SENDFILE
+        if sendfile:
+            response = sendfile_response(instance.upload.path, instance.upload.name,
+                                         content_type, sendfile,
+                                         settings.DOCUMENT_DOWNLOAD_ACCEL_PREFIX)
+        else:
+            response = file_response(request, instance.upload.path, content_type,
+                                     settings.DOCUMENT_DOWNLOAD_CHUNK_SIZE)
+        response['Content-Disposition'] = content_disposition(instance.document.name)
+        return response
 
 class AuxiliaryDocumentViewSet(AuxiliaryDocumentQueryMixin,
                                DerivedDocumentViewSet):
@@ -98,7 +98,7 @@ class DerivedDocumentQueryMixin(AbstractQueryMixin):
         model_class, user, client, request = self.prepare()
         # drf checks for model permissions, at which point client has not beed defined yet
         if not client:
-            return model_class.objects.all()
+            return model_class.objects.defer('text')
         tags = request.query_params.get('document__tags__in')
         if tags:
             # @TODO: have not been able to implement with filter set
@@ -122,10 +122,11 @@ class DerivedDocumentQueryMixin(AbstractQueryMixin):
             q = q_effective & q_client &  q_doc
         # fetching document as part of the same query
         # fetching associated tags for all documents as a separate query
+        # the stored text, possibly several MB, is only loaded when read
         # @TODO: limit the fields returned
         qs = model_class.objects.prefetch_related(
             'document__annotations', 'document__documents', 'document__tags').select_related(
-                'document').filter(q).order_by('-document__update_time')
+                'document').defer('text').filter(q).order_by('-document__update_time')
         return qs
 
 class AuxiliaryDocumentQueryMixin(DerivedDocumentQueryMixin):
@@ -182,4 +182,87 @@ REST_SESSION_LOGIN = False
 POST_PUT_REQUEST_SHORT_RESPONSE = True
 TOKEN_EXPIRY = 12 # hours for token expiry
 
+# temporary directory for streamed document uploads, on the MEDIA_ROOT file
+# system so that they are moved in place with a rename; None for
+# MEDIA_ROOT/.uploads
+DOCUMENT_UPLOAD_TEMP_DIR = None
+
+# uploaded document downloads
+#   DOCUMENT_DOWNLOAD_SENDFILE: None to stream the file from the application,
+#       'X-Sendfile' (apache, lighttpd) or 'X-Accel-Redirect' (nginx) to have
+#       the front web server send it
+#   DOCUMENT_DOWNLOAD_ACCEL_PREFIX: nginx internal location mapped to MEDIA_ROOT
+DOCUMENT_DOWNLOAD_SENDFILE = None
+DOCUMENT_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+DOCUMENT_DOWNLOAD_CHUNK_SIZE = 64 * 1024 # bytes
+
 SITE_ID = 1
+
+# number of local worker threads processing asynchronous analysis jobs
+ANALYTICS_JOB_WORKERS = 2
+
+# maximum number of items in a batch analysis request
+ANALYTICS_BATCH_MAX_ITEMS = 512
+
+# analysis results cache backend
+#   LocalCacheBackend: per process cache, optional 'max_bytes' (0 to bound the
+#       number of entries instead), shared by 'stripes' lock stripes,
+#       'compress_threshold' options
+#   SharedCacheBackend: node level cache shared by all worker processes,
+#       optional 'path', 'front_time_to_live', 'front_max_size', 'evict_interval'
+#       options
+ANALYTICS_CACHE = {
+    'BACKEND': 'ondalear.backend.services.cache.LocalCacheBackend',
+    'OPTIONS': {}
+}
+
+# snapshot the most recently used local analysis cache entries to the cache
+# directory, periodically (seconds, 0 to disable) and at exit, restoring them
+# when a process starts
+ANALYTICS_CACHE_SNAPSHOT = False
+ANALYTICS_CACHE_SNAPSHOT_INTERVAL = 300
+ANALYTICS_CACHE_SNAPSHOT_MAX_ENTRIES = 1024
+
+# warm up the text analytics service when a web process starts
+ANALYTICS_WARM_UP = False
+
+# models loaded during warm up, i.e.
+#   [{'model_family': 'allennlp', 'model_name': 'bidaf'}]
+ANALYTICS_PRELOAD_MODELS = []
+
+# approximate memory budget in bytes for the loaded models, 0 for no limit;
+# least recently used models are evicted once exceeded
+ANALYTICS_MODEL_MEMORY_BUDGET = 0
+
+# model inference executor
+#   local: analysis runs on the request thread
+#   process: analysis runs on a pool of worker processes
+ANALYTICS_INFERENCE_EXECUTOR = 'local'
+ANALYTICS_INFERENCE_WORKERS = 2
+ANALYTICS_INFERENCE_TIMEOUT = 120 # seconds
+
+# seconds after which the recover_analysis_jobs command considers a running
+# analysis job interrupted; must exceed the longest analysis
+ANALYTICS_JOB_STALE_AFTER = ANALYTICS_INFERENCE_TIMEOUT + 60
+
+# seconds to wait for a concurrent identical analysis before running it
+ANALYTICS_COALESCING_TIMEOUT = 60
+
+# precompute the analysis of question document associations in the
+# background when they, or their documents, are saved
+#   ANALYTICS_PRECOMPUTE_MODEL: model descriptor, i.e.
+#       {'model_family': 'allennlp', 'model_name': 'bidaf'}
+ANALYTICS_PRECOMPUTE = False
+ANALYTICS_PRECOMPUTE_MODEL = None
+ANALYTICS_PRECOMPUTE_PARAMS = {}
+
+# register the deterministic stub model family, used for tests and benchmarks
+ANALYTICS_STUB_MODELS = False
+
+# synchronous analysis admission control, 0 to disable a limit;
+# requests over the global limit wait in the queue, up to the queue timeout
+# in seconds, other requests over the limits are rejected with a 429 status
+ANALYTICS_ADMISSION_MAX_IN_FLIGHT = 8
+ANALYTICS_ADMISSION_MAX_CLIENT_IN_FLIGHT = 4
+ANALYTICS_ADMISSION_MAX_QUEUE = 16
+ANALYTICS_ADMISSION_QUEUE_TIMEOUT = 10
@@ -21,6 +21,8 @@ CONFIG_DIR = path.dirname(path.realpath(__file__))
 PROJECT_ROOT = path.abspath(path.join(CONFIG_DIR, '../..'))
 DB_DIR = path.join(PROJECT_ROOT, 'databases')
 LOG_DIR = path.join(PROJECT_ROOT, 'logs')
+CACHE_DIR = path.join(PROJECT_ROOT, 'cache')
+BENCHMARK_DIR = path.join(PROJECT_ROOT, 'benchmarks')
 CURRENT_ENV = os.getenv(ENV_APP, LOCAL_ENV)
 
 _default_debug = True if CURRENT_ENV in (LOCAL_ENV, DEV_ENV) else False  # pylint: disable=simplifiable-if-expression
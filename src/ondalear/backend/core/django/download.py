@@ -0,0 +1,148 @@
+"""
+.. module::  ondalear.backend.core.django.download
+   :synopsis:  Django file download module.
+
+File download responses.  A file is streamed in chunks, or a single byte
+range of it if requested with a Range header, or handed over to the front
+web server with an X-Sendfile or X-Accel-Redirect header.
+"""
+import os
+import re
+import logging
+from urllib.parse import quote
+
+from django.http import (FileResponse, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils.http import http_date
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+# only a single byte range is supported, other requests get the whole file
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Range not satisfiable exception class"""
+
+
+def parse_range(header, size):
+    """Return the (start, end) inclusive byte range requested, or None for the whole file.
+
+    Args:
+        header (str): Range header value
+        size (int): file size
+
+    Returns:
+        tuple
+
+    Raises:
+        RangeNotSatisfiable: if the range starts beyond the end of file
+    """
+    match = RANGE_PATTERN.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not size:
+        raise RangeNotSatisfiable(header)
+    if not start:
+        # suffix range, the last bytes of the file
+        length = int(end)
+        if not length:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        if start < size:
+            # invalid range, ignored
+            return None
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def file_chunks(path, start, length, chunk_size):
+    """Yield length bytes of the file from start, in chunks"""
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        while length > 0:
+            data = input_file.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def content_disposition(file_name):
+    """Return the attachment content disposition header value"""
+    try:
+        file_name.encode('ascii')
+        return 'attachment; filename="{}"'.format(file_name.replace('"', ''))
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''{}".format(quote(file_name))
+
+
+def sendfile_response(path, name, content_type, header, prefix):
+    """Return a response handing the file over to the front web server.
+
+    Args:
+        path (str): absolute file path, sent with X-Sendfile
+        name (str): file path relative to the media root, sent with X-Accel-Redirect
+        content_type (str): file content type
+        header (str): X-Sendfile or X-Accel-Redirect
+        prefix (str): internal location prefix for X-Accel-Redirect
+
+    Returns:
+        HttpResponse
+    """
+    response = HttpResponse(content_type=content_type)
+    if header == 'X-Accel-Redirect':
+        response[header] = quote(prefix.rstrip('/') + '/' + name.lstrip('/'))
+    else:
+        response[header] = path
+    return response
+
+
+def file_response(request, path, content_type=None, chunk_size=64 * 1024):
+    """Return a response streaming the file, or the byte range requested.
+
+    Args:
+        request (HttpRequest): request
+        path (str): file path
+        content_type (str): file content type
+        chunk_size (int): streamed chunk size in bytes
+
+    Returns:
+        HttpResponse
+    """
+    content_type = content_type or DEFAULT_CONTENT_TYPE
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = http_date(stat.st_mtime)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == last_modified:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(file_chunks(path, start, length, chunk_size),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = chunk_size
+        response['Content-Length'] = str(size)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    return response
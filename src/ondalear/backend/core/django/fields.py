@@ -56,14 +56,17 @@ class MimeTypeConstrainedFileField(ConstrainedFileField):
             file = data.file
             uploaded_content_type = getattr(file, 'content_type', '')
 
-            # magic_file_path used only for Windows.
-            magic_file_path = getattr(settings, "MAGIC_FILE_PATH", None)
-            if magic_file_path and os.name == 'nt':
-                mg = magic.Magic(mime=True, magic_file=magic_file_path)
-            else:
-                mg = magic.Magic(mime=True)
-            content_type_magic = mg.from_buffer(file.read(self.mime_lookup_length))
-            file.seek(0)
+            # streamed uploads are sniffed as the first block is received
+            content_type_magic = getattr(file, 'sniffed_content_type', None)
+            if not content_type_magic:
+                # magic_file_path used only for Windows.
+                magic_file_path = getattr(settings, "MAGIC_FILE_PATH", None)
+                if magic_file_path and os.name == 'nt':
+                    mg = magic.Magic(mime=True, magic_file=magic_file_path)
+                else:
+                    mg = magic.Magic(mime=True)
+                content_type_magic = mg.from_buffer(file.read(self.mime_lookup_length))
+                file.seek(0)
 
             # Prefer mime-type from magic over mime-type from http header
             if uploaded_content_type != content_type_magic:
@@ -5,25 +5,122 @@
 Django storage utilities and classes.
 """
 import os
+import errno
+import hashlib
 import ntpath  #  support non unix file upload
 import logging
+import tempfile
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.files.storage import get_storage_class
 
+from ondalear.backend.core.python.utils import mkdir
+
 _logger = logging.getLogger(__name__)
 
+# file permissions if not set with FILE_UPLOAD_PERMISSIONS
+DEFAULT_FILE_PERMISSIONS = 0o644
+
+# content addressed blob directory within the storage root
+BLOB_DIR = 'blobs'
+
 class OverwriteStorage(get_storage_class()):
     """OverwriteStorage class definition.
 
-    Delete existing file before saving it.
+    Replace an existing file atomically when saving it, so that a concurrent
+    reader sees either the previous or the new file contents.
     """
-    def save(self, name, content, max_length=None):
-        """
-        Save new content to the file specified by name. The content should be
-        a proper File object or any Python file-like object, ready to be read
-        from the beginning.
-        """
-        self.delete(name)
-        return super(OverwriteStorage, self).save(name, content, max_length)
+    def get_available_name(self, name, max_length=None):
+        """Return the name unchanged, the existing file will be replaced"""
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                'Storage can not find an available filename for "%s". '
+                'Please make sure that the corresponding file field '
+                'allows sufficient "max_length".' % name)
+        return name
+
+    def _write_temporary(self, directory, content):
+        """write the content to a temporary file in directory, returning its path"""
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output_file:
+                for chunk in content.chunks():
+                    output_file.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+                output_file.flush()
+                os.fsync(output_file.fileno())
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path
+
+    def _save(self, name, content):
+        """save the content, replacing the file with a single rename"""
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        mkdir(directory)
+
+        temp_path = None
+        if hasattr(content, 'temporary_file_path'):
+            # streamed upload, moved in place if on the same file system
+            try:
+                os.replace(content.temporary_file_path(), full_path)
+            except OSError as ex:
+                if ex.errno != errno.EXDEV:
+                    raise
+                content.seek(0)
+                temp_path = self._write_temporary(directory, content)
+        else:
+            temp_path = self._write_temporary(directory, content)
+
+        if temp_path:
+            try:
+                os.replace(temp_path, full_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+        permissions = self.file_permissions_mode
+        os.chmod(full_path, DEFAULT_FILE_PERMISSIONS if permissions is None else permissions)
+        return name.replace('\\', '/')
+
+class BlobStorage(OverwriteStorage):
+    """BlobStorage class definition.
+
+    Files are named after their content hash, an existing blob is kept
+    rather than written again.
+    """
+    def _save(self, name, content):
+        """save the content unless the blob exists"""
+        if self.exists(name):
+            return name.replace('\\', '/')
+        return super(BlobStorage, self)._save(name, content)
+
+def file_content_hash(content):
+    """Return the sha256 hex digest of a file, computed once.
+
+    Streamed uploads are hashed as they are received.
+    """
+    content_hash = getattr(content, 'content_hash', None)
+    if not content_hash:
+        hasher = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+        content.seek(0)
+        content_hash = hasher.hexdigest()
+        content.content_hash = content_hash
+    return content_hash
+
+def blob_name(content_hash):
+    """Return the blob storage name of a content hash"""
+    return '/'.join((BLOB_DIR, content_hash[:2], content_hash[2:4], content_hash))
+
+def is_blob_name(name):
+    """Return True if the storage name designates a blob"""
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+def blob_path(instance, filename):  # pylint: disable=unused-argument
+    """Upload file to the blob named after its content hash"""
+    return blob_name(file_content_hash(instance.upload.file))
 
 def client_directory_path(instance, filename):
     """Upload file to client directory"""
@@ -43,3 +140,4 @@ def client_directory_path(instance, filename):
     return file_path
 
 overwrite_storage = OverwriteStorage()
+blob_storage = BlobStorage()
@@ -0,0 +1,124 @@
+"""
+.. module::  ondalear.backend.core.django.uploads
+   :synopsis:  Django file upload module.
+
+Streaming file upload handler.  The request body is written in chunks to a
+temporary file next to the storage location, so that it may be moved in
+place with a single rename, while its content hash and size are computed.
+The mime type is sniffed from the first block only, and the maximum size is
+enforced as the data comes in.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+
+import magic
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.http.multipartparser import MultiPartParserError
+from django.template.defaultfilters import filesizeformat
+
+from ondalear.backend.core.python.utils import mkdir
+
+_logger = logging.getLogger(__name__)
+
+# temporary upload directory name within the media root
+UPLOAD_TEMP_DIR_NAME = '.uploads'
+
+# number of leading bytes used to sniff the mime type
+MIME_LOOKUP_LENGTH = 4096
+
+
+def upload_temp_dir():
+    """Return the temporary upload directory, on the media root file system by default"""
+    return (getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', None) or
+            os.path.join(settings.MEDIA_ROOT, UPLOAD_TEMP_DIR_NAME))
+
+
+class UploadSizeExceeded(MultiPartParserError):
+    """Upload size exceeded exception class"""
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    """Uploaded file streamed to a temporary file, with its content hash and sniffed mime type"""
+
+    def __init__(self, name, content_type, size, charset,     # pylint: disable=too-many-arguments
+                 content_type_extra=None, temp_dir=None):
+        temp_dir = temp_dir or upload_temp_dir()
+        mkdir(temp_dir)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=temp_dir)
+        # pylint: disable=non-parent-init-called,super-init-not-called
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.content_hash = None
+        self.sniffed_content_type = None
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """Streaming file upload handler class
+
+    A max_size of 0 disables the size limit.
+    """
+
+    def __init__(self, request=None, max_size=0, temp_dir=None,
+                 mime_lookup_length=MIME_LOOKUP_LENGTH):
+        super(HashingFileUploadHandler, self).__init__(request)
+        self.max_size = max_size
+        self.temp_dir = temp_dir
+        self.mime_lookup_length = mime_lookup_length
+        self.file = None
+        self.hasher = None
+        self.head = None
+
+    def _check_size(self, size):
+        """raise UploadSizeExceeded if size exceeds the limit"""
+        if self.max_size and size > self.max_size:
+            if self.file is not None:
+                # removes the temporary file
+                self.file.close()
+            raise UploadSizeExceeded(
+                'File size exceeds limit: {}. Limit is {}.'.format(
+                    filesizeformat(size), filesizeformat(self.max_size)))
+
+    def _sniff(self):
+        """sniff the mime type from the leading bytes"""
+        try:
+            self.file.sniffed_content_type = magic.from_buffer(self.head, mime=True)
+        except Exception:                       # pylint: disable=broad-except
+            _logger.exception('failed to sniff mime type for %s', self.file_name)
+        self.head = None
+
+    def new_file(self, *args, **kwargs):
+        """start a new file, refusing it if its announced length is too large"""
+        super(HashingFileUploadHandler, self).new_file(*args, **kwargs)
+        self.file = None
+        if self.content_length:
+            self._check_size(self.content_length)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                       self.content_type_extra, self.temp_dir)
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        """write the chunk, updating the hash"""
+        self._check_size(start + len(raw_data))
+        if self.head is not None:
+            self.head += raw_data[:self.mime_lookup_length - len(self.head)]
+            if len(self.head) >= self.mime_lookup_length:
+                self._sniff()
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        """return the uploaded file, flushed to disk"""
+        if self.head is not None:
+            self._sniff()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hasher.hexdigest()
+        return self.file
@@ -0,0 +1,146 @@
+"""
+.. module::  ondalear.backend.core.python.text_reader
+   :synopsis: memory mapped text file reader module.
+
+The *text_reader* module reads text files through a memory map, decoding
+them with the encoding given by their byte order mark, utf-8 if valid, or
+otherwise the encoding detected by *chardet*.  The text may be read whole,
+or as a slice by byte or character offsets, a character slice decoding only
+the chunks required.
+
+"""
+import codecs
+import logging
+import mmap
+
+_logger = logging.getLogger(__name__)
+
+# byte order marks, utf-32 before utf-16 sharing its little endian prefix
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# number of leading bytes used to detect the encoding
+DETECT_SAMPLE_SIZE = 64 * 1024
+
+# number of bytes decoded at once
+CHUNK_SIZE = 64 * 1024
+
+# decodes any byte sequence
+FALLBACK_ENCODING = 'latin-1'
+
+
+def detect_encoding(sample):
+    """Return the encoding and byte order mark length of a text sample.
+
+    Args:
+        sample (bytes): leading bytes of the text
+
+    Returns:
+        tuple
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    try:
+        # the sample may end within a multi byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    import chardet      # pylint: disable=import-outside-toplevel
+    encoding = chardet.detect(sample).get('encoding')
+    try:
+        return codecs.lookup(encoding).name, 0
+    except (LookupError, TypeError):
+        return FALLBACK_ENCODING, 0
+
+
+class TextFileReader:
+    """Memory mapped text file reader class
+
+    Byte offsets are relative to the text after the byte order mark.
+    """
+
+    def __init__(self, path, encoding=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.file = open(path, 'rb')
+        self.data = b''
+        try:
+            try:
+                self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files cannot be mapped
+                pass
+            if encoding:
+                self.encoding, self.bom_length = codecs.lookup(encoding).name, 0
+            else:
+                self.encoding, self.bom_length = detect_encoding(self.data[:DETECT_SAMPLE_SIZE])
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """close the memory map and the file"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    @property
+    def size(self):
+        """text size in bytes"""
+        return len(self.data) - self.bom_length
+
+    def _align(self, offset):
+        """move a utf-8 byte offset forward to a character boundary"""
+        if self.encoding == 'utf-8':
+            position = self.bom_length + offset
+            while position < len(self.data) and self.data[position] & 0xC0 == 0x80:
+                position += 1
+            offset = position - self.bom_length
+        return offset
+
+    def _decoded_chunks(self):
+        """yield the text decoded chunk by chunk"""
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        position = self.bom_length
+        while position < len(self.data):
+            chunk = self.data[position:position + self.chunk_size]
+            position += len(chunk)
+            yield decoder.decode(chunk, final=position >= len(self.data))
+
+    def read_bytes(self, start=0, end=None):
+        """return the raw bytes between byte offsets"""
+        end = self.size if end is None else min(end, self.size)
+        return self.data[self.bom_length + start:self.bom_length + end]
+
+    def text(self, start=0, end=None):
+        """return the text between byte offsets, moved forward to character boundaries"""
+        start = self._align(start)
+        end = self.size if end is None else self._align(min(end, self.size))
+        return codecs.decode(self.read_bytes(start, end), self.encoding, errors='replace')
+
+    def chars(self, start=0, end=None):
+        """return the text between character offsets, decoding only the chunks required"""
+        parts = []
+        position = 0
+        for chunk in self._decoded_chunks():
+            chunk_end = position + len(chunk)
+            if chunk_end > start:
+                parts.append(chunk[max(start - position, 0):
+                                   None if end is None else max(end - position, 0)])
+            position = chunk_end
+            if end is not None and position >= end:
+                break
+        return ''.join(parts)
@@ -45,7 +45,7 @@ class Timer:
         self.verbose = verbose if verbose is not None else Timer.verbose
         self.logger = logger or _logger
         self.extra_msg = user_msg
-        self.timer_fn = time.clock if use_clock else time.time
+        self.timer_fn = time.perf_counter if use_clock else time.time
         self.start = None
 
     def __enter__(self):
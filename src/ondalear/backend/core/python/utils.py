@@ -7,6 +7,7 @@ The *utils* module contains core Python helper functions and classes.
 """
 from __future__ import absolute_import
 from datetime import datetime, timezone
+import hashlib
 import traceback
 import logging
 import os
@@ -26,6 +27,18 @@ def utc_now():
     return datetime.now(tz=timezone.utc)
 
 
+def content_hash(text):
+    """Return a stable hash of text content.
+
+    Args:
+        text (str): text content
+
+    Returns:
+        str: hex digest
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
 def file_exists(path):
     """Check if file exists.
 
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.docmgmt.management
+   :synopsis: docmgmt management package
+
+"""
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.docmgmt.management.commands
+   :synopsis: docmgmt management commands package
+
+"""
@@ -0,0 +1,65 @@
+"""
+.. module:: ondalear.backend.docmgmt.management.commands.backfill_text
+   :synopsis: derived documents normalized text backfill command module
+
+Extracts the normalized text of the derived documents saved before it was
+maintained on save, storing its length and hash, and the text itself for
+uploaded files.  Documents are processed in primary key order, one batch
+per transaction.
+
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ondalear.backend.docmgmt.models import AuxiliaryDocument, ReferenceDocument
+
+_logger = logging.getLogger(__name__)
+
+# number of documents updated per transaction
+DEFAULT_BATCH_SIZE = 100
+
+TEXT_FIELDS = ('text', 'text_length', 'text_hash')
+
+# pylint: disable=no-member
+
+class Command(BaseCommand):
+    """Derived documents normalized text backfill command"""
+    help = 'Store the normalized text of the derived documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='number of documents updated per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='extract the text of all documents, not only the missing ones')
+
+    def handle(self, *args, **options):
+        counts = dict(updated=0, failed=0)
+        for model_class in (ReferenceDocument, AuxiliaryDocument):
+            queryset = model_class.objects.order_by('pk')
+            if not options['all']:
+                queryset = queryset.filter(text_hash__isnull=True)
+            last_pk = None
+            while True:
+                # keyset pagination, rows failing extraction are not fetched again
+                batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+                batch = list(batch[:options['batch_size']])
+                if not batch:
+                    break
+                self.backfill(model_class, batch, counts)
+                last_pk = batch[-1].pk
+
+        self.stdout.write('updated: {updated} failed: {failed}'.format(**counts))
+
+    def backfill(self, model_class, batch, counts):  # pylint: disable=no-self-use
+        """store the normalized text of a batch of documents"""
+        for instance in batch:
+            instance.set_text(instance.extract_text())
+            if instance.text_hash is None and (instance.content or instance.upload):
+                _logger.warning('failed to extract text of document %s', instance.pk)
+                counts['failed'] += 1
+            else:
+                counts['updated'] += 1
+        with transaction.atomic():
+            model_class.objects.bulk_update(batch, TEXT_FIELDS)
@@ -0,0 +1,86 @@
+"""
+.. module:: ondalear.backend.docmgmt.management.commands.migrate_uploads
+   :synopsis: uploaded files blob storage migration command module
+
+Moves the files uploaded to the client directory tree to the content
+addressed blob storage, pointing the documents at their blob and counting
+the references.  The client directory files are removed once no document
+refers to them.
+
+"""
+import logging
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ondalear.backend.core.django.storage import (blob_name, blob_storage,
+                                                  file_content_hash, BLOB_DIR)
+from ondalear.backend.core.python.utils import file_exists, remove
+from ondalear.backend.docmgmt.models import AuxiliaryDocument, Blob, ReferenceDocument
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=no-member
+
+class Command(BaseCommand):
+    """Uploaded files blob storage migration command"""
+    help = 'Move the uploaded files to the content addressed blob storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='report the files to migrate without changing them')
+        parser.add_argument('--keep-files', action='store_true',
+                            help='keep the client directory files once migrated')
+
+    def handle(self, *args, **options):
+        counts = dict(migrated=0, deduplicated=0, missing=0)
+        migrated_names = set()
+        for model_class in (ReferenceDocument, AuxiliaryDocument):
+            instances = (model_class.objects.exclude(upload__isnull=True)
+                         .exclude(upload='')
+                         .exclude(upload__startswith=BLOB_DIR + '/'))
+            for instance in instances.iterator():
+                name = instance.upload.name
+                path = instance.upload.path
+                if not file_exists(path):
+                    _logger.warning('missing uploaded file %s of document %s', path, instance.pk)
+                    counts['missing'] += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write('{} {}: {}'.format(model_class.__name__, instance.pk, name))
+                    counts['migrated'] += 1
+                    continue
+                if self.migrate(model_class, instance, path):
+                    counts['deduplicated'] += 1
+                counts['migrated'] += 1
+                migrated_names.add(name)
+
+        if not (options['dry_run'] or options['keep_files']):
+            self.remove_files(migrated_names)
+
+        self.stdout.write('migrated: {migrated} deduplicated: {deduplicated} '
+                          'missing: {missing}'.format(**counts))
+
+    def migrate(self, model_class, instance, path):   # pylint: disable=no-self-use
+        """point the document at the blob of its file, returning True if the blob existed"""
+        with open(path, 'rb') as input_file:
+            content = File(input_file)
+            name = blob_name(file_content_hash(content))
+            with transaction.atomic():
+                Blob.objects.acquire(file_content_hash(content), content.size)
+                existed = blob_storage.exists(name)
+                blob_storage.save(name, content)
+                # not saving the instance, which would upload the file again
+                model_class.objects.filter(pk=instance.pk).update(upload=name)
+        return existed
+
+    def remove_files(self, names):  # pylint: disable=no-self-use
+        """remove the migrated files no longer referred to"""
+        for name in names:
+            if (ReferenceDocument.objects.filter(upload=name).exists() or
+                    AuxiliaryDocument.objects.filter(upload=name).exists()):
+                continue
+            path = blob_storage.path(name)
+            if file_exists(path):
+                remove(path)
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:52
+
+from django.db import migrations, models
+import ondalear.backend.core.django.fields
+import ondalear.backend.core.django.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docmgmt', '0010_non_unique_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('size', models.IntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Blob',
+                'verbose_name_plural': 'Blobs',
+                'db_table': 'ondalear_docmgmt_blob',
+            },
+        ),
+        migrations.AlterField(
+            model_name='auxiliarydocument',
+            name='upload',
+            field=ondalear.backend.core.django.fields.MimeTypeConstrainedFileField(blank=True, content_types=('text/plain',), max_upload_size=10485760, mime_lookup_length=4096, null=True, storage=ondalear.backend.core.django.storage.BlobStorage(), upload_to=ondalear.backend.core.django.storage.blob_path),
+        ),
+        migrations.AlterField(
+            model_name='referencedocument',
+            name='upload',
+            field=ondalear.backend.core.django.fields.MimeTypeConstrainedFileField(blank=True, content_types=('text/plain',), max_upload_size=10485760, mime_lookup_length=4096, null=True, storage=ondalear.backend.core.django.storage.BlobStorage(), upload_to=ondalear.backend.core.django.storage.blob_path),
+        ),
+    ]
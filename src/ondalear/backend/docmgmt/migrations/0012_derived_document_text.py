@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docmgmt', '0011_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auxiliarydocument',
+            name='text',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='auxiliarydocument',
+            name='text_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='auxiliarydocument',
+            name='text_length',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='referencedocument',
+            name='text',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='referencedocument',
+            name='text_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='referencedocument',
+            name='text_length',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -6,6 +6,7 @@ This package contains server model abstractions.
 
 """
 from ondalear.backend.docmgmt.models.annotation import Annotation
+from ondalear.backend.docmgmt.models.blob import Blob
 from ondalear.backend.docmgmt.models.classification import Tag, Category
 from ondalear.backend.docmgmt.models.client import Client, ClientUser
 from ondalear.backend.docmgmt.models.document import (AuxiliaryDocument,
@@ -0,0 +1,104 @@
+"""
+.. module:: ondalear.backend.docmgmt.models.blob
+   :synopsis: ondalear backend models blob module.
+
+The *blob* module contains the reference counts of the content addressed
+uploaded files.  A blob is stored once whatever the number of documents
+uploading the same contents, and removed with its last reference once the
+releasing transaction commits.
+
+"""
+import logging
+from inflection import humanize, pluralize, underscore
+
+from django.db import transaction
+from django.db.models import F, Model
+from django.utils.translation import ugettext_lazy as _
+
+from ondalear.backend.core.python.utils import file_exists, remove
+from ondalear.backend.core.django import fields
+from ondalear.backend.core.django.models import BaseModelManager, db_table
+from ondalear.backend.core.django.storage import blob_name, blob_storage, is_blob_name
+from ondalear.backend.docmgmt.models import constants
+from ondalear.backend.docmgmt.models.base import app_label
+
+_logger = logging.getLogger(__name__)
+
+
+class BlobManager(BaseModelManager):
+    """Blob manager class"""
+
+    def acquire(self, content_hash, size):
+        """add a reference to the blob, creating it if required"""
+        with transaction.atomic():
+            blob, _ = self.select_for_update().get_or_create(content_hash=content_hash,
+                                                              defaults=dict(size=size))
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    def release(self, name):
+        """remove a reference to the stored file, deleted with its last reference
+
+        The file is deleted once the transaction commits, a rollback leaving
+        it in place.
+        """
+        if not is_blob_name(name):
+            # file uploaded before the blob storage
+            transaction.on_commit(lambda: self._remove_file(name))
+            return
+
+        content_hash = name.rsplit('/', 1)[-1]
+        with transaction.atomic():
+            try:
+                blob = self.select_for_update().get(content_hash=content_hash)
+            except self.model.DoesNotExist:
+                _logger.warning('no blob for %s', name)
+                return
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            if blob.ref_count <= 1:
+                transaction.on_commit(lambda: self.purge(content_hash))
+
+    def purge(self, content_hash):
+        """delete an unreferenced blob and its file, unless acquired again since released"""
+        with transaction.atomic():
+            blob = self.select_for_update().filter(content_hash=content_hash,
+                                                   ref_count__lte=0).first()
+            if blob is None:
+                return
+            # removed while the row is locked, a concurrent upload of the same
+            # contents then stores the blob again
+            blob.delete()
+            blob_storage.delete(blob_name(content_hash))
+
+    @staticmethod
+    def _remove_file(name):
+        """remove a file stored before the blob storage"""
+        path = blob_storage.path(name)
+        if file_exists(path):
+            remove(path)
+
+
+_blob = 'Blob'
+_blob_verbose = humanize(underscore(_blob))
+
+class Blob(Model):
+    """Blob model class
+    """
+    content_hash = fields.char_field(blank=False, null=False, unique=True,
+                                     max_length=constants.CONTENT_HASH_FIELD_MAX_LENGTH)
+    size = fields.integer_field()
+    ref_count = fields.integer_field()
+    creation_time = fields.datetime_field(blank=False, null=False, auto_now_add=True)
+
+    objects = BlobManager()
+
+    class Meta:
+        """Meta class definition"""
+        app_label = app_label
+        db_table = db_table(app_label, _blob)
+        verbose_name = _(_blob_verbose)
+        verbose_name_plural = _(pluralize(_blob_verbose))
+
+    def __str__(self):
+        """pretty format instance as string"""
+        return self.content_hash
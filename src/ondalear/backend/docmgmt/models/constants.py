@@ -14,6 +14,7 @@ CONTENT_TYPE_FIELD_MAX_LENGTH = 32
 DIR_PATH_FIELD_MAX_LENGTH = 2048
 CONTENT_FIELD_MAX_LENGTH = 1024 * 1024  # 1MB
 UPLOAD_FIELD_MAX_FILE_SIZE = 1024 * 1024 * 10   # 10MB
+CONTENT_HASH_FIELD_MAX_LENGTH = 64  # sha256 hex digest
 ANNOTATION_FIELD_MAX_LENGTH = 4096
 
 UNKNOWN = 'unknown'
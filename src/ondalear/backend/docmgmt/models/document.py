@@ -11,25 +11,36 @@ import ftfy
 import magic
 
 from django.conf import settings
+from django.db import transaction
 from django.dispatch import receiver
 from django.db.models import CASCADE, SET_NULL, signals
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.db.models import Model
 
-from ondalear.backend.core.python.utils import file_exists, remove
 from ondalear.backend.core.django import fields
-from ondalear.backend.core.django.storage import overwrite_storage, client_directory_path
+from ondalear.backend.core.django.storage import blob_storage, blob_path, file_content_hash
 from ondalear.backend.core.django.models import db_table
+from ondalear.backend.core.python.text_reader import TextFileReader
+from ondalear.backend.core.python.utils import content_hash
 
 from ondalear.backend.docmgmt.models import constants
 from ondalear.backend.docmgmt.models.base import AbstractDocumentManagementModel, app_label
 from ondalear.backend.docmgmt.models.annotation import Annotation
+from ondalear.backend.docmgmt.models.blob import Blob
 from ondalear.backend.docmgmt.models.client import Client
 from ondalear.backend.docmgmt.models.classification import Category, Tag
 
 _logger = logging.getLogger(__name__)
 
+def normalize_text(text):
+    """return the text with its encoding errors fixed, unchanged on failure"""
+    try:
+        return ftfy.fix_text(text)
+    except Exception:       # pylint: disable=broad-except
+        _logger.exception('failed to fix text')
+        return text
+
 class AbstractDocumentModel(AbstractDocumentManagementModel):
     """Base document model class
     """
@@ -91,15 +102,23 @@ class AbstractDerivedDocumentModel(Model):
     # table specific content for table space future optimization
     content = fields.text_field(blank=True, null=True,
                                 max_length=constants.CONTENT_FIELD_MAX_LENGTH)
-    # designates system managed files uploaded by end user or on his behalf
+    # designates system managed files uploaded by end user or on his behalf,
+    # stored once per contents and reference counted
     upload = fields.constrained_file_field(blank=True, null=True,
-                                           upload_to=client_directory_path,
-                                           storage=overwrite_storage,
+                                           upload_to=blob_path,
+                                           storage=blob_storage,
                                            content_types=constants.MIME_TYPES,
                                            max_upload_size=constants.UPLOAD_FIELD_MAX_FILE_SIZE)
     # server mounted file system path
     dir_path = fields.char_field(blank=True, null=True,
                                  max_length=constants.DIR_PATH_FIELD_MAX_LENGTH)
+    # normalized text of the upload, with its length in characters and content
+    # hash, maintained on save; inline documents only maintain the length and
+    # hash of their content
+    text = fields.text_field(blank=True, null=True, editable=False)
+    text_length = fields.integer_field(editable=False)
+    text_hash = fields.char_field(blank=True, null=True, editable=False,
+                                  max_length=constants.CONTENT_HASH_FIELD_MAX_LENGTH)
     class Meta:
         """Meta class definition"""
         app_label = app_label
@@ -114,6 +133,13 @@ class AbstractDerivedDocumentModel(Model):
         """return document type"""
         return constants.DOCUMENT_TYPE_UNKNOWN
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """load the instance, keeping its loaded content to detect changes on save"""
+        instance = super(AbstractDerivedDocumentModel, cls).from_db(db, field_names, values)
+        instance._loaded_content = instance.__dict__.get('content')   # pylint: disable=protected-access,attribute-defined-outside-init
+        return instance
+
     def clean(self):
         """model wide validation
 
@@ -141,12 +167,7 @@ class AbstractDerivedDocumentModel(Model):
 
             if mime_type not in constants.MIME_TYPES:
                 raise ValidationError(_(f'Invalid mime type {mime_type}.'))
-            try:
-                content = ftfy.fix_text(self.content)
-            except Exception:
-                _logger.exception('failed to fix text for id: %s name: %s',
-                                  self.document.id, self.document.name)
-            self.content = content
+            self.content = normalize_text(content)
             self.document.mime_type = mime_type
 
         if not self.document.mime_type:
@@ -164,32 +185,100 @@ class AbstractDerivedDocumentModel(Model):
         """
         self.full_clean()
 
-        # @TODO: saving again the underlying model as mime_type has changed,
-        #    review the approach
+        # pylint: disable=no-member,protected-access
+        with transaction.atomic():
+            # locked so that concurrent updates release the replaced upload once
+            previous_upload = None
+            if self.pk:
+                previous_upload = type(self).objects.select_for_update().filter(
+                    pk=self.pk).values_list('upload', flat=True).first()
+            uploading = bool(self.upload) and not self.upload._committed
+            if uploading:
+                Blob.objects.acquire(file_content_hash(self.upload.file), self.upload.size)
+            # the uploaded file text is extracted once stored
+            extract_upload = bool(self.upload) and (
+                uploading or previous_upload != self.upload.name or self.text_hash is None)
+            # the content length and hash are computed when it changes
+            if not self.upload and (previous_upload or self.text_hash is None or
+                                    self.content != getattr(self, '_loaded_content', None)):
+                self.set_text(self.content)
+
+            # @TODO: saving again the underlying model as mime_type has changed,
+            #    review the approach
+
+            self.document.save()
+            result = super(AbstractDerivedDocumentModel, self).save(force_insert, force_update,
+                                                                    using, update_fields)
+            # release the replaced upload, or the reference acquired again
+            # when uploading the same contents
+            if previous_upload and (uploading or previous_upload != self.upload.name):
+                Blob.objects.release(previous_upload)
+            if extract_upload:
+                self.set_text(self.extract_text())
+                type(self).objects.filter(pk=self.pk).update(
+                    text=self.text, text_length=self.text_length, text_hash=self.text_hash)
+        self._loaded_content = self.content     # pylint: disable=attribute-defined-outside-init
+        return result
+
+    def set_text(self, text):
+        """set the normalized text length and hash, and the text of uploads
+
+        The content is the text of inline documents, so it is not stored twice.
+        """
+        # pylint: disable=attribute-defined-outside-init
+        self.text = text if self.upload else None
+        self.text_length = len(text) if text else 0
+        self.text_hash = None if text is None else content_hash(text)
+
+    def extract_text(self):
+        """return the normalized text of the content, or read from the uploaded file"""
+        if self.content or not self.upload:
+            # content is normalized on clean
+            return self.content
+        try:
+            with self.file_reader() as reader:
+                return normalize_text(reader.text())
+        except IOError as ex:
+            _logger.error('invalid file %s exc %s', self.upload.path, ex)   # pylint: disable=no-member
+        return None
+
+    def file_reader(self):
+        """return a memory mapped reader of the uploaded file, to be closed by the caller"""
+        return TextFileReader(self.upload.path)     # pylint: disable=no-member
 
-        self.document.save()        # pylint: disable=no-member
-        return super(AbstractDerivedDocumentModel, self).save(force_insert, force_update,
-                                                              using, update_fields)
+    def get_file_contents(self, start=0, end=None):
+        """get file contents, or the characters between offsets, if file has been uploaded
 
-    def get_file_contents(self):
-        """get file contents if file has been uploaded"""
+        The contents are read from the file as uploaded, not normalized.
+        """
         # @TODO: not handling file contents if file has not been uploaded
         #   (i.e. dir_path is set and upload is not set)
         data = None
         if self.upload:
             # pylint: disable=no-member
             try:
-                with open(self.upload.path) as input_file:
-                    data = input_file.read()
+                with self.file_reader() as reader:
+                    if start or end is not None:
+                        data = reader.chars(start, end)
+                    else:
+                        data = reader.text()
             except IOError as ex:
                 _logger.error('invalid file %s exc %s', self.upload.path, ex)
         return data
 
     def get_text(self):
-        """get text data"""
-        if self.content:
+        """get the normalized text data, read from the uploaded file until stored"""
+        if self.content or not self.upload:
             return self.content
-        return self.get_file_contents()
+        if self.text_hash is not None:
+            return self.text
+        return self.extract_text()
+
+    def get_text_hash(self):
+        """get text data content hash"""
+        if self.text_hash is not None:
+            return self.text_hash
+        return content_hash(self.get_text() or '')
 
 _auxiliary_document = 'AuxiliaryDocument'
 _auxiliary_document_verbose = humanize(underscore(_auxiliary_document))
@@ -236,14 +325,9 @@ class ReferenceDocument(AbstractDerivedDocumentModel):
         return constants.DOCUMENT_TYPE_REFERENCE
 
 
-def _delete_file(file_path):
-    """ Deletes file from filesystem. """
-    if file_exists(file_path):
-        remove(file_path)
-
 @receiver(signals.post_delete, sender=ReferenceDocument)
 @receiver(signals.post_delete, sender=AuxiliaryDocument)
 def delete_file(sender, instance, *args, **kwargs):  # pylint: disable=unused-argument
-    """ Deletes  files on `post_delete` """
+    """ Releases the uploaded file on `post_delete`, deleted with its last reference """
     if instance.upload:
-        _delete_file(instance.upload.path)
+        Blob.objects.release(instance.upload.name)
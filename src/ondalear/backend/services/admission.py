@@ -0,0 +1,127 @@
+"""
+.. module:: ondalear.backend.services.admission
+   :synopsis: text analytics admission control module
+
+Synchronous analysis requests are admitted within a global and a per
+client limit of requests in flight.  A request over the global limit
+waits in a bounded queue, while a request over its client limit, over a
+full queue, or waiting longer than the queue timeout is rejected with the
+estimated number of seconds after which it may be retried.
+
+The estimate is derived from the exponentially weighted moving average of
+the admitted request latency.
+
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from ondalear.backend.services.base import ServiceException
+from ondalear.backend.services.cache import CacheStatistics
+
+_logger = logging.getLogger(__name__)
+
+# weight of the latest latency in the moving average
+LATENCY_SMOOTHING = 0.2
+
+class AdmissionException(ServiceException):
+    """Admission exception class"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Admission controller class
+
+    A limit of 0 disables the limit.
+    """
+
+    def __init__(self, max_in_flight, max_client_in_flight, max_queue, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_client_in_flight = max_client_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.client_in_flight = dict()
+        self.queue_depth = 0
+        self.latency = None
+        self.statistics = CacheStatistics()
+
+    def _global_available(self):
+        return not self.max_in_flight or self.in_flight < self.max_in_flight
+
+    def _client_available(self, client_id):
+        return (not self.max_client_in_flight or
+                self.client_in_flight.get(client_id, 0) < self.max_client_in_flight)
+
+    def retry_after(self):
+        """return the estimated seconds before a rejected request may be retried"""
+        latency = self.latency or 1.0
+        slots = self.max_in_flight or 1
+        return max(1, int(math.ceil(latency * (self.queue_depth + 1) / slots)))
+
+    def _reject(self, reason, client_id):
+        self.statistics.increment('rejected')
+        retry_after = self.retry_after()
+        _logger.warning('analysis request rejected, %s; client: %s retry after: %s',
+                        reason, client_id, retry_after)
+        raise AdmissionException('analysis request rejected, {}'.format(reason), retry_after)
+
+    def _acquire(self, client_id):
+        """acquire an in flight slot, waiting in the queue if required"""
+        with self.condition:
+            if not self._client_available(client_id):
+                self._reject('client limit reached', client_id)
+            if not self._global_available():
+                if self.max_queue and self.queue_depth >= self.max_queue:
+                    self._reject('queue full', client_id)
+                self.queue_depth += 1
+                try:
+                    admitted = self.condition.wait_for(
+                        lambda: self._global_available() and self._client_available(client_id),
+                        self.queue_timeout)
+                finally:
+                    self.queue_depth -= 1
+                if not admitted:
+                    self._reject('queue timeout', client_id)
+                self.statistics.increment('queued')
+            self.in_flight += 1
+            self.client_in_flight[client_id] = self.client_in_flight.get(client_id, 0) + 1
+        self.statistics.increment('admitted')
+
+    def _release(self, client_id, latency):
+        """release an in flight slot"""
+        with self.condition:
+            self.in_flight -= 1
+            count = self.client_in_flight[client_id] - 1
+            if count:
+                self.client_in_flight[client_id] = count
+            else:
+                del self.client_in_flight[client_id]
+            self.latency = (latency if self.latency is None else
+                            LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency)
+            self.condition.notify_all()
+
+    @contextmanager
+    def admit(self, client_id):
+        """run the block within the admission limits, raising AdmissionException if rejected"""
+        self._acquire(client_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(client_id, time.perf_counter() - start)
+
+    def stats(self):
+        """return the admission statistics"""
+        stats = self.statistics.as_dict()
+        with self.condition:
+            stats.update(in_flight=self.in_flight,
+                         queue_depth=self.queue_depth,
+                         latency=round(self.latency, 3) if self.latency is not None else None)
+        return stats
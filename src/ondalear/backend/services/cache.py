@@ -2,29 +2,603 @@
 .. module:: ondalear.backend.services.cache
    :synopsis: text analytics cache module
 
+The analysis results cache delegates storage to a pluggable backend:
+
+* *LocalCacheBackend*: per process TTL cache, bounded in bytes.
+* *SharedCacheBackend*: node level sqlite file store shared by all the worker
+  processes, fronted by a short lived per process cache.
+
+Entries computed from stored documents are indexed by document id, so that
+they are evicted when one of their documents changes.
+
 """
+import json
 import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+
 from cachetools import TTLCache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from ondalear.backend.core.python.utils import content_hash, mkdir
+from ondalear.backend.services.metrics import LatencyHistogram
 
 
 _logger = logging.getLogger(__name__)
 
+# favors speed, analysis outputs compressing well at any level
+COMPRESSION_LEVEL = 1
+
+# stored entry size histogram bucket upper bounds in bytes
+ENTRY_SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _normalized_hash(data):
+    """return a stable hash of json serializable data"""
+    normalized = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return content_hash(normalized)
+
+
+def analysis_model_key(model_descriptor, model_params):
+    """build an analysis model key from the model and its normalized parameters"""
+    return _normalized_hash(dict(model_descriptor=model_descriptor,
+                                 model_params=model_params))
+
+
+def analysis_cache_key(client_id, model_descriptor, model_params, model_input):
+    """build an analysis cache key
+
+    The key is derived from the model, the normalized model parameters, and
+    the resolved input texts, and is shared by all the users of a client.
+    """
+    key_data = dict(
+        model_key=analysis_model_key(model_descriptor, model_params),
+        model_input={name: content_hash(text or '') for name, text in model_input.items()})
+    return '{}:{}'.format(client_id, _normalized_hash(key_data))
+
+
+class CacheStatistics:
+    """Cache statistics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict()
+
+    def increment(self, name, count=1):
+        """increment a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def as_dict(self):
+        """return a snapshot of the counters"""
+        with self.lock:
+            return dict(self.counters)
+
+
+class CountingTTLCache(TTLCache):
+    """TTL cache counting the evicted entries"""
+
+    def __init__(self, maxsize, ttl, statistics, getsizeof=None):
+        super().__init__(maxsize=maxsize, ttl=ttl, getsizeof=getsizeof)
+        self.statistics = statistics
+
+    def popitem(self):
+        """evict the least recently used entry"""
+        item = super().popitem()
+        self.statistics.increment('evictions')
+        return item
+
+
+class AbstractCacheBackend(ABC):
+    """Base cache backend class"""
+
+    def __init__(self, time_to_live, max_size):
+        self.time_to_live = time_to_live
+        self.max_size = max_size
+        self.statistics = CacheStatistics()
+
+    @abstractmethod
+    def get(self, key):
+        """return the value for key, or None if not found"""
+
+    @abstractmethod
+    def set(self, key, value, documents=None):
+        """set the value for key, indexed by the ids of the documents it depends on"""
+
+    @abstractmethod
+    def delete_documents(self, documents):
+        """delete the entries depending on the documents, returning their count"""
+
+    @abstractmethod
+    def clear(self):
+        """delete all the entries"""
+
+    def entries(self, max_entries=None):    # pylint: disable=unused-argument,no-self-use
+        """return the most recently used entries, used by snapshots"""
+        return []
+
+    def restore(self, entries):    # pylint: disable=unused-argument,no-self-use
+        """restore snapshot entries, returning their count"""
+        return 0
+
+    def stats(self):
+        """return the backend statistics"""
+        return self.statistics.as_dict()
+
+
+def encode_value(value, compress_threshold):
+    """return the stored form of a value, its size, and whether it is compressed
+
+    Values are stored as json, so that callers modifying a value they set
+    or got do not modify the cached one.  Values whose json form is larger
+    than the threshold are compressed.
+    """
+    data = json.dumps(value, separators=(',', ':')).encode()
+    if compress_threshold and len(data) > compress_threshold:
+        data = zlib.compress(data, COMPRESSION_LEVEL)
+        return data, len(data), True
+    return data, len(data), False
+
+
+def decode_value(data, compressed):
+    """return the value of its stored form"""
+    if compressed:
+        data = zlib.decompress(data)
+    return json.loads(data.decode())
+
+
+class LocalCacheEntry:
+    """Local cache entry"""
+
+    def __init__(self, value, expiry_time, documents=None, compress_threshold=0):
+        self.data, self.size, self.compressed = encode_value(value, compress_threshold)
+        self.expiry_time = expiry_time
+        self.access_time = time.time()
+        self.documents = documents
+
+    @property
+    def value(self):
+        """return the entry value"""
+        return decode_value(self.data, self.compressed)
+
+
+class CacheStripe:
+    """Cache stripe, a TTL cache with its own lock"""
+
+    def __init__(self, maxsize, ttl, statistics, getsizeof=None):
+        self.options = dict(maxsize=maxsize, ttl=ttl, statistics=statistics,
+                            getsizeof=getsizeof)
+        self.cache = CountingTTLCache(**self.options)
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """delete all the entries, without counting them as evicted; called with lock held"""
+        self.cache = CountingTTLCache(**self.options)
+
+
+class LocalCacheBackend(AbstractCacheBackend):
+    """Per process cache backend
+
+    The cache is bounded by the size in bytes of its entries, or by their
+    number if *max_bytes* is 0.  Entries are spread over lock stripes
+    sharing the bound: a stripe may hold up to the whole bound, and once it
+    is exceeded the largest stripe evicts its least recently used entries,
+    the stripe just written being the last resort so that a large new entry
+    is not evicted first.
+    Values larger than *compress_threshold* bytes are compressed.
+    """
+    MAX_BYTES = 256 * 1024 * 1024
+    STRIPES = 16
+    COMPRESS_THRESHOLD = 16 * 1024
+    # index updates between the removal of expired and evicted keys
+    INDEX_PRUNE_INTERVAL = 1024
+
+    def __init__(self, time_to_live, max_size, max_bytes=None, stripes=None,  # pylint: disable=too-many-arguments
+                 compress_threshold=None):
+        super().__init__(time_to_live, max_size)
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+        self.compress_threshold = (self.COMPRESS_THRESHOLD if compress_threshold is None
+                                   else compress_threshold)
+        self.bound = self.max_bytes or max_size
+        getsizeof = (lambda entry: entry.size) if self.max_bytes else None
+        self.stripes = [CacheStripe(self.bound, time_to_live, self.statistics,
+                                    getsizeof=getsizeof)
+                        for _ in range(min(stripes or self.STRIPES, self.bound))]
+        # upper bound of the stored size, the exact size being summed once exceeded
+        self.bound_estimate = 0
+        self.bound_lock = threading.Lock()
+        self.entry_sizes = LatencyHistogram(buckets=ENTRY_SIZE_BUCKETS)
+        self.entry_sizes_lock = threading.Lock()
+        self.index = dict()
+        self.index_updates = 0
+        self.index_lock = threading.Lock()
+
+    def _stripe(self, key):
+        """return the stripe of a key"""
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def get(self, key):
+        """return the value for key, or None if not found"""
+        now = time.time()
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.cache.get(key)
+        # restored entries keep their own expiry time
+        if entry is None or entry.expiry_time <= now:
+            self.statistics.increment('misses')
+            return None
+        entry.access_time = now
+        self.statistics.increment('hits')
+        return entry.value
+
+    def set(self, key, value, documents=None):
+        """set the value for key, indexed by the ids of the documents it depends on"""
+        self._set(key, LocalCacheEntry(value, time.time() + self.time_to_live, documents,
+                                       self.compress_threshold))
+
+    def _set(self, key, entry):
+        """set the entry for key"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            try:
+                stripe.cache[key] = entry
+            except ValueError:
+                # larger than the whole cache
+                self.statistics.increment('too_large')
+                _logger.info('analysis results of %s bytes not cached', entry.size)
+                return
+        self._enforce_bound(entry.size if self.max_bytes else 1, stripe)
+        with self.entry_sizes_lock:
+            self.entry_sizes.observe(entry.size)
+        if entry.compressed:
+            self.statistics.increment('compressed')
+        if entry.documents:
+            with self.index_lock:
+                for document_id in entry.documents:
+                    self.index.setdefault(document_id, set()).add(key)
+                self.index_updates += 1
+                if self.index_updates >= self.INDEX_PRUNE_INTERVAL:
+                    self._prune_index()
+
+    def _enforce_bound(self, size, written):
+        """evict the least recently used entries of the largest stripes while over the bound"""
+        with self.bound_lock:
+            self.bound_estimate += size
+            if self.bound_estimate <= self.bound:
+                return
+            while True:
+                sizes = []
+                for stripe in self.stripes:
+                    with stripe.lock:
+                        sizes.append(stripe.cache.currsize)
+                self.bound_estimate = sum(sizes)
+                if self.bound_estimate <= self.bound:
+                    return
+                # the written stripe only evicts once the others are empty
+                others = [(stripe_size, index) for index, stripe_size in enumerate(sizes)
+                          if stripe_size and self.stripes[index] is not written]
+                stripe = self.stripes[max(others)[1]] if others else written
+                with stripe.lock:
+                    try:
+                        stripe.cache.popitem()
+                    except KeyError:
+                        # expired since summed
+                        pass
+
+    def _contains(self, key):
+        """return True if key is cached"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return key in stripe.cache
+
+    def _prune_index(self):
+        """remove the expired and evicted keys from the index"""
+        self.index_updates = 0
+        for document_id in list(self.index):
+            keys = {key for key in self.index[document_id] if self._contains(key)}
+            if keys:
+                self.index[document_id] = keys
+            else:
+                del self.index[document_id]
+
+    def delete_documents(self, documents):
+        """delete the entries depending on the documents, returning their count"""
+        with self.index_lock:
+            keys = set()
+            for document_id in documents:
+                keys.update(self.index.pop(document_id, ()))
+        deleted = 0
+        for key in keys:
+            stripe = self._stripe(key)
+            with stripe.lock:
+                if stripe.cache.pop(key, None) is not None:
+                    deleted += 1
+        if deleted:
+            self.statistics.increment('invalidations', deleted)
+        return deleted
+
+    def clear(self):
+        """delete all the entries"""
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.clear()
+        with self.index_lock:
+            self.index.clear()
+            self.index_updates = 0
+
+    def entries(self, max_entries=None):
+        """return the most recently used entries not expired"""
+        now = time.time()
+        items = []
+        for stripe in self.stripes:
+            with stripe.lock:
+                items.extend((key, entry) for key, entry in list(stripe.cache.items())
+                             if entry.expiry_time > now)
+        items.sort(key=lambda item: item[1].access_time, reverse=True)
+        return [dict(key=key, value=entry.value, expiry_time=entry.expiry_time,
+                     access_time=entry.access_time,
+                     documents=list(entry.documents) if entry.documents else None)
+                for key, entry in items[:max_entries]]
+
+    def restore(self, entries):
+        """restore entries not expired, returning their count"""
+        now = time.time()
+        count = 0
+        # least recently used first, the most recently used being evicted last
+        for item in reversed(entries):
+            if item['expiry_time'] <= now:
+                continue
+            self._set(item['key'], LocalCacheEntry(item['value'],
+                                                   min(item['expiry_time'],
+                                                       now + self.time_to_live),
+                                                   item.get('documents'),
+                                                   self.compress_threshold))
+            count += 1
+        if count:
+            self.statistics.increment('restored', count)
+        return count
+
+    def stats(self):
+        """return the backend statistics, including the stored entry sizes"""
+        stats = super().stats()
+        size = 0
+        stored_bytes = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                size += len(stripe.cache)
+                stored_bytes += sum(entry.size for entry in stripe.cache.values())
+        with self.entry_sizes_lock:
+            entry_sizes = self.entry_sizes.as_dict()
+        stats.update(size=size, bytes=stored_bytes, max_bytes=self.max_bytes,
+                     entry_sizes=entry_sizes)
+        return stats
+
+
+class SharedCacheBackend(AbstractCacheBackend):
+    """Node level cache backend.
+
+    Entries are kept in an sqlite file readable by all the worker processes
+    on a node.  Recently used entries are also kept in a small per process
+    front cache to avoid the file access.  Values are stored as json in both,
+    so that callers modifying a value they set or got do not modify the
+    cached one.
+    Entry access times are written back in batches, and expired and least
+    recently used entries are evicted once every *evict_interval* writes.
+    Entries outlive the processes, so they are not snapshot.
+    """
+    FILE_NAME = 'analysis_results.sqlite3'
+    FRONT_TIME_TO_LIVE = 60  # 1 minute
+    FRONT_MAX_SIZE = 128
+    TIMEOUT = 5  # seconds to wait for a locked db
+    EVICT_INTERVAL = 64
+    ACCESS_BATCH_SIZE = 64
+
+    def __init__(self, time_to_live, max_size, path=None,  # pylint: disable=too-many-arguments
+                 front_time_to_live=None, front_max_size=None, evict_interval=None):
+        super().__init__(time_to_live, max_size)
+        self.path = path or os.path.join(settings.CACHE_DIR, self.FILE_NAME)
+        self.front = TTLCache(maxsize=front_max_size or self.FRONT_MAX_SIZE,
+                              ttl=min(front_time_to_live or self.FRONT_TIME_TO_LIVE,
+                                      time_to_live))
+        self.front_lock = threading.Lock()
+        self.evict_interval = evict_interval or self.EVICT_INTERVAL
+        self.writes = 0
+        self.access_times = dict()
+        self.local = threading.local()
+        mkdir(os.path.dirname(self.path))
+        self._create_table()
+
+    def _connection(self):
+        """return the calling thread connection"""
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = conn
+        return conn
+
+    def _create_table(self):
+        """create the entries and document index tables if required"""
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expiry_time REAL NOT NULL, access_time REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_expiry_time ON entries (expiry_time)')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_access_time ON entries (access_time)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entry_documents ('
+            'document_id TEXT NOT NULL, key TEXT NOT NULL, '
+            'PRIMARY KEY (document_id, key))')
+        conn.execute('CREATE INDEX IF NOT EXISTS entry_documents_key ON entry_documents (key)')
+
+    def _accessed(self, key, now):
+        """record an entry access, writing the pending ones back once a batch is full"""
+        with self.front_lock:
+            self.access_times[key] = now
+            if len(self.access_times) < self.ACCESS_BATCH_SIZE:
+                return
+        self._write_access_times(self._connection())
+
+    def _write_access_times(self, conn):
+        """write the pending entry access times back"""
+        with self.front_lock:
+            access_times, self.access_times = self.access_times, dict()
+        if access_times:
+            conn.executemany('UPDATE entries SET access_time = MAX(access_time, ?) WHERE key = ?',
+                             [(now, key) for key, now in access_times.items()])
+
+    def get(self, key):
+        """return the value for key, or None if not found"""
+        now = time.time()
+        with self.front_lock:
+            data = self.front.get(key)
+        if data is not None:
+            self._accessed(key, now)
+            self.statistics.increment('hits')
+            self.statistics.increment('front_hits')
+            return json.loads(data)
+
+        conn = self._connection()
+        row = conn.execute('SELECT value FROM entries WHERE key = ? AND expiry_time > ?',
+                           (key, now)).fetchone()
+        if row is None:
+            self.statistics.increment('misses')
+            return None
+        with self.front_lock:
+            self.front[key] = row[0]
+        self._accessed(key, now)
+        self.statistics.increment('hits')
+        self.statistics.increment('shared_hits')
+        return json.loads(row[0])
+
+    def set(self, key, value, documents=None):
+        """set the value for key, indexed by the ids of the documents it depends on"""
+        now = time.time()
+        data = json.dumps(value)
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                     (key, data, now + self.time_to_live, now))
+        if documents:
+            conn.executemany('INSERT OR IGNORE INTO entry_documents VALUES (?, ?)',
+                             [(str(document_id), key) for document_id in documents])
+        with self.front_lock:
+            self.front[key] = data
+            self.access_times.pop(key, None)
+            self.writes += 1
+            evict = self.writes >= self.evict_interval
+            if evict:
+                self.writes = 0
+        if evict:
+            self._evict(conn, now)
+
+    def delete_documents(self, documents):
+        """delete the entries depending on the documents, returning their count
+
+        Entries still held by the front cache of other processes expire
+        with the front cache time to live.
+        """
+        document_ids = [str(document_id) for document_id in documents]
+        if not document_ids:
+            return 0
+        placeholders = ','.join('?' * len(document_ids))
+        conn = self._connection()
+        keys = [row[0] for row in conn.execute(
+            'SELECT DISTINCT key FROM entry_documents WHERE document_id IN ({})'.format(
+                placeholders), document_ids)]
+        deleted = 0
+        if keys:
+            deleted = conn.execute(
+                'DELETE FROM entries WHERE key IN ({})'.format(','.join('?' * len(keys))),
+                keys).rowcount
+            conn.execute('DELETE FROM entry_documents WHERE document_id IN ({})'.format(
+                placeholders), document_ids)
+            with self.front_lock:
+                for key in keys:
+                    self.front.pop(key, None)
+        if deleted:
+            self.statistics.increment('invalidations', deleted)
+        return deleted
+
+    def clear(self):
+        """delete all the entries, including those of the other processes"""
+        conn = self._connection()
+        conn.execute('DELETE FROM entries')
+        conn.execute('DELETE FROM entry_documents')
+        with self.front_lock:
+            self.front.clear()
+            self.access_times.clear()
+            self.writes = 0
+
+    def _evict(self, conn, now):
+        """remove expired entries and enforce the maximum size
+
+        The entries are counted once every *evict_interval* writes, so the
+        store may exceed its maximum size by the writes in between.
+        """
+        # least recently used order includes the front cache hits
+        self._write_access_times(conn)
+        expired = conn.execute('DELETE FROM entries WHERE expiry_time <= ?', (now,)).rowcount
+        excess = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_size
+        if excess > 0:
+            excess = conn.execute(
+                'DELETE FROM entries WHERE key IN '
+                '(SELECT key FROM entries ORDER BY access_time LIMIT ?)', (excess,)).rowcount
+        evicted = expired + max(excess, 0)
+        if evicted:
+            conn.execute('DELETE FROM entry_documents WHERE key NOT IN (SELECT key FROM entries)')
+            self.statistics.increment('evictions', evicted)
+
+
 class AnalysisResultsCache:
     """Analysis cache"""
-    TIME_TO_LIVE = 600  # 10 minutes
+    TIME_TO_LIVE = 6 * 60 * 60  # 6 hours, entries are evicted when their documents change
     MAX_SIZE = 1024
 
-    def __init__(self):
-        self.cache = TTLCache(maxsize=self.MAX_SIZE, ttl=self.TIME_TO_LIVE)
+    def __init__(self, backend=None):
+        self.backend = backend or self.create_backend()
+
+    @classmethod
+    def create_backend(cls):
+        """create the backend configured in settings"""
+        config = settings.ANALYTICS_CACHE
+        options = dict(time_to_live=cls.TIME_TO_LIVE, max_size=cls.MAX_SIZE)
+        options.update(config.get('OPTIONS', dict()))
+        backend_class = import_string(config['BACKEND'])
+        _logger.info('creating analysis cache backend %s', config['BACKEND'])
+        return backend_class(**options)
 
     def find(self, key):
         """find an entry"""
-        try:
-            return self.cache[key]
-        except KeyError:
-            pass
-        return None
-
-    def add(self, key, value):
-        """add entry to cache"""
-        self.cache[key] = value
+        return self.backend.get(key)
+
+    def add(self, key, value, documents=None):
+        """add entry to cache, indexed by the ids of the documents it depends on"""
+        self.backend.set(key, value, documents)
+
+    def entries(self, max_entries=None):
+        """return the most recently used entries"""
+        return self.backend.entries(max_entries)
+
+    def restore(self, entries):
+        """restore entries, returning their count"""
+        return self.backend.restore(entries)
+
+    def invalidate(self, documents):
+        """evict the entries depending on the documents"""
+        deleted = self.backend.delete_documents(documents)
+        if deleted:
+            _logger.info('evicted %s cache entries of documents %s', deleted, list(documents))
+        return deleted
+
+    def clear(self):
+        """evict all the entries"""
+        self.backend.clear()
+
+    def stats(self):
+        """return cache statistics"""
+        return self.backend.stats()
@@ -0,0 +1,154 @@
+"""
+.. module:: ondalear.backend.services.cache_snapshot
+   :synopsis: text analytics cache snapshot module
+
+The most recently used analysis cache entries are saved to a snapshot file
+periodically and when the process exits, with their expiry time, and are
+restored when a process starts so that a restart does not discard the
+cache.
+
+All the worker processes share the snapshot file: a process saving its
+entries merges them into the current snapshot under a file lock, keeping the
+most recently used entries of all the processes.  The snapshot is a
+versioned json file, replaced atomically so that several starting processes
+may read it while another one writes it.  A snapshot of another version, or
+one that cannot be read, is ignored.
+
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from ondalear.backend.core.python.utils import mkdir
+
+_logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE_NAME = 'analysis_results_snapshot.json'
+
+# pylint: disable=broad-except
+
+def write_snapshot(path, entries):
+    """write the snapshot entries, replacing the file atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    mkdir(directory)
+    data = dict(version=SNAPSHOT_VERSION, creation_time=time.time(), entries=entries)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as snapshot_file:
+            json.dump(data, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def snapshot_lock(path):
+    """hold an exclusive lock on the snapshot, shared by the worker processes"""
+    mkdir(os.path.dirname(os.path.abspath(path)))
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def merge_entries(entries, snapshot_entries, max_entries):
+    """merge entries into the snapshot entries
+
+    Returns the most recently used entries not expired, an entry found in
+    both being kept in its most recently used form.
+    """
+    now = time.time()
+    merged = dict()
+    for item in snapshot_entries + entries:
+        if item['expiry_time'] <= now:
+            continue
+        current = merged.get(item['key'])
+        if current is None or item.get('access_time', 0) >= current.get('access_time', 0):
+            merged[item['key']] = item
+    items = sorted(merged.values(), key=lambda item: item.get('access_time', 0), reverse=True)
+    return items[:max_entries]
+
+
+def read_snapshot(path):
+    """return the snapshot entries, or an empty list if not available"""
+    try:
+        with open(path) as snapshot_file:
+            data = json.load(snapshot_file)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as ex:
+        _logger.warning('ignoring unreadable cache snapshot %s: %s', path, ex)
+        return []
+    if data.get('version') != SNAPSHOT_VERSION:
+        _logger.warning('ignoring cache snapshot %s of version %s', path, data.get('version'))
+        return []
+    return data.get('entries', [])
+
+
+class CacheSnapshots:
+    """Analysis cache snapshots
+
+    An interval of 0 disables the periodic snapshots.
+    """
+
+    def __init__(self, cache, path, interval, max_entries):
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def load(self):
+        """restore the snapshot entries, returning their count"""
+        count = self.cache.restore(read_snapshot(self.path))
+        _logger.info('restored %s analysis cache entries from %s', count, self.path)
+        return count
+
+    def save(self):
+        """merge the entries into the snapshot, returning the number of entries saved"""
+        with self.lock, snapshot_lock(self.path):
+            entries = self.cache.entries(self.max_entries)
+            merged = merge_entries(entries, read_snapshot(self.path), self.max_entries)
+            write_snapshot(self.path, merged)
+        _logger.info('saved %s analysis cache entries to %s, holding %s',
+                     len(entries), self.path, len(merged))
+        return len(entries)
+
+    def _run(self):
+        """save snapshots until stopped"""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception:
+                _logger.exception('analysis cache snapshot failed')
+
+    def start(self):
+        """restore the snapshot, then save snapshots periodically and at exit"""
+        self.load()
+        if self.interval:
+            self.thread = threading.Thread(target=self._run, name='cache-snapshots',
+                                           daemon=True)
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """stop the periodic snapshots, saving a last one"""
+        self.stopped.set()
+        try:
+            self.save()
+        except Exception:
+            _logger.exception('analysis cache snapshot failed')
@@ -0,0 +1,203 @@
+"""
+.. module:: ondalear.backend.services.chunking
+   :synopsis: text analytics long document chunking module
+
+Long reference texts are split into overlapping windows, each window being
+analyzed with the question.  The window answers are merged by keeping the
+best scoring span, its offsets being mapped back to the original text.
+
+Windowing is controlled by the *window_size*, *window_stride*, and
+*max_windows* model params, measured in characters, which are removed
+before the params are passed to the model.
+
+Alternatively, the *chunk_size* model param splits the text into content
+defined chunks of that average size: chunk boundaries are chosen by a
+rolling hash of the text, so that an edit only changes the chunks around
+it, and the analysis of the unchanged chunks may be reused.  Chunks do not
+overlap.
+
+"""
+import hashlib
+import logging
+import math
+import re
+
+_logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 'window_size'
+WINDOW_STRIDE = 'window_stride'
+MAX_WINDOWS = 'max_windows'
+CHUNK_SIZE = 'chunk_size'
+WINDOW_PARAMS = (WINDOW_SIZE, WINDOW_STRIDE, MAX_WINDOWS, CHUNK_SIZE)
+DEFAULT_MAX_WINDOWS = 32
+
+# rolling hash values of the characters, stable across processes
+GEAR = [int.from_bytes(hashlib.md5(bytes([value])).digest()[:4], 'big')
+        for value in range(256)]
+HASH_BITS = 32
+HASH_MASK = (1 << HASH_BITS) - 1
+# chunk boundaries are moved to the next sentence end, or whitespace
+SENTENCE_END = re.compile(r'[.!?]\s|\n')
+
+TEXT_REFERENCE = 'text_reference'
+
+def window_params(model_params):
+    """split the window params from the model params
+
+    Returns the window params, and the model params without them.
+    """
+    params = dict((model_params or dict()).get('params') or dict())
+    windowing = {name: params.pop(name) for name in WINDOW_PARAMS if name in params}
+    if windowing:
+        model_params = dict(model_params, params=params)
+    return windowing, model_params
+
+
+def split_text(text, window_size=None, window_stride=None, max_windows=None):
+    """split text into overlapping windows
+
+    Window boundaries are moved to whitespace where possible.  If the text
+    requires more than *max_windows* windows, the stride is increased up to
+    the window size, and the text is truncated beyond that.
+    Returns a list of (offset, window text) pairs.
+    """
+    if not window_size or len(text) <= window_size:
+        return [(0, text)]
+    max_windows = max_windows or DEFAULT_MAX_WINDOWS
+    stride = max(min(window_stride or window_size // 2, window_size), 1)
+    if math.ceil((len(text) - window_size) / stride) + 1 > max_windows:
+        stride = min(window_size,
+                     math.ceil((len(text) - window_size) / max(max_windows - 1, 1)))
+        _logger.info('window stride increased to %s for text length %s', stride, len(text))
+
+    windows = []
+    start = 0
+    while len(windows) < max_windows:
+        end = min(start + window_size, len(text))
+        if end < len(text):
+            boundary = text.rfind(' ', start + window_size // 2, end)
+            end = boundary if boundary > 0 else end
+        windows.append((start, text[start:end]))
+        if end >= len(text):
+            break
+        next_start = min(start + stride, end)
+        boundary = text.find(' ', next_start, end)
+        start = boundary + 1 if boundary >= 0 else next_start
+    if windows[-1][0] + len(windows[-1][1]) < len(text):
+        _logger.warning('text truncated to %s windows', max_windows)
+    return windows
+
+
+def split_chunks(text, chunk_size, max_windows=None):
+    """split text into content defined chunks
+
+    A boundary is placed where the high bits of the rolling hash of the
+    preceding characters are all 0, their number depending on the chunk
+    size, then moved forward to the next sentence end
+    or whitespace.  Chunks are between a quarter and four times the chunk
+    size.  The text is truncated beyond *max_windows* chunks.
+    Returns a list of (offset, chunk text) pairs.
+    """
+    if len(text) <= chunk_size:
+        return [(0, text)]
+    max_windows = max_windows or DEFAULT_MAX_WINDOWS
+    min_size = max(chunk_size // 4, 1)
+    max_size = chunk_size * 4
+    # the high bits depend on the last 32 characters
+    shift = HASH_BITS - max(int(round(math.log2(max(chunk_size - min_size, 2)))), 1)
+
+    chunks = []
+    start = 0
+    while start < len(text) and len(chunks) < max_windows:
+        limit = min(start + max_size, len(text))
+        end = limit
+        hash_value = 0
+        for position in range(start, limit):
+            hash_value = ((hash_value << 1) + GEAR[ord(text[position]) & 0xFF]) & HASH_MASK
+            if position - start >= min_size and not hash_value >> shift:
+                end = position + 1
+                break
+        if end < limit:
+            look_ahead = min(end + min_size, limit)
+            match = SENTENCE_END.search(text, end, look_ahead)
+            if match:
+                end = match.end()
+            else:
+                boundary = text.find(' ', end, look_ahead)
+                end = boundary + 1 if boundary >= 0 else end
+        chunks.append((start, text[start:end]))
+        start = end
+    if start < len(text):
+        _logger.warning('text truncated to %s chunks', max_windows)
+    return chunks
+
+
+def split_reference(text, window_size=None, window_stride=None, max_windows=None,
+                    chunk_size=None):
+    """split the reference text into chunks or windows as per the window params"""
+    if chunk_size:
+        return split_chunks(text, chunk_size, max_windows)
+    return split_text(text, window_size, window_stride, max_windows)
+
+
+def span_score(model_output):
+    """return the best span score of a window output, 0 if not available"""
+    try:
+        span_start, span_end = model_output['best_span']
+        return model_output['span_start_probs'][span_start] * \
+            model_output['span_end_probs'][span_end]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return 0.0
+
+
+def span_offsets(text, model_output):
+    """return the (start, end) offsets of the best span within text, or None"""
+    answer = model_output.get('best_span_str')
+    if not answer:
+        return None
+    # locate the span start token to disambiguate repeated answers
+    tokens = model_output.get('passage_tokens') or []
+    best_span = model_output.get('best_span') or [0]
+    position = 0
+    for token in tokens[:best_span[0]]:
+        found = text.find(token, position)
+        if found < 0:
+            position = 0
+            break
+        position = found + len(token)
+    start = text.find(answer, position)
+    if start < 0:
+        start = text.find(answer)
+    if start < 0:
+        return None
+    return start, start + len(answer)
+
+
+def merge_outputs(window_results):
+    """merge window analysis results into one result
+
+    window_results is a list of (offset, window text, model_output, error).
+    Returns a (model_output, error) pair, the model output being that of the
+    best scoring window, with *answer_start* and *answer_end* offsets
+    relative to the original text.
+    """
+    if len(window_results) == 1:
+        _, _, model_output, error = window_results[0]
+        return model_output, error
+
+    scored = [(span_score(model_output), index)
+              for index, (_, _, model_output, error) in enumerate(window_results)
+              if not error]
+    if not scored:
+        return None, window_results[0][3]
+
+    _, best = max(scored, key=lambda item: (item[0], -item[1]))
+    offset, text, model_output, _ = window_results[best]
+    model_output = dict(model_output)
+    offsets = span_offsets(text, model_output)
+    model_output.update(
+        answer_start=offset + offsets[0] if offsets else None,
+        answer_end=offset + offsets[1] if offsets else None,
+        window_offset=offset,
+        window_count=len(window_results))
+    return model_output, None
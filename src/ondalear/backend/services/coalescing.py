@@ -0,0 +1,69 @@
+"""
+.. module:: ondalear.backend.services.coalescing
+   :synopsis: text analytics request coalescing module
+
+Concurrent requests sharing a key are coalesced: the first caller runs the
+computation while the others wait for its outcome.  A caller whose wait
+exceeds the timeout runs the computation itself.
+
+"""
+import logging
+import threading
+
+from ondalear.backend.services.cache import CacheStatistics
+
+_logger = logging.getLogger(__name__)
+
+class InFlightCall:
+    """In flight computation"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """Single flight class"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = dict()
+        self.statistics = CacheStatistics()
+
+    def run(self, key, func):
+        """run func, or wait for the outcome of a concurrent call sharing key"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = InFlightCall()
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                self.statistics.increment('coalesced')
+                if call.exception is not None:
+                    raise call.exception
+                return call.result
+            _logger.warning('timed out waiting for in flight call %s', key)
+            self.statistics.increment('timeouts')
+            return func()
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as ex:
+            call.exception = ex
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self):
+        """return the coalescing statistics"""
+        stats = self.statistics.as_dict()
+        with self.lock:
+            stats['in_flight'] = len(self.calls)
+        return stats
@@ -0,0 +1,307 @@
+"""
+.. module:: ondalear.backend.services.executors
+   :synopsis: text analytics inference executors module
+
+Inference executors run the model analysis:
+
+* *LocalInferenceExecutor*: on the calling thread, using the service models.
+* *ProcessInferenceExecutor*: on a bounded pool of worker processes, each
+  loading its models once, leaving the web process free to handle I/O.
+  Only the model input, params and output cross the process boundary.
+
+The process executor timeout counts from the moment a worker process starts
+the analysis, not from its submission, so time spent waiting for a free
+worker is not charged to the request.  The worker interrupts an analysis
+exceeding the timeout itself, keeping the pool and its loaded models.
+
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from django.conf import settings
+
+from ondalear.analytics import initialize_allennlp, find_model, MODEL_FAMILY, MODEL_NAME
+from ondalear.backend.services.base import ServiceException
+from ondalear.backend.services.chunking import TEXT_REFERENCE
+from ondalear.backend.services.metrics import StageTimings, STAGE_CONVERT
+from ondalear.backend.services.model_registry import ModelRegistry, model_loader
+from ondalear.backend.services.passages import PassageCache
+
+_logger = logging.getLogger(__name__)
+
+INFERENCE_EXECUTOR_LOCAL = 'local'
+INFERENCE_EXECUTOR_PROCESS = 'process'
+
+# pylint: disable=broad-except
+
+def convert_model_input(model, model_input, model_key=None, passages=None):
+    """convert the model input, reusing the converted passage if cached"""
+    passage = None
+    if passages is not None:
+        passage = passages.convert(model, model_key, model_input[TEXT_REFERENCE])
+    if passage is None:
+        return model.convert_model_input(model_input)
+    return model.convert_model_input(model_input, passage=passage)
+
+
+def analyze_inputs(model, model_inputs, model_params,  # pylint: disable=too-many-arguments
+                   timings=None, model_key=None, passages=None):
+    """convert and analyze a list of model inputs
+
+    Uses the model batch prediction path if available, falling back to
+    item level analysis to isolate the failing items.
+    Returns a list of (model_output, error) pairs in input order.
+    """
+    timings = timings or StageTimings()
+    results = [None] * len(model_inputs)
+    converted = []
+    with timings.span(STAGE_CONVERT):
+        for index, model_input in enumerate(model_inputs):
+            try:
+                converted.append((index, convert_model_input(model, model_input,
+                                                             model_key, passages)))
+            except Exception as ex:
+                _logger.exception('failed to convert model input %s', index)
+                results[index] = (None, str(ex))
+
+    analyze_batch = getattr(model, 'analyze_batch', None)
+    if analyze_batch is not None and len(converted) > 1:
+        try:
+            model_outputs = analyze_batch(model_inputs=[native for _, native in converted],
+                                          model_params=model_params)
+            for (index, _), model_output in zip(converted, model_outputs):
+                results[index] = (model_output, None)
+            return results
+        except Exception:
+            _logger.exception('batch analysis failed; analyzing items individually')
+
+    for index, native_model_input in converted:
+        try:
+            results[index] = (model.analyze(model_input=native_model_input,
+                                            model_params=model_params), None)
+        except Exception as ex:
+            _logger.exception('item analysis failed')
+            results[index] = (None, str(ex))
+    return results
+
+
+class LocalInferenceExecutor:
+    """Local inference executor"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def warm_up(self, model_descriptors):
+        """load the models"""
+        if not self.service.is_initialized():
+            self.service.initialize()
+        self.service.models.preload([(model_descriptor[MODEL_FAMILY],
+                                      model_descriptor[MODEL_NAME])
+                                     for model_descriptor in model_descriptors])
+
+    def analyze(self, model_descriptor, model_inputs, model_params, timings=None):
+        """analyze a list of model inputs"""
+        model_key = (model_descriptor[MODEL_FAMILY], model_descriptor[MODEL_NAME])
+        with self.service.use_model(model_descriptor) as model:
+            return analyze_inputs(model, model_inputs, model_params, timings,
+                                  model_key, self.service.passages)
+
+    def shutdown(self):
+        """release the executor resources"""
+
+
+# worker process models, passages and task start queue, created by the pool initializer
+_worker_models = None
+_worker_passages = None
+_worker_started = None
+
+def _initialize_worker(config_file_path, memory_budget, model_descriptors, started):
+    """worker process initializer"""
+    global _worker_models, _worker_passages, _worker_started     # pylint: disable=global-statement
+    initialize_allennlp(config_file_path)
+    _worker_models = ModelRegistry(model_loader(find_model), memory_budget)
+    _worker_passages = PassageCache()
+    _worker_started = started
+    _worker_models.preload(model_descriptors)
+
+
+def _ping_worker():
+    """no-op task used to start the worker processes"""
+    return True
+
+
+class _AnalysisDeadline(BaseException):
+    """Raised in a worker process analysis exceeding its timeout.
+
+    Not an *Exception*, so that item level error handling does not catch it.
+    """
+
+
+def _raise_deadline(signum, frame):     # pylint: disable=unused-argument
+    """worker process timer signal handler"""
+    raise _AnalysisDeadline()
+
+
+def _analyze_in_worker(task_id, timeout,    # pylint: disable=too-many-arguments
+                       model_family, model_name, model_inputs, model_params):
+    """worker process analysis task, interrupted once exceeding the timeout"""
+    _worker_started.put(task_id)
+    previous_handler = signal.signal(signal.SIGALRM, _raise_deadline)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            with _worker_models.use(model_family, model_name) as model:
+                return analyze_inputs(model, model_inputs, model_params,
+                                      model_key=(model_family, model_name),
+                                      passages=_worker_passages)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _AnalysisDeadline:
+        raise ServiceException('analysis timed out after {} seconds'.format(timeout))
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+class ProcessInferenceExecutor:
+    """Process pool inference executor.
+
+    Each task reports its start on a queue, the caller waiting for its result
+    up to the timeout, and a grace period, from that start.  Only a worker
+    failing to interrupt itself, i.e. stuck in native code, exceeds it.
+    Such a worker and a broken pool, i.e. a worker process that died, both
+    result in the pool being replaced by a fresh one, since a process pool
+    cannot replace a single worker.
+    """
+    TIMEOUT_GRACE_PERIOD = 10   # seconds
+    POLL_INTERVAL = 0.1     # seconds
+
+    def __init__(self, service, max_workers, timeout):
+        self.service = service
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.model_descriptors = []
+        self.pool = None
+        self.started_queue = None
+        self.task_ids = itertools.count()
+        self.waiting = set()
+        self.start_times = dict()
+        self.lock = Lock()
+
+    def _pool(self):
+        """return the worker pool, creating it on first use"""
+        with self.lock:
+            if self.pool is None:
+                _logger.info('starting %s inference worker processes', self.max_workers)
+                self.started_queue = multiprocessing.Queue()
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_initialize_worker,
+                    initargs=(self.service.allennlp_config_file_path(),
+                              settings.ANALYTICS_MODEL_MEMORY_BUDGET,
+                              self.model_descriptors,
+                              self.started_queue))
+            return self.pool
+
+    def _reset(self, pool):
+        """replace a failed pool, terminating its worker processes"""
+        with self.lock:
+            if self.pool is not pool:
+                return
+            self.pool = None
+        _logger.warning('restarting inference worker processes')
+        # pylint: disable=protected-access
+        for process in list((pool._processes or dict()).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def _start_time(self, task_id):
+        """return the time a task started on a worker, or None if not started yet"""
+        with self.lock:
+            while self.started_queue is not None:
+                try:
+                    started_id = self.started_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if started_id in self.waiting:
+                    self.start_times[started_id] = time.monotonic()
+            return self.start_times.get(task_id)
+
+    def _result(self, future, task_id):
+        """wait for a task result, up to the timeout and grace period from its start"""
+        deadline = None
+        while True:
+            if deadline is None:
+                start_time = self._start_time(task_id)
+                if start_time is not None:
+                    deadline = start_time + self.timeout + self.TIMEOUT_GRACE_PERIOD
+            wait = self.POLL_INTERVAL if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def warm_up(self, model_descriptors):
+        """start the worker processes, preloading the models"""
+        self.model_descriptors = [(model_descriptor[MODEL_FAMILY],
+                                   model_descriptor[MODEL_NAME])
+                                  for model_descriptor in model_descriptors]
+        pool = self._pool()
+        futures = [pool.submit(_ping_worker) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+
+    def analyze(self, model_descriptor, model_inputs, model_params,
+                timings=None):  # pylint: disable=unused-argument
+        """analyze a list of model inputs on a worker process
+
+        Conversion takes place in the worker, and is not timed separately.
+        """
+        pool = self._pool()
+        task_id = next(self.task_ids)
+        with self.lock:
+            self.waiting.add(task_id)
+        try:
+            future = pool.submit(_analyze_in_worker, task_id, self.timeout,
+                                 model_descriptor[MODEL_FAMILY], model_descriptor[MODEL_NAME],
+                                 model_inputs, model_params)
+            return self._result(future, task_id)
+        except FutureTimeoutError:
+            _logger.error('inference worker process stuck for %s seconds; model_descriptor: %s',
+                          self.timeout, model_descriptor)
+            self._reset(pool)
+            raise ServiceException('analysis timed out after {} seconds'.format(self.timeout))
+        except BrokenProcessPool:
+            _logger.exception('inference worker process terminated')
+            self._reset(pool)
+            raise ServiceException('analysis worker process terminated')
+        finally:
+            with self.lock:
+                self.waiting.discard(task_id)
+                self.start_times.pop(task_id, None)
+
+    def shutdown(self):
+        """stop the worker processes"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+
+
+def create_executor(service):
+    """create the inference executor configured in settings"""
+    mode = settings.ANALYTICS_INFERENCE_EXECUTOR
+    if mode == INFERENCE_EXECUTOR_PROCESS:
+        return ProcessInferenceExecutor(service,
+                                        max_workers=settings.ANALYTICS_INFERENCE_WORKERS,
+                                        timeout=settings.ANALYTICS_INFERENCE_TIMEOUT)
+    if mode != INFERENCE_EXECUTOR_LOCAL:
+        raise ServiceException('unknown inference executor {}'.format(mode))
+    return LocalInferenceExecutor(service)
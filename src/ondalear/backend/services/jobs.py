@@ -0,0 +1,151 @@
+"""
+.. module:: ondalear.backend.services.jobs
+   :synopsis: text analytics asynchronous jobs module
+
+Analysis jobs are persisted as *AnalysisJob* instances and processed by a
+local worker pool.  Since the job state is kept in the db, any web worker
+can answer a status poll, regardless of which process runs the job.
+
+Jobs left pending or running by a stopped worker are recovered by the
+*recover_analysis_jobs* management command.
+
+"""
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from ondalear.backend.core.python.utils import utc_now
+from ondalear.backend.analytics.models import AnalysisJob, constants
+
+_logger = logging.getLogger(__name__)
+
+INTERRUPTED_JOB_ERROR = 'analysis job interrupted by a worker restart'
+
+# pylint: disable=no-member,broad-except
+
+def job_request(request_context):
+    """extract the persistable portion of a request context"""
+    return dict(model_descriptor=request_context['model_descriptor'],
+                model_input=request_context['model_input'],
+                model_params=request_context['model_params'],
+                processing_instructions=request_context['processing_instructions'])
+
+
+def job_request_context(job):
+    """rebuild the request context from a persisted job"""
+    request_context = dict(job.request)
+    request_context.update(user=job.effective_user,
+                           client=job.client,
+                           site=job.site)
+    return request_context
+
+
+class AnalysisJobExecutor:
+    """Analysis job executor.
+
+    Runs analysis jobs on a bounded pool of local worker threads.
+    """
+    THREAD_NAME_PREFIX = 'analysis-job'
+
+    def __init__(self, service, max_workers):
+        self.service = service
+        self.max_workers = max_workers
+        self.pool = None
+        self.lock = Lock()
+
+    def _pool(self):
+        """return the worker pool, creating it on first use"""
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                               thread_name_prefix=self.THREAD_NAME_PREFIX)
+            return self.pool
+
+    def submit(self, job_id):
+        """submit a job for processing"""
+        _logger.info('submitting analysis job %s', job_id)
+        return self._pool().submit(self._run_in_worker, job_id)
+
+    def shutdown(self, wait=True):
+        """stop the worker pool"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=wait)
+                self.pool = None
+
+    def _run_in_worker(self, job_id):
+        """process a job on a worker thread"""
+        # worker threads own their db connections
+        close_old_connections()
+        try:
+            self.run(job_id)
+        finally:
+            connection.close()
+
+    def recover(self, stale_after=None):    # pylint: disable=no-self-use
+        """recover the jobs left behind by stopped workers
+
+        Running jobs started more than *stale_after* seconds ago, by default
+        *ANALYTICS_JOB_STALE_AFTER*, are marked as failed.
+        Returns the number of failed jobs and the ids of the pending jobs,
+        to be submitted again.
+        """
+        if stale_after is None:
+            stale_after = settings.ANALYTICS_JOB_STALE_AFTER
+        failed = AnalysisJob.objects.filter(
+            status=constants.JOB_STATUS_RUNNING,
+            start_time__lte=utc_now() - timedelta(seconds=stale_after)).update(
+                status=constants.JOB_STATUS_FAILED,
+                error=INTERRUPTED_JOB_ERROR,
+                end_time=utc_now())
+        if failed:
+            _logger.warning('marked %s interrupted analysis jobs as failed', failed)
+
+        job_ids = list(AnalysisJob.objects.filter(
+            status=constants.JOB_STATUS_PENDING).order_by('pk').values_list('pk', flat=True))
+        return failed, job_ids
+
+    def claim(self, job_id):    # pylint: disable=no-self-use
+        """mark a pending job as running, returning False if already claimed"""
+        return AnalysisJob.objects.filter(
+            pk=job_id, status=constants.JOB_STATUS_PENDING).update(
+                status=constants.JOB_STATUS_RUNNING, start_time=utc_now()) == 1
+
+    def run(self, job_id):
+        """process a job, recording its outcome in the db"""
+        try:
+            # a job submitted again by recovery is only processed once
+            if not self.claim(job_id):
+                _logger.info('analysis job %s already claimed', job_id)
+                return
+            job = AnalysisJob.objects.select_related(
+                'client', 'effective_user', 'site').get(pk=job_id)
+            try:
+                model_output, instance = self.service.analyze(job_request_context(job))
+            except Exception as ex:
+                _logger.exception('analysis job %s failed', job_id)
+                self._update(job, status=constants.JOB_STATUS_FAILED,
+                             error=str(ex), end_time=utc_now())
+            else:
+                self._update(job, status=constants.JOB_STATUS_COMPLETED,
+                             output=model_output, results=instance, end_time=utc_now())
+        except Exception:
+            _logger.exception('failed to process analysis job %s', job_id)
+
+    def _update(self, job, **kwargs):   # pylint: disable=no-self-use
+        """record the outcome of a running job
+
+        A job failed by recovery in the meantime keeps its failed status.
+        """
+        updated = AnalysisJob.objects.filter(
+            pk=job.pk, status=constants.JOB_STATUS_RUNNING).update(
+                update_user=job.effective_user, update_time=utc_now(), **kwargs)
+        if updated:
+            _logger.info('analysis job %s status: %s', job.id, kwargs['status'])
+        else:
+            _logger.warning('analysis job %s no longer running, %s status discarded',
+                            job.id, kwargs['status'])
@@ -0,0 +1,120 @@
+"""
+.. module:: ondalear.backend.services.metrics
+   :synopsis: text analytics metrics module
+
+Analysis requests record the elapsed time of each of their stages, which
+are aggregated into per model latency histograms.  A model gets its own
+histograms once an analysis has found it; the requests for the other models,
+i.e. unknown model descriptors, share the *unknown* histograms, bounding
+their number whatever the model descriptors requested.
+
+"""
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+from ondalear.backend.core.python.timing import Timer
+
+_logger = logging.getLogger(__name__)
+
+# analysis stages
+STAGE_TOTAL = 'total'
+STAGE_SAVED_RESULTS = 'saved_results'
+STAGE_FETCH_DOCUMENTS = 'fetch_documents'
+STAGE_GET_TEXT = 'get_text'
+STAGE_CACHE = 'cache'
+STAGE_CONVERT = 'convert'
+STAGE_INFERENCE = 'inference'
+STAGE_SAVE_RESULTS = 'save_results'
+
+# histogram bucket upper bounds in ms
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# label of the requests for models not found by an analysis yet
+UNKNOWN_MODEL_LABEL = 'unknown'
+
+class StageTimings:
+    """Elapsed time of the stages of a request"""
+
+    def __init__(self):
+        self.stages = dict()
+
+    @contextmanager
+    def span(self, stage):
+        """time a stage, accumulating repeated stages"""
+        with Timer(stage, use_clock=True) as timer:
+            yield
+        self.stages[stage] = self.stages.get(stage, 0.0) + timer.msecs
+
+    def as_dict(self):
+        """return the stage timings in ms"""
+        return {stage: round(msecs, 3) for stage, msecs in self.stages.items()}
+
+
+class LatencyHistogram:
+    """Latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, msecs):
+        """record a latency"""
+        self.counts[bisect.bisect_left(self.buckets, msecs)] += 1
+        self.count += 1
+        self.total += msecs
+
+    def percentile(self, fraction):
+        """return the bucket upper bound of a percentile, None beyond the last bucket"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else None
+        return None
+
+    def as_dict(self):
+        """return the histogram summary"""
+        return dict(count=self.count,
+                    mean=round(self.total / self.count, 3) if self.count else None,
+                    p50=self.percentile(0.50),
+                    p95=self.percentile(0.95),
+                    p99=self.percentile(0.99),
+                    buckets=dict(zip([str(bucket) for bucket in self.buckets] + ['inf'],
+                                     self.counts)))
+
+
+class AnalysisMetrics:
+    """Analysis latency metrics, per model and stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict()
+        self.model_labels = set()
+
+    def register(self, model_label):
+        """register a model found by an analysis, recorded under its own label"""
+        with self.lock:
+            self.model_labels.add(model_label)
+
+    def record(self, model_label, timings):
+        """record the stage timings of a request"""
+        with self.lock:
+            if model_label not in self.model_labels:
+                model_label = UNKNOWN_MODEL_LABEL
+            stages = self.histograms.setdefault(model_label, dict())
+            for stage, msecs in timings.stages.items():
+                stages.setdefault(stage, LatencyHistogram()).observe(msecs)
+
+    def summary(self):
+        """return the latency summary"""
+        with self.lock:
+            return {model_label: {stage: histogram.as_dict()
+                                  for stage, histogram in stages.items()}
+                    for model_label, stages in self.histograms.items()}
@@ -0,0 +1,189 @@
+"""
+.. module:: ondalear.backend.services.model_registry
+   :synopsis: text analytics model registry module
+
+The model registry keeps track of the loaded models, loading each model
+once even when requested concurrently, and evicting the least recently used
+models once the memory budget has been exceeded.  Models are held while in
+use, an evicted model being unloaded once its last user releases it.
+
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=broad-except
+
+def resident_memory_size():
+    """return the process resident memory size in bytes, or 0 if not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+_model_families = dict()
+
+def register_model_family(family, loader):
+    """register a local model family, resolved before the analytics library models"""
+    _model_families[family] = loader
+
+
+def is_local_model_family(family):
+    """return True if the model family has been registered locally"""
+    return family in _model_families
+
+
+def model_loader(default_loader):
+    """return a model loader resolving the local model families first"""
+    def load(family, name):
+        """load a model"""
+        loader = _model_families.get(family)
+        if loader is not None:
+            return loader(name=name)
+        return default_loader(family=family, name=name)
+    return load
+
+
+class ModelEntry:
+    """Loaded model entry"""
+
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.users = 0
+        self.evicted = False
+
+
+class ModelRegistry:
+    """Model registry class.
+
+    Models are loaded using the loader callable, and their approximate size
+    is either reported by the model (*memory_size*) or measured as the
+    growth of the process resident memory while loading.
+    """
+
+    def __init__(self, loader, memory_budget=0):
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.loading_locks = dict()
+
+    @contextmanager
+    def use(self, family, name):
+        """return the model, loading it if required, held until the context exits"""
+        entry = self._acquire(family, name)
+        try:
+            yield entry.model
+        finally:
+            self._release(family, name, entry)
+
+    def _acquire(self, family, name):
+        """return the model entry in use, loading it if required"""
+        key = (family, name)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                entry.users += 1
+                return entry
+            loading_lock = self.loading_locks.setdefault(key, threading.Lock())
+
+        # concurrent requests for the same model wait for a single load
+        with loading_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry:
+                    entry.users += 1
+                    return entry
+            return self._load(family, name)
+
+    def _release(self, family, name, entry):
+        """release a model entry, unloading it if evicted and no longer in use"""
+        with self.lock:
+            entry.users -= 1
+            unload = entry.evicted and not entry.users
+        if unload:
+            self._unload(family, name, entry)
+
+    def _load(self, family, name):
+        """load a model and register it in use"""
+        _logger.info('loading model family: %s name: %s', family, name)
+        memory_before = resident_memory_size()
+        model = self.loader(family=family, name=name)
+        size = self._model_size(model, memory_before)
+        _logger.info('loaded model family: %s name: %s size: %s', family, name, size)
+
+        entry = ModelEntry(model, size)
+        entry.users = 1
+        with self.lock:
+            self.entries[(family, name)] = entry
+            evicted = self._evict()
+        for (evicted_family, evicted_name), evicted_entry in evicted:
+            self._unload(evicted_family, evicted_name, evicted_entry)
+        return entry
+
+    def _model_size(self, model, memory_before):    # pylint: disable=no-self-use
+        """return the approximate model size in bytes"""
+        memory_size = getattr(model, 'memory_size', None)
+        if callable(memory_size):
+            try:
+                return memory_size()
+            except Exception:
+                _logger.exception('failed to obtain model memory size')
+        return max(resident_memory_size() - memory_before, 0)
+
+    def _evict(self):
+        """evict least recently used models while over budget; called with lock held
+
+        Returns the evicted entries no longer in use, to be unloaded once
+        the lock is released.
+        """
+        unused = []
+        if not self.memory_budget:
+            return unused
+        while len(self.entries) > 1 and self.memory_size() > self.memory_budget:
+            key, entry = self.entries.popitem(last=False)
+            _logger.info('evicting model family: %s name: %s size: %s',
+                         key[0], key[1], entry.size)
+            entry.evicted = True
+            if not entry.users:
+                unused.append((key, entry))
+        return unused
+
+    def _unload(self, family, name, entry):   # pylint: disable=no-self-use
+        """unload an evicted model"""
+        unload = getattr(entry.model, 'unload', None)
+        if callable(unload):
+            try:
+                unload()
+            except Exception:
+                _logger.exception('failed to unload model family: %s name: %s',
+                                  family, name)
+
+    def memory_size(self):
+        """return the approximate memory size of the loaded models"""
+        return sum(entry.size for entry in self.entries.values())
+
+    def preload(self, descriptors):
+        """load a list of (family, name) models"""
+        for family, name in descriptors:
+            try:
+                with self.use(family, name):
+                    pass
+            except Exception:
+                _logger.exception('failed to preload model family: %s name: %s',
+                                  family, name)
+
+    def stats(self):
+        """return the loaded models statistics"""
+        with self.lock:
+            return [dict(model_family=family, model_name=name, size=entry.size)
+                    for (family, name), entry in self.entries.items()]
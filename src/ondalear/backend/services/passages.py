@@ -0,0 +1,90 @@
+"""
+.. module:: ondalear.backend.services.passages
+   :synopsis: text analytics converted passage cache module
+
+Models able to convert a passage on its own expose:
+
+* *convert_passage(text)*: returns the native passage representation.
+* *convert_model_input(model_input, passage=None)*: accepts the converted
+  passage, only converting the remaining input.  The passage is shared, and
+  must not be modified.
+
+The converted passages are cached by model and passage content hash, so
+that questions asked against the same reference text only convert the
+question.  The cache is bounded by the approximate size of its entries,
+estimated from the passage text length.
+
+Only the stub model family converts a passage on its own, so the cache is
+limited to the stub benchmarks and kept small; the AllenNLP models convert
+the whole model input, and their passages are not reused.
+
+"""
+import logging
+import threading
+
+from cachetools import LRUCache
+
+from ondalear.backend.core.python.utils import content_hash
+from ondalear.backend.services.cache import CacheStatistics
+
+_logger = logging.getLogger(__name__)
+
+# approximate converted passage bytes per text character, covering the
+# tokens, their offsets, and their vocabulary indices
+PASSAGE_BYTES_PER_CHARACTER = 64
+
+# approximate size in bytes of the converted passage cache
+PASSAGE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+def passage_size(text):
+    """return the approximate size in bytes of the converted passage of a text"""
+    return PASSAGE_BYTES_PER_CHARACTER * max(len(text), 1)
+
+
+class PassageEntry:
+    """Converted passage entry"""
+
+    def __init__(self, passage, size):
+        self.passage = passage
+        self.size = size
+
+
+class PassageCache:
+    """Converted passage cache"""
+
+    def __init__(self, max_bytes=PASSAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.cache = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: entry.size)
+        self.lock = threading.Lock()
+        self.statistics = CacheStatistics()
+
+    def convert(self, model, model_key, text):
+        """return the converted passage, or None if not supported by the model"""
+        convert_passage = getattr(model, 'convert_passage', None)
+        if convert_passage is None or not self.max_bytes:
+            return None
+
+        key = (model_key, content_hash(text))
+        with self.lock:
+            entry = self.cache.get(key)
+        if entry is not None:
+            self.statistics.increment('hits')
+            return entry.passage
+
+        self.statistics.increment('misses')
+        passage = convert_passage(text)
+        entry = PassageEntry(passage, passage_size(text))
+        with self.lock:
+            try:
+                self.cache[key] = entry
+            except ValueError:
+                # larger than the whole cache
+                _logger.info('passage of %s bytes not cached', entry.size)
+        return passage
+
+    def stats(self):
+        """return the cache statistics"""
+        stats = self.statistics.as_dict()
+        with self.lock:
+            stats.update(size=len(self.cache), bytes=self.cache.currsize)
+        return stats
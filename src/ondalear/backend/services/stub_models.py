@@ -0,0 +1,84 @@
+"""
+.. module:: ondalear.backend.services.stub_models
+   :synopsis: text analytics stub model family module
+
+The stub model family provides deterministic models for testing and
+benchmarking the analysis request path without the analytics library
+model weights.  The model params *latency* (seconds) and *output_size*
+control the simulated inference time and the size of the model output.
+
+"""
+import logging
+import time
+
+from ondalear.backend.core.python.utils import content_hash
+from ondalear.backend.services.model_registry import register_model_family
+
+_logger = logging.getLogger(__name__)
+
+STUB_MODEL_FAMILY = 'stub'
+STUB_MODEL_READING_COMPREHENSION = 'reading_comprehension'
+DEFAULT_OUTPUT_SIZE = 16
+
+class StubReadingComprehensionModel:
+    """Deterministic reading comprehension stub model
+
+    The answer is the passage token selected by the question hash.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def convert_passage(self, text):    # pylint: disable=no-self-use
+        """convert the passage"""
+        return text.split()
+
+    def convert_model_input(self, model_input, passage=None):
+        """convert the model input"""
+        if passage is None:
+            passage = self.convert_passage(model_input['text_reference'])
+        return dict(passage_tokens=passage,
+                    question_tokens=model_input['text_auxiliary'].split())
+
+    def analyze(self, model_input, model_params):   # pylint: disable=no-self-use
+        """analyze the native model input"""
+        params = (model_params or dict()).get('params') or dict()
+        latency = params.get('latency', 0)
+        output_size = params.get('output_size', DEFAULT_OUTPUT_SIZE)
+        if latency:
+            time.sleep(latency)
+
+        passage = model_input['passage_tokens']
+        question = model_input['question_tokens']
+        index = int(content_hash(' '.join(question)), 16) % len(passage) if passage else 0
+        probs = [round(1.0 / (1 + abs(position - index)), 6)
+                 for position in range(len(passage))]
+        return dict(best_span=[index, index],
+                    best_span_str=passage[index] if passage else '',
+                    span_start_probs=probs,
+                    span_end_probs=probs,
+                    passage_question_attention=[0.0] * output_size,
+                    passage_tokens=passage,
+                    question_tokens=question)
+
+    def analyze_batch(self, model_inputs, model_params):
+        """analyze a list of native model inputs"""
+        return [self.analyze(model_input, model_params) for model_input in model_inputs]
+
+
+_stub_models = {
+    STUB_MODEL_READING_COMPREHENSION: StubReadingComprehensionModel
+}
+
+def load_stub_model(name):
+    """load a stub model"""
+    try:
+        return _stub_models[name](name)
+    except KeyError:
+        raise ValueError('unknown stub model {}'.format(name))
+
+
+def register_stub_models():
+    """register the stub model family"""
+    _logger.info('registering the %s model family', STUB_MODEL_FAMILY)
+    register_model_family(STUB_MODEL_FAMILY, load_stub_model)
@@ -5,15 +5,43 @@
 """
 import os
 import logging
+import threading
+from collections import OrderedDict
 from overrides import overrides
+from django.conf import settings
+from django.db import transaction
+from django.db.models import signals
+from django.dispatch import receiver
 
 from ondalear.backend.docmgmt.models import (AuxiliaryDocument,
                                              DocumentAssociation,
                                              ReferenceDocument)
 from ondalear.analytics import initialize_allennlp, find_model, MODEL_FAMILY, MODEL_NAME
-from ondalear.backend.analytics.models import AnalysisResults
-from ondalear.backend.services.base import register, AbstractService, ServiceException
-from ondalear.backend.services.cache import AnalysisResultsCache
+from ondalear.backend.analytics.models import AnalysisJob, AnalysisResults
+from ondalear.backend.services import chunking
+from ondalear.backend.services.admission import AdmissionController
+from ondalear.backend.services.base import find, register, AbstractService, ServiceException
+from ondalear.backend.services.cache import (AnalysisResultsCache,
+                                             analysis_cache_key,
+                                             analysis_model_key)
+from ondalear.backend.services.cache_snapshot import CacheSnapshots, SNAPSHOT_FILE_NAME
+from ondalear.backend.services.coalescing import SingleFlight
+from ondalear.backend.services.executors import create_executor
+from ondalear.backend.services.jobs import AnalysisJobExecutor, job_request
+from ondalear.backend.services.metrics import (AnalysisMetrics,
+                                               StageTimings,
+                                               STAGE_CACHE,
+                                               STAGE_FETCH_DOCUMENTS,
+                                               STAGE_GET_TEXT,
+                                               STAGE_INFERENCE,
+                                               STAGE_SAVE_RESULTS,
+                                               STAGE_SAVED_RESULTS,
+                                               STAGE_TOTAL)
+from ondalear.backend.services.model_registry import (ModelRegistry,
+                                                      is_local_model_family,
+                                                      model_loader)
+from ondalear.backend.services.passages import PassageCache
+from ondalear.backend.services.stub_models import register_stub_models
 
 _logger = logging.getLogger(__name__)
 
@@ -23,52 +51,252 @@ ALLENNLP_CONFIG_FILE_NAME = 'config_allennlp.json'
 
 # pylint: disable=no-member,no-self-use
 
+def model_label(model_descriptor):
+    """return the model label used in metrics"""
+    return '{}/{}'.format(model_descriptor[MODEL_FAMILY], model_descriptor[MODEL_NAME])
+
+def cache_documents(doc_assoc):
+    """return the ids of the documents a cache entry depends on"""
+    if doc_assoc is None:
+        return None
+    return (doc_assoc.from_document_id, doc_assoc.to_document_id)
+
 class TextAnalyticsService(AbstractService):
     """Text analytics service"""
 
     def __init__(self, name):
         super().__init__(name)
         self.cache = AnalysisResultsCache()
+        self.cache_snapshots = None
+        if settings.ANALYTICS_CACHE_SNAPSHOT:
+            # restored before the service handles its first request
+            self.cache_snapshots = CacheSnapshots(
+                self.cache, os.path.join(settings.CACHE_DIR, SNAPSHOT_FILE_NAME),
+                settings.ANALYTICS_CACHE_SNAPSHOT_INTERVAL,
+                settings.ANALYTICS_CACHE_SNAPSHOT_MAX_ENTRIES)
+            self.cache_snapshots.start()
+        self.job_executor = AnalysisJobExecutor(self, settings.ANALYTICS_JOB_WORKERS)
+        self.models = ModelRegistry(model_loader(find_model),
+                                    settings.ANALYTICS_MODEL_MEMORY_BUDGET)
+        self.passages = PassageCache()
+        self.executor = create_executor(self)
+        self.single_flight = SingleFlight(settings.ANALYTICS_COALESCING_TIMEOUT)
+        self.metrics = AnalysisMetrics()
+        self.admission = AdmissionController(settings.ANALYTICS_ADMISSION_MAX_IN_FLIGHT,
+                                             settings.ANALYTICS_ADMISSION_MAX_CLIENT_IN_FLIGHT,
+                                             settings.ANALYTICS_ADMISSION_MAX_QUEUE,
+                                             settings.ANALYTICS_ADMISSION_QUEUE_TIMEOUT)
+        self.initialize_lock = threading.Lock()
+        self.ready = False
+
+    def allennlp_config_file_path(self):
+        """return the allennlp config file path"""
+        return os.environ.get(ALLENNLP_CONFIG_FILE_PATH,
+                              self.config_file_path(ALLENNLP_CONFIG_FILE_NAME))
 
     @overrides
     def initialize(self):
-        if not self.is_initialized():
-            _logger.info('initializing allennlp')
-            config_file_path = os.environ.get(ALLENNLP_CONFIG_FILE_PATH,
-                                              self.config_file_path(ALLENNLP_CONFIG_FILE_NAME))
-            initialize_allennlp(config_file_path)
-            self.initialized = True
-            _logger.info('initialized allennlp')
-
-    def _check_cache(self, processing_instructions, username):
+        # concurrent first requests initialize allennlp once
+        with self.initialize_lock:
+            if not self.is_initialized():
+                _logger.info('initializing allennlp')
+                initialize_allennlp(self.allennlp_config_file_path())
+                self.initialized = True
+                _logger.info('initialized allennlp')
+
+    def warm_up(self):
+        """load the configured models ahead of the first request"""
+        self.executor.warm_up(settings.ANALYTICS_PRELOAD_MODELS)
+        self.ready = True
+        _logger.info('text analytics service is ready')
+
+    def is_ready(self):
+        """return True once the service has been warmed up, or if warm up is disabled"""
+        return self.ready or not settings.ANALYTICS_WARM_UP
+
+    def stats(self):
+        """return the service statistics"""
+        return dict(admission=self.admission.stats(),
+                    cache=self.cache.stats(),
+                    coalescing=self.single_flight.stats(),
+                    models=self.models.stats(),
+                    passages=self.passages.stats(),
+                    latency=self.metrics.summary())
+
+    def use_model(self, model_descriptor):
+        """return a context holding the model in use, loading it if required"""
+        if not (self.is_initialized() or is_local_model_family(model_descriptor[MODEL_FAMILY])):
+            self.initialize()
+        return self.models.use(model_descriptor[MODEL_FAMILY], model_descriptor[MODEL_NAME])
+
+    def _check_cache(self, request_context, model_input, documents=None):
         """check cache settings"""
+        processing_instructions = request_context['processing_instructions']
         use_cache = processing_instructions.get('use_cache')
         force_analysis = processing_instructions.get('force_analysis')
-        cache_key = None
+        cache_key = analysis_cache_key(request_context['client'].id,
+                                       request_context['model_descriptor'],
+                                       request_context['model_params'],
+                                       model_input)
         results = None
+        instance = None
         if use_cache and not force_analysis:
-            cache_key = '{}:{}'.format(username, processing_instructions['analysis_name'])
             results = self.cache.find(cache_key)
+            if results is None:
+                # fall back on results persisted for the same input
+                instance = self._find_saved_results(request_context, input_key=cache_key)
+                if instance:
+                    results = instance.output
+                    self.cache.add(cache_key, results, documents)
 
-        return use_cache, cache_key, results
+        return use_cache, cache_key, results, instance
 
-    def _build_model_input(self, model_input):
-        """build model input"""
+    def _find_saved_results(self, request_context, doc_assoc=None, input_key=None):
+        """find results previously saved for the same model, params, and input
+
+        Results saved for a document association are stale if any of its
+        documents has changed since the analysis.
+        """
+        model_key = analysis_model_key(request_context['model_descriptor'],
+                                       request_context['model_params'])
+        qs = AnalysisResults.objects.filter(client=request_context['client'],
+                                            model_key=model_key)
+        if doc_assoc:
+            qs = qs.filter(documents=doc_assoc)
+        else:
+            qs = qs.filter(input_key=input_key)
+        instance = qs.select_related(
+            'documents__from_document', 'documents__to_document').order_by(
+                '-creation_time').first()
 
+        if instance and instance.is_stale():
+            _logger.info('AnalysisResults %s is stale', instance.id)
+            instance = None
+        if instance:
+            _logger.info('reusing AnalysisResults %s', instance.id)
+        return instance
+
+    def _fetch_document_association(self, model_input):
+        """fetch the document association if required"""
         resource_id = model_input.get('resource_id')
         doc_assoc = None
         if resource_id:
             _logger.info('fetching DocumentAssociation resource %s from db',
                          resource_id)
-            doc_assoc = DocumentAssociation.objects.get(pk=resource_id)
-            ref_doc = ReferenceDocument.objects.get(pk=doc_assoc.from_document.id)
-            aux_doc = AuxiliaryDocument.objects.get(pk=doc_assoc.to_document.id)
-            model_input = dict(text_reference=ref_doc.get_text(),
-                               text_auxiliary=aux_doc.get_text())
-        return model_input, doc_assoc
+            doc_assoc = DocumentAssociation.objects.select_related(
+                'from_document', 'to_document').get(pk=resource_id)
+        return doc_assoc
+
+    def _build_model_input(self, model_input, doc_assoc, timings):
+        """build model input"""
+        if doc_assoc:
+            with timings.span(STAGE_FETCH_DOCUMENTS):
+                ref_doc = ReferenceDocument.objects.get(pk=doc_assoc.from_document_id)
+                aux_doc = AuxiliaryDocument.objects.get(pk=doc_assoc.to_document_id)
+            with timings.span(STAGE_GET_TEXT):
+                model_input = dict(text_reference=ref_doc.get_text(),
+                                   text_auxiliary=aux_doc.get_text())
+        return model_input
+
+    def _build_batch_model_input(self, items, client):
+        """build model input for a batch of items
+
+        Associations and derived documents are fetched using set based queries,
+        irrespective of the number of items.
+        Returns a list of (model_input, error) pairs in item order.
+        """
+        resource_ids = {item['resource_id'] for item in items if item.get('resource_id')}
+        doc_assocs, ref_docs, aux_docs = dict(), dict(), dict()
+        if resource_ids:
+            _logger.info('fetching %s DocumentAssociation resources from db', len(resource_ids))
+            doc_assocs = DocumentAssociation.objects.filter(client=client).in_bulk(resource_ids)
+            ref_docs = ReferenceDocument.objects.in_bulk(
+                {doc_assoc.from_document_id for doc_assoc in doc_assocs.values()})
+            aux_docs = AuxiliaryDocument.objects.in_bulk(
+                {doc_assoc.to_document_id for doc_assoc in doc_assocs.values()})
+
+        model_inputs = []
+        for item in items:
+            resource_id = item.get('resource_id')
+            if not resource_id:
+                model_inputs.append((dict(text_reference=item['text_reference'],
+                                          text_auxiliary=item['text_auxiliary']), None))
+                continue
+            doc_assoc = doc_assocs.get(resource_id)
+            ref_doc = ref_docs.get(doc_assoc.from_document_id) if doc_assoc else None
+            aux_doc = aux_docs.get(doc_assoc.to_document_id) if doc_assoc else None
+            if ref_doc is None or aux_doc is None:
+                error = 'DocumentAssociation resource {} not found'.format(resource_id)
+                model_inputs.append((None, error))
+                continue
+            model_inputs.append((dict(text_reference=ref_doc.get_text(),
+                                      text_auxiliary=aux_doc.get_text()), None))
+        return model_inputs
+
+    def _analyze_inputs(self, model_descriptor, model_inputs, model_params,  # pylint: disable=too-many-arguments,too-many-locals
+                        timings=None, chunk_scope=None):
+        """perform the analysis for a list of model inputs
+
+        Long reference texts are split into windows or chunks as per the
+        model params, all the windows being analyzed as one batch.  Chunk
+        results are cached under the *chunk_scope* client id if given, so
+        that the unchanged chunks of an edited text are not analyzed again.
+        Returns a list of (model_output, error) pairs in input order.
+        """
+        windowing, model_params = chunking.window_params(model_params)
+        windows = []
+        for position, model_input in enumerate(model_inputs):
+            for offset, text in chunking.split_reference(model_input[chunking.TEXT_REFERENCE],
+                                                         **windowing):
+                windows.append((position, offset, text,
+                                dict(model_input, **{chunking.TEXT_REFERENCE: text})))
+
+        chunk_keys = [None] * len(windows)
+        if chunk_scope is not None and windowing.get(chunking.CHUNK_SIZE):
+            chunk_keys = [analysis_cache_key(chunk_scope, model_descriptor, model_params, window[3])
+                          for window in windows]
+        window_outputs = [(self.cache.find(key), None) if key else (None, None)
+                          for key in chunk_keys]
+        pending = [index for index, (model_output, _) in enumerate(window_outputs)
+                   if model_output is None]
+        if len(pending) < len(windows):
+            _logger.info('reusing the analysis of %s of %s chunks',
+                         len(windows) - len(pending), len(windows))
+
+        if pending:
+            outputs = self.executor.analyze(model_descriptor,
+                                            [windows[index][3] for index in pending],
+                                            model_params, timings)
+            # the model was found
+            self.metrics.register(model_label(model_descriptor))
+            for index, (model_output, error) in zip(pending, outputs):
+                window_outputs[index] = (model_output, error)
+                if chunk_keys[index] and not error:
+                    self.cache.add(chunk_keys[index], model_output)
+
+        window_results = [[] for _ in model_inputs]
+        for (position, offset, text, _), (model_output, error) in zip(windows, window_outputs):
+            window_results[position].append((offset, text, model_output, error))
+        return [chunking.merge_outputs(results) for results in window_results]
+
+    def _analyze_group(self, model_descriptor, group, model_params, chunk_scope=None):  # pylint: disable=broad-except
+        """perform the analysis for items sharing a model descriptor
+
+        Returns a dict of (model_output, error) pairs keyed by item index.
+        """
+        try:
+            model_outputs = self._analyze_inputs(model_descriptor,
+                                                 [model_input for _, model_input in group],
+                                                 model_params,
+                                                 chunk_scope=chunk_scope)
+        except Exception as ex:
+            _logger.exception('failed to analyze items with model %s', model_descriptor)
+            return {index: (None, str(ex)) for index, _ in group}
+
+        return {index: result for (index, _), result in zip(group, model_outputs)}
 
     def _save_results(self, request_context, processing_instructions,  # pylint: disable=too-many-arguments
-                      model_input, model_output, doc_assoc):
+                      model_input, model_output, doc_assoc, cache_key):
         instance = None
         if processing_instructions['save_results']:
             # check if user has rights to save
@@ -79,9 +307,12 @@ class TextAnalyticsService(AbstractService):
                 raise ServiceException(msg.format(user.username))
 
             instance = AnalysisResults(
-                input=dict(model_input),
+                input=AnalysisResults.compact_input(model_input, doc_assoc),
                 output=model_output,
                 documents=doc_assoc,
+                model_key=analysis_model_key(request_context['model_descriptor'],
+                                             request_context['model_params']),
+                input_key=cache_key,
                 name=processing_instructions['analysis_name'],
                 description=processing_instructions['analysis_description'],
                 site=request_context['site'],
@@ -93,7 +324,20 @@ class TextAnalyticsService(AbstractService):
 
         return instance
 
-    def analyze(self, request_context):    # pylint: disable=too-many-locals
+    def analyze(self, request_context):
+        """perform an analysis
+
+        The stage timings are recorded in the request context *timings* if
+        provided, and aggregated into the service latency metrics.
+        """
+        timings = request_context.get('timings') or StageTimings()
+        try:
+            with timings.span(STAGE_TOTAL):
+                return self._analyze(request_context, timings)
+        finally:
+            self.metrics.record(model_label(request_context['model_descriptor']), timings)
+
+    def _analyze(self, request_context, timings):    # pylint: disable=too-many-locals
         """perform an analysis"""
         model_descriptor = request_context['model_descriptor']
         model_params = request_context['model_params']
@@ -103,37 +347,202 @@ class TextAnalyticsService(AbstractService):
 
         _logger.info('analysis request; user: %s model_descriptor: %s model_parms: %s',
                      username, model_descriptor, model_params)
-        # initialize the service
-        if not self.is_initialized():
-            self.initialize()
+
+        # reuse results saved for the same documents if still valid
+        with timings.span(STAGE_FETCH_DOCUMENTS):
+            doc_assoc = self._fetch_document_association(model_input)
+        if (doc_assoc and processing_instructions.get('use_cache') and
+                not processing_instructions.get('force_analysis')):
+            with timings.span(STAGE_SAVED_RESULTS):
+                instance = self._find_saved_results(request_context, doc_assoc=doc_assoc)
+            if instance:
+                return instance.output, instance
+
+        # fetch the input data from the db if required
+        model_input = self._build_model_input(model_input, doc_assoc, timings)
+        documents = cache_documents(doc_assoc)
 
         # check cache processing
-        use_cache, cache_key, results = self._check_cache(processing_instructions, username)
+        with timings.span(STAGE_CACHE):
+            use_cache, cache_key, results, instance = self._check_cache(request_context,
+                                                                        model_input,
+                                                                        documents)
         if results:
-            return results
+            return results, instance
 
-        # find the model
-        model = find_model(family=model_descriptor[MODEL_FAMILY],
-                           name=model_descriptor[MODEL_NAME])
+        # perform the analysis, coalescing concurrent requests for the same input;
+        # a forced analysis runs afresh rather than joining one in flight
+        force_analysis = processing_instructions.get('force_analysis')
+        chunk_scope = request_context['client'].id if use_cache and not force_analysis else None
+        analyze_input = lambda: self._analyze_inputs(model_descriptor, [model_input],
+                                                     model_params, timings, chunk_scope)
+        with timings.span(STAGE_INFERENCE):
+            if force_analysis:
+                [(model_output, error)] = analyze_input()
+            else:
+                [(model_output, error)] = self.single_flight.run(cache_key, analyze_input)
+        if error:
+            raise ServiceException(error)
+
+        # update the cache
+        if use_cache:
+            self.cache.add(cache_key, model_output, documents)
+
+        # save the results
+        with timings.span(STAGE_SAVE_RESULTS):
+            instance = self._save_results(request_context, processing_instructions,
+                                          model_input, model_output, doc_assoc, cache_key)
+
+        return model_output, instance
+
+    def analyze_batch(self, request_context):
+        """perform an analysis for a batch of items
+
+        Items are grouped by model descriptor, each group being analyzed
+        using the model batch prediction path.
+        Returns a list of results in item order, each holding either the
+        model output or the error encountered.
+        """
+        default_model_descriptor = request_context['model_descriptor']
+        model_params = request_context['model_params']
+        items = request_context['items']
+
+        _logger.info('batch analysis request; user: %s items: %s model_descriptor: %s',
+                     request_context['user'].username, len(items), default_model_descriptor)
 
         # fetch the input data from the db if required
-        model_input, doc_assoc = self._build_model_input(model_input)
+        model_inputs = self._build_batch_model_input(items, request_context['client'])
+
+        # group the items by model descriptor
+        results = [(None, error) for _, error in model_inputs]
+        groups = OrderedDict()
+        for index, (item, (model_input, error)) in enumerate(zip(items, model_inputs)):
+            if error:
+                continue
+            model_descriptor = item.get('model_descriptor') or default_model_descriptor
+            key = (model_descriptor[MODEL_FAMILY], model_descriptor[MODEL_NAME])
+            groups.setdefault(key, (model_descriptor, []))[1].append((index, model_input))
+
+        # perform the analysis per group
+        for model_descriptor, group in groups.values():
+            group_results = self._analyze_group(model_descriptor, group, model_params,
+                                                request_context['client'].id)
+            for index, result in group_results.items():
+                results[index] = result
+
+        return [dict(index=index, model_output=model_output, error=error)
+                for index, (model_output, error) in enumerate(results)]
+
+    def _build_questions_model_input(self, reference, questions, client):
+        """build model input for questions asked against one reference
+
+        The reference text is read once, and the auxiliary documents are
+        fetched using a single query.  Raises ObjectDoesNotExist if the
+        reference document is not found.
+        Returns a list of (model_input, error) pairs in question order.
+        """
+        text_reference = reference.get('text_reference')
+        if text_reference is None:
+            ref_doc = ReferenceDocument.objects.get(pk=reference['reference_id'],
+                                                    document__client=client)
+            text_reference = ref_doc.get_text()
 
-        # convert the model input to native model format
-        native_model_input = model.convert_model_input(model_input)
+        auxiliary_ids = {question['auxiliary_id'] for question in questions
+                         if question.get('auxiliary_id')}
+        aux_docs = dict()
+        if auxiliary_ids:
+            aux_docs = AuxiliaryDocument.objects.filter(
+                document__client=client).in_bulk(auxiliary_ids)
+
+        model_inputs = []
+        for question in questions:
+            text_auxiliary = question.get('text_auxiliary')
+            if text_auxiliary is None:
+                aux_doc = aux_docs.get(question['auxiliary_id'])
+                if aux_doc is None:
+                    error = 'AuxiliaryDocument resource {} not found'.format(
+                        question['auxiliary_id'])
+                    model_inputs.append((None, error))
+                    continue
+                text_auxiliary = aux_doc.get_text()
+            model_inputs.append((dict(text_reference=text_reference,
+                                      text_auxiliary=text_auxiliary), None))
+        return model_inputs
+
+    def analyze_questions(self, request_context):
+        """perform an analysis for questions asked against one reference
+
+        The questions are analyzed as one batch, the reference passage being
+        converted once when supported by the model, i.e. not by the AllenNLP
+        models.
+        Returns a list of results in question order, each holding either the
+        model output or the error encountered.
+        """
+        model_descriptor = request_context['model_descriptor']
+        questions = request_context['questions']
+
+        _logger.info('questions analysis request; user: %s questions: %s model_descriptor: %s',
+                     request_context['user'].username, len(questions), model_descriptor)
+
+        # fetch the input data from the db if required
+        model_inputs = self._build_questions_model_input(request_context['reference'],
+                                                         questions,
+                                                         request_context['client'])
 
         # perform the analysis
-        model_output = model.analyze(model_input=native_model_input, model_params=model_params)
+        results = [(None, error) for _, error in model_inputs]
+        group = [(index, model_input) for index, (model_input, error) in enumerate(model_inputs)
+                 if not error]
+        if group:
+            group_results = self._analyze_group(model_descriptor, group,
+                                                request_context['model_params'],
+                                                request_context['client'].id)
+            for index, result in group_results.items():
+                results[index] = result
 
-        # update the cache
-        if use_cache:
-            self.cache.add(cache_key, model_output)
+        return [dict(index=index, model_output=model_output, error=error)
+                for index, (model_output, error) in enumerate(results)]
 
-        # save the results
-        instance = self._save_results(request_context, processing_instructions,
-                                      model_input, model_output, doc_assoc)
+    def submit(self, request_context):
+        """submit an analysis for asynchronous processing"""
+        user = request_context['user']
+        processing_instructions = request_context['processing_instructions']
+        job = AnalysisJob(
+            name=processing_instructions.get('analysis_name'),
+            request=job_request(request_context),
+            site=request_context['site'],
+            client=request_context['client'],
+            creation_user=user,
+            effective_user=user,
+            update_user=user)
+        job.save()
+        _logger.info('analysis job %s created; user: %s', job.id, user.username)
 
+        # the job has to be visible to the worker before it is processed
+        transaction.on_commit(lambda: self.job_executor.submit(job.id))
+        return job
 
-        return model_output, instance
+if settings.ANALYTICS_STUB_MODELS:
+    register_stub_models()
 
 register(TEXT_ANALYTICS_SERVICE, TextAnalyticsService(TEXT_ANALYTICS_SERVICE))
+
+# Cached results are evicted when their documents change.  The receivers
+# are connected when the service is loaded; a change made in a process not
+# running the service leaves shared entries until they expire, which is
+# safe as entries are keyed by content and are never served stale.
+
+@receiver(signals.post_save, sender=ReferenceDocument, dispatch_uid='cache_reference')
+@receiver(signals.post_delete, sender=ReferenceDocument, dispatch_uid='cache_reference')
+@receiver(signals.post_save, sender=AuxiliaryDocument, dispatch_uid='cache_auxiliary')
+@receiver(signals.post_delete, sender=AuxiliaryDocument, dispatch_uid='cache_auxiliary')
+def invalidate_derived_document(sender, instance, **kwargs):   # pylint: disable=unused-argument
+    """evict the cached results of a changed derived document"""
+    find(TEXT_ANALYTICS_SERVICE).cache.invalidate([instance.document_id])
+
+
+@receiver(signals.post_save, sender=DocumentAssociation, dispatch_uid='cache_association')
+@receiver(signals.post_delete, sender=DocumentAssociation, dispatch_uid='cache_association')
+def invalidate_document_association(sender, instance, **kwargs):   # pylint: disable=unused-argument
+    """evict the cached results of a changed document association"""
+    find(TEXT_ANALYTICS_SERVICE).cache.invalidate(cache_documents(instance))
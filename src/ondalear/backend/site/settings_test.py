@@ -8,3 +8,6 @@ from ondalear.backend.site.settings import *  # @UnusedWildImport
 
 # disable throttling during unit tests
 REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = tuple()
+
+# deterministic models for analytics tests
+ANALYTICS_STUB_MODELS = True
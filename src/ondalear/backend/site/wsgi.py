@@ -11,9 +11,20 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 """
 
 import os
+import threading
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ondalear.backend.site.settings')
 
 application = get_wsgi_application()
+
+if settings.ANALYTICS_WARM_UP or settings.ANALYTICS_CACHE_SNAPSHOT:
+    # creating the service restores the cache snapshot before serving requests
+    from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE  # pylint: disable=wrong-import-position
+
+if settings.ANALYTICS_WARM_UP:
+    # load the models in the background; readiness is reported by the service
+    threading.Thread(target=find(TEXT_ANALYTICS_SERVICE).warm_up,
+                     name='analytics-warm-up', daemon=True).start()
@@ -8,7 +8,7 @@ Note: Factory Meta inheritance does not appear to work consistently
 
 import factory
 
-from ondalear.backend.analytics.models import AnalysisResults
+from ondalear.backend.analytics.models import AnalysisJob, AnalysisResults
 from ondalear.backend.tests.base_factories import AbstractModelFactory
 from ondalear.backend.tests.docmgmt.models.factories import ClientModelFactory
 
@@ -26,4 +26,19 @@ class AnalysisResultsModelFactory(AbstractModelFactory):
         abstract = False
         model = AnalysisResults
         django_get_or_create = ('client', 'name')
-       
\ No newline at end of file
+
+
+class AnalysisJobModelFactory(AbstractModelFactory):
+    """Analysis job model factory class"""
+    client = factory.SubFactory(ClientModelFactory)
+    name = 'analysis job'
+    request = dict()
+    output = None
+    results = None
+
+
+    class Meta:
+        """Model meta class."""
+        abstract = False
+        model = AnalysisJob
+        django_get_or_create = ('client', 'name')
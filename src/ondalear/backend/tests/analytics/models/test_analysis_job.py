@@ -0,0 +1,175 @@
+"""
+.. module:: ondalear.backend.tests.analytics.models.test_analysis_job
+   :synopsis: Analysis job  model unit test module.
+
+
+"""
+import logging
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+
+from ondalear.backend.core.python.utils import utc_now
+from ondalear.backend.analytics.models import AnalysisJob, constants
+from ondalear.backend.services.jobs import AnalysisJobExecutor, INTERRUPTED_JOB_ERROR
+from ondalear.backend.tests.base_models import AbstractModelTestCase
+from . import factories
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=no-member,no-self-use,missing-docstring
+
+
+class FailingService:
+    """Text analytics service stub failing every analysis"""
+
+    def analyze(self, request_context):
+        raise ValueError('analysis failed')
+
+
+class RecoveredService:
+    """Text analytics service stub whose job is recovered while it runs"""
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def analyze(self, request_context):
+        self.executor.recover(stale_after=0)
+        return dict(result='late output'), None
+
+
+class AnalysisJobCRUDTests(AbstractModelTestCase):
+    """Analysis job  lifecycle test case"""
+
+    def test_crud(self):
+        # expect to create, update, fetch, and delete analysis job
+
+        # create instance
+        request = dict(model_input=dict(text_reference='some passage',
+                                        text_auxiliary='some question'),
+                       model_params=dict())
+        instance = factories.AnalysisJobModelFactory(name='my job', request=request)
+
+        # verify it was saved
+        assert instance.id
+        self.assertEqual(instance.status, constants.JOB_STATUS_PENDING)
+        self.assertFalse(instance.is_done())
+
+        # fetch the instance
+        fetched = AnalysisJob.objects.get(pk=instance.id)
+        self.assertEqual(fetched.request, request)
+
+        # update the instance
+        model_output = dict(result=[1.95, 2.95, 3.95])
+        instance.status = constants.JOB_STATUS_COMPLETED
+        instance.output = model_output
+        instance.save()
+
+        # verify update
+        fetched = AnalysisJob.objects.get(pk=instance.id)
+        self.assertEqual(fetched.output, model_output)
+        self.assertTrue(fetched.is_done())
+
+        # delete the instance
+        deleted = instance.delete()
+        self.assertEqual(deleted[0], 1)
+
+
+class AnalysisJobRecoveryTests(AbstractModelTestCase):
+    """Analysis job recovery test case"""
+
+    def test_recover(self):
+        # expect running jobs to fail, and pending jobs to be returned for processing
+        running = factories.AnalysisJobModelFactory(name='running job',
+                                                    status=constants.JOB_STATUS_RUNNING,
+                                                    start_time=utc_now())
+        pending = factories.AnalysisJobModelFactory(name='pending job')
+        completed = factories.AnalysisJobModelFactory(name='completed job',
+                                                      status=constants.JOB_STATUS_COMPLETED)
+
+        executor = AnalysisJobExecutor(service=None, max_workers=1)
+
+        # recent running jobs are left alone
+        failed, job_ids = executor.recover(stale_after=3600)
+        self.assertEqual(failed, 0)
+        self.assertEqual(job_ids, [pending.id])
+
+        failed, job_ids = executor.recover()
+        self.assertEqual(failed, 0)
+
+        failed, job_ids = executor.recover(stale_after=0)
+        self.assertEqual(failed, 1)
+        self.assertEqual(job_ids, [pending.id])
+
+        fetched = AnalysisJob.objects.get(pk=running.id)
+        self.assertEqual(fetched.status, constants.JOB_STATUS_FAILED)
+        self.assertEqual(fetched.error, INTERRUPTED_JOB_ERROR)
+        self.assertIsNotNone(fetched.end_time)
+        self.assertEqual(AnalysisJob.objects.get(pk=completed.id).status,
+                         constants.JOB_STATUS_COMPLETED)
+
+        # a job is claimed once only
+        self.assertTrue(executor.claim(pending.id))
+        self.assertFalse(executor.claim(pending.id))
+        self.assertEqual(AnalysisJob.objects.get(pk=pending.id).status,
+                         constants.JOB_STATUS_RUNNING)
+
+    def test_run_failure(self):
+        # expect a failing analysis to fail the job
+        job = factories.AnalysisJobModelFactory(name='failing job')
+        executor = AnalysisJobExecutor(service=FailingService(), max_workers=1)
+
+        executor.run(job.id)
+
+        fetched = AnalysisJob.objects.get(pk=job.id)
+        self.assertEqual(fetched.status, constants.JOB_STATUS_FAILED)
+        self.assertEqual(fetched.error, 'analysis failed')
+        self.assertIsNotNone(fetched.end_time)
+
+    def test_run_recovered(self):
+        # expect a job failed by recovery while running to stay failed
+        job = factories.AnalysisJobModelFactory(name='recovered job')
+        executor = AnalysisJobExecutor(service=None, max_workers=1)
+        executor.service = RecoveredService(executor)
+
+        executor.run(job.id)
+
+        fetched = AnalysisJob.objects.get(pk=job.id)
+        self.assertEqual(fetched.status, constants.JOB_STATUS_FAILED)
+        self.assertEqual(fetched.error, INTERRUPTED_JOB_ERROR)
+        self.assertIsNone(fetched.output)
+
+
+class RecoverAnalysisJobsCommandTests(AbstractModelTestCase):
+    """Recover analysis jobs command test case"""
+
+    def test_command(self):
+        # expect only the stale running jobs to fail
+        stale_time = utc_now() - timedelta(seconds=settings.ANALYTICS_JOB_STALE_AFTER + 1)
+        stale = factories.AnalysisJobModelFactory(name='stale job',
+                                                  status=constants.JOB_STATUS_RUNNING,
+                                                  start_time=stale_time)
+        running = factories.AnalysisJobModelFactory(name='running job',
+                                                    status=constants.JOB_STATUS_RUNNING,
+                                                    start_time=utc_now())
+        pending = factories.AnalysisJobModelFactory(name='pending job')
+
+        out = StringIO()
+        call_command('recover_analysis_jobs', no_requeue=True, stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'failed: 1 requeued: 0')
+        self.assertEqual(AnalysisJob.objects.get(pk=stale.id).status,
+                         constants.JOB_STATUS_FAILED)
+        self.assertEqual(AnalysisJob.objects.get(pk=running.id).status,
+                         constants.JOB_STATUS_RUNNING)
+        self.assertEqual(AnalysisJob.objects.get(pk=pending.id).status,
+                         constants.JOB_STATUS_PENDING)
+
+        out = StringIO()
+        call_command('recover_analysis_jobs', stale_after=0, no_requeue=True, stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'failed: 1 requeued: 0')
+        self.assertEqual(AnalysisJob.objects.get(pk=running.id).status,
+                         constants.JOB_STATUS_FAILED)
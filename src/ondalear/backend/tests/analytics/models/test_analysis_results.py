@@ -9,8 +9,10 @@ import logging
 from ondalear.backend.analytics.models import AnalysisResults
 from ondalear.backend.tests.docmgmt.models.test_document import DocumentCRUDMixin
 from ondalear.backend.tests.base_models import AbstractModelTestCase
-from ondalear.backend.tests.docmgmt.models.factories import (DocumentAssociationModelFactory,
-                                                             DocumentModelFactory,)
+from ondalear.backend.tests.docmgmt.models.factories import (AuxiliaryDocumentModelFactory,
+                                                             DocumentAssociationModelFactory,
+                                                             DocumentModelFactory,
+                                                             ReferenceDocumentModelFactory)
 from . import factories
 
 _logger = logging.getLogger(__name__)
@@ -68,3 +70,62 @@ class AnalysisResultsCRUDTests(DocumentCRUDMixin, AbstractModelTestCase):
         # delete the to document instance
         deleted = to_document.delete()
         assert deleted[0] == 1
+
+    def test_is_stale(self):
+        # expect results to become stale when an associated document changes
+        (_,
+         to_document,
+         from_document,
+         document_association) = self.assert_doc_to_doc_association()
+        instance = factories.AnalysisResultsModelFactory(name='my results',
+                                                         description='my results description',
+                                                         input=dict(passage='some passage'),
+                                                         output=dict(result=[1.95]),
+                                                         documents=document_association)
+        self.assertFalse(instance.is_stale())
+
+        # update the document
+        from_document.title = 'new title'
+        from_document.save()
+
+        instance = AnalysisResults.objects.get(pk=instance.id)
+        self.assertTrue(instance.is_stale())
+
+        from_document.delete()
+        to_document.delete()
+
+
+    def test_compact_input(self):
+        # expect document texts to be saved by reference, and re-hydrated on demand
+        (_,
+         to_document,
+         from_document,
+         document_association) = self.assert_doc_to_doc_association()
+        ref_document = ReferenceDocumentModelFactory(content='some passage',
+                                                     document=from_document)
+        AuxiliaryDocumentModelFactory(content='some question', document=to_document)
+        model_input = dict(text_reference='some passage', text_auxiliary='some question')
+
+        compact = AnalysisResults.compact_input(model_input, document_association)
+        self.assertEqual(compact['resource_id'], document_association.id)
+        self.assertEqual(compact['text_reference']['document_id'], from_document.id)
+        self.assertNotIn('some passage', str(compact))
+        self.assertEqual(AnalysisResults.compact_input(model_input), model_input)
+
+        instance = factories.AnalysisResultsModelFactory(name='my results',
+                                                         input=compact,
+                                                         output=dict(result=[1.95]),
+                                                         documents=document_association)
+        hydrated = instance.hydrated_input()
+        self.assertEqual(hydrated['text_reference']['text'], 'some passage')
+        self.assertFalse(hydrated['text_reference']['content_changed'])
+
+        # update the reference document content
+        ref_document.content = 'some other passage'
+        ref_document.save()
+        hydrated = AnalysisResults.objects.get(pk=instance.id).hydrated_input()
+        self.assertTrue(hydrated['text_reference']['content_changed'])
+        self.assertFalse(hydrated['text_auxiliary']['content_changed'])
+
+        from_document.delete()
+        to_document.delete()
@@ -5,7 +5,10 @@
 
 """
 import logging
+import os
+import tempfile
 
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 
@@ -13,9 +16,18 @@ from ondalear.analytics import (ALLENNLP_MODEL_FAMILY,
                                 ALLENNLP_MODEL_BDAF,
                                 ALLENNLP_MODEL_BDAF_NAQNAET,
                                 MODEL_PRIMARY_OUTPUT_KEY)
-from ondalear.backend.docmgmt.models import DocumentAssociation
+from ondalear.backend.docmgmt.models import DocumentAssociation, ReferenceDocument
 from ondalear.backend.docmgmt.models.constants import DOCUMENT_ASSOCIATION_PURPOSE_QUESTION
-from ondalear.backend.analytics.models import AnalysisResults
+from ondalear.backend.analytics.models import AnalysisJob, AnalysisResults, constants
+from ondalear.backend.services import find, TEXT_ANALYTICS_SERVICE
+from ondalear.backend.services.admission import AdmissionController
+from ondalear.backend.services.cache import (analysis_cache_key,
+                                             AnalysisResultsCache,
+                                             LocalCacheBackend)
+from ondalear.backend.services.cache_snapshot import CacheSnapshots
+from ondalear.backend.services.coalescing import InFlightCall
+from ondalear.backend.services.stub_models import (STUB_MODEL_FAMILY,
+                                                   STUB_MODEL_READING_COMPREHENSION)
 from ondalear.backend.tests.docmgmt.models import factories
 from ondalear.backend.tests.api.base import AbstractAPITestCase
 
@@ -116,7 +128,7 @@ class AssociatedDocumenteMixin:
 
 class AbstractAnalyticsTest(AssertMixin, AbstractAPITestCase):
     """Text analytics base test case class"""
-    model_classes = (DocumentAssociation, AnalysisResults)
+    model_classes = (DocumentAssociation, AnalysisResults, AnalysisJob)
     url_name = 'analyze'
 
     @classmethod
@@ -197,6 +209,51 @@ class ReadingComprenhensionBDAFByValueTest(AbstractReadingComphrensionBDAFTest):
                                                        analysis_name='reading_comprehension')
         self.assert_analysis(request_data=request_data)
 
+    def test_by_value_with_shared_caching(self):
+        # Expect identical analyses with different names to share the cache entry
+        request_data = self.analysis_data()
+        for analysis_name in ('reading_comprehension_1', 'reading_comprehension_2'):
+            request_data['processing_instructions'] = dict(use_cache=True,
+                                                           analysis_name=analysis_name)
+            self.assert_analysis(request_data=request_data)
+
+        cache_key = analysis_cache_key(self.ondalear_client.id, self.model_descriptor(),
+                                       dict(), request_data['model_input'])
+        self.assertIsNotNone(find(TEXT_ANALYTICS_SERVICE).cache.find(cache_key))
+
+    def test_by_value_with_windows(self):
+        # Expect to analyze the reference text in windows, mapping the answer offsets back
+        request_data = self.analysis_data()
+        request_data['model_params'] = dict(params=dict(window_size=300, window_stride=150))
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, request_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+
+        detail = response.data['detail']
+        self.assertEqual(detail[MODEL_PRIMARY_OUTPUT_KEY],
+                         self.expected_response()[MODEL_PRIMARY_OUTPUT_KEY])
+        self.assertGreater(detail['window_count'], 1)
+        self.assertEqual(TEXT_REFERENCE[detail['answer_start']:detail['answer_end']],
+                         detail[MODEL_PRIMARY_OUTPUT_KEY])
+
+    def test_by_value_with_invalid_windows(self):
+        # Expect to reject window params without a window size
+        request_data = self.analysis_data()
+        request_data['model_params'] = dict(params=dict(window_stride=150))
+        self.assert_analysis(expected_status=status.HTTP_400_BAD_REQUEST,
+                             request_data=request_data)
+
+    def test_by_value_with_timing(self):
+        # Expect the stage timings to be returned in the response header
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(include_timing=True,
+                                                       analysis_name='reading_comprehension')
+        response = self.assert_analysis(request_data=request_data)
+        timing = response.data['header']['timing']
+        for stage in ('total', 'cache', 'inference'):
+            self.assertIn(stage, timing)
+
     def test_by_value_with_results_saving(self):
         # Expect to execute reading comprehension analysis and save the results
         analysis_name = 'reading_comprehension'
@@ -214,6 +271,33 @@ class ReadingComprenhensionBDAFByValueTest(AbstractReadingComphrensionBDAFTest):
         deleted_count = analysis_results.delete()[0]
         self.assertEqual(deleted_count, 1)
 
+    def test_by_value_async(self):
+        # Expect to accept the analysis request and return the results when polled
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(run_async=True,
+                                                       analysis_name='reading_comprehension')
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, request_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, f'{response.data}')
+        self.assert_response_header(data=response.data['header'],
+                                    msg='Analysis request accepted.')
+        job_id = response.data['detail']['job_id']
+        self.assertEqual(response.data['detail']['status'], constants.JOB_STATUS_PENDING)
+
+        # run the job; worker pool is not triggered within a test transaction
+        find(TEXT_ANALYTICS_SERVICE).job_executor.run(job_id)
+
+        # poll the job status
+        response = self.client.get(reverse('analyze-job', args=[job_id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+        detail = response.data['detail']
+        self.assertEqual(detail['status'], constants.JOB_STATUS_COMPLETED)
+        self.assertIsNone(detail['analysis_results_id'])
+        self.assertEqual(detail['model_output'][MODEL_PRIMARY_OUTPUT_KEY],
+                         self.expected_response()[MODEL_PRIMARY_OUTPUT_KEY])
+        AnalysisJob.objects.get(pk=job_id).delete()
+
 class ReadingComprenhensionBDAFByReferenceTest(AssociatedDocumenteMixin,
                                                AbstractReadingComphrensionBDAFTest):
     """Reading comprehension content by reference test case.
@@ -235,6 +319,72 @@ class ReadingComprenhensionBDAFByReferenceTest(AssociatedDocumenteMixin,
         # Expect to execute reading comprehension analysis.
         self.assert_analysis()
 
+    def test_by_reference_with_saved_results(self):
+        # Expect to reuse the saved results for unchanged documents
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(use_cache=True,
+                                                       save_results=True,
+                                                       analysis_name='reading_comprehension',
+                                                       analysis_description='results save')
+        first = self.assert_analysis(request_data=request_data)
+        second = self.assert_analysis(request_data=request_data)
+        analysis_results_id = first.data['detail']['analysis_results_id']
+        self.assertIsNotNone(analysis_results_id)
+        self.assertEqual(second.data['detail']['analysis_results_id'], analysis_results_id)
+
+        # the input is saved by reference, its text returned on request
+        url = reverse('analysis-results-crud-detail', args=[analysis_results_id])
+        response = self.client.get(url)
+        self.assertEqual(response.data['detail']['input']['resource_id'],
+                         self.doc_association.id)
+        self.assertNotIn('text', response.data['detail']['input']['text_reference'])
+        response = self.client.get(url, {'include_text': 'true'})
+        self.assertEqual(response.data['detail']['input']['text_reference']['text'],
+                         TEXT_REFERENCE)
+
+@override_settings(ANALYTICS_PRECOMPUTE=True,
+                   ANALYTICS_PRECOMPUTE_MODEL=dict(model_family=ALLENNLP_MODEL_FAMILY,
+                                                   model_name=ALLENNLP_MODEL_BDAF))
+class ReadingComprenhensionBDAFPrecomputeTest(AssociatedDocumenteMixin,
+                                              AbstractReadingComphrensionBDAFTest):
+    """Reading comprehension precompute test case.
+
+    The analysis is precomputed when the document association is created
+    """
+    def setUp(self):
+        """setup the test case"""
+        super().setUp()
+        self.do_setup()
+
+    def tearDown(self):
+        """test case down"""
+        self.do_teardown()
+        super().tearDown()
+
+    def test_precompute(self):
+        # Expect the analysis request to return the precomputed results
+        job = AnalysisJob.objects.get(name='precompute:{}'.format(self.doc_association.id))
+        self.assertEqual(job.status, constants.JOB_STATUS_PENDING)
+        find(TEXT_ANALYTICS_SERVICE).job_executor.run(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, constants.JOB_STATUS_COMPLETED)
+
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(use_cache=True,
+                                                       analysis_name='reading_comprehension')
+        response = self.assert_analysis(request_data=request_data)
+        self.assertEqual(response.data['detail']['analysis_results_id'], job.results_id)
+
+    def test_precompute_on_document_change(self):
+        # Expect a document change to submit a new precompute analysis
+        AnalysisJob.objects.all().delete()
+        ref_document = ReferenceDocument.objects.get(pk=self.doc_association.from_document_id)
+        ref_document.content = TEXT_REFERENCE + ' Updated.'
+        ref_document.save()
+        self.assertTrue(AnalysisJob.objects.filter(
+            name='precompute:{}'.format(self.doc_association.id),
+            status=constants.JOB_STATUS_PENDING).exists())
+
 class AbstractReadingComprehensionBDAFNAQNAETTest(AbstractAnalyticsTest):
     """Base class BDAF NAQNAET reading comprehension test case"""
 
@@ -288,3 +438,291 @@ class ReadingComprenhensionBDAFNAETByReferenceTest(AssociatedDocumenteMixin,
     def test_by_reference(self):
         # Expect to execute reading comprehension analysis.
         self.assert_analysis()
+
+
+class ReadingComprenhensionBDAFBatchTest(AssociatedDocumenteMixin,
+                                         AbstractReadingComphrensionBDAFTest):
+    """Reading comprehension batch test case.
+
+    BDAF text data for analysis is passed both by value and by reference
+    """
+    url_name = 'analyze-batch'
+
+    def setUp(self):
+        """setup the test case"""
+        super().setUp()
+        self.do_setup()
+
+    def tearDown(self):
+        """test case down"""
+        self.do_teardown()
+        super().tearDown()
+
+    def analysis_data(self):
+        """return analysis data"""
+        return dict(items=[dict(text_reference=TEXT_REFERENCE, text_auxiliary=TEXT_AUXILIARY),
+                           dict(resource_id=self.doc_association.id),
+                           dict(resource_id=self.doc_association.id + 1000)],
+                    model_descriptor=self.model_descriptor())
+
+    def test_batch(self):
+        # Expect to execute batch reading comprehension analysis, reporting item errors.
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, self.analysis_data(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+        self.assert_response_header(data=response.data['header'],
+                                    msg='Batch analysis request successfully processed.')
+
+        detail = response.data['detail']
+        self.assertEqual([item['index'] for item in detail], [0, 1, 2])
+        for item in detail[:2]:
+            self.assertEqual(item['api_status'], 'OK')
+            self.assertEqual(item['model_output'][MODEL_PRIMARY_OUTPUT_KEY],
+                             self.expected_response()[MODEL_PRIMARY_OUTPUT_KEY])
+        self.assertEqual(detail[2]['api_status'], 'ERROR')
+        self.assertIsNone(detail[2]['model_output'])
+
+
+class AnalysisReadinessTest(AbstractAnalyticsTest):
+    """Analysis readiness test case"""
+    url_name = 'analyze-ready'
+
+    def test_ready(self):
+        # Expect the service to be ready once warmed up.
+        service = find(TEXT_ANALYTICS_SERVICE)
+        with self.settings(ANALYTICS_WARM_UP=True, ANALYTICS_PRELOAD_MODELS=[]):
+            service.ready = False
+            response = self.client.get(reverse(self.url_name))
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertFalse(response.data['detail']['ready'])
+
+            service.warm_up()
+            response = self.client.get(reverse(self.url_name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data['detail']['ready'])
+
+
+class AnalysisMetricsTest(AbstractAnalyticsTest):
+    """Analysis metrics test case"""
+    url_name = 'analyze-metrics'
+
+    def test_metrics(self):
+        # Expect the metrics to be restricted to staff users.
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        try:
+            response = self.client.get(url)
+        finally:
+            self.user.is_staff = False
+            self.user.save()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['detail'].keys()),
+                         ['admission', 'cache', 'coalescing', 'latency', 'models', 'passages'])
+        self.assertIn('entry_sizes', response.data['detail']['cache'])
+
+
+class ReadingComprenhensionStubTest(AbstractAnalyticsTest):
+    """Stub model reading comprehension test case"""
+
+    def expected_response(self):
+        """return expected response"""
+        keys = ['passage_question_attention', 'span_start_probs', 'span_end_probs',
+                'best_span', 'best_span_str', 'question_tokens', 'passage_tokens',
+                'analysis_results_id']
+        return {key: None for key in keys}
+
+    def model_descriptor(self):
+        """return model descriptor"""
+        return dict(model_family=STUB_MODEL_FAMILY,
+                    model_name=STUB_MODEL_READING_COMPREHENSION)
+
+    def analysis_data(self):
+        """return analysis data"""
+        return dict(model_input=dict(text_reference=TEXT_REFERENCE,
+                                     text_auxiliary=TEXT_AUXILIARY),
+                    model_descriptor=self.model_descriptor(),
+                    model_params=dict(params=dict(output_size=8)))
+
+    def test_stub(self):
+        # Expect a deterministic analysis of the requested output size.
+        first = self.assert_analysis().data['detail']
+        second = self.assert_analysis().data['detail']
+        self.assertEqual(first['best_span_str'], second['best_span_str'])
+        self.assertEqual(len(first['passage_question_attention']), 8)
+
+    def test_stub_over_capacity(self):
+        # Expect a request over the client in flight limit to be rejected.
+        service = find(TEXT_ANALYTICS_SERVICE)
+        admission = service.admission
+        service.admission = AdmissionController(max_in_flight=2, max_client_in_flight=1,
+                                                max_queue=1, queue_timeout=0)
+        try:
+            with service.admission.admit(self.ondalear_client.id):
+                response = self.assert_analysis(
+                    expected_status=status.HTTP_429_TOO_MANY_REQUESTS)
+        finally:
+            service.admission = admission
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_stub_force_analysis(self):
+        # Expect a forced analysis not to join an identical analysis in flight.
+        request_data = self.analysis_data()
+        cache_key = analysis_cache_key(self.ondalear_client.id, self.model_descriptor(),
+                                       request_data['model_params'], request_data['model_input'])
+        single_flight = find(TEXT_ANALYTICS_SERVICE).single_flight
+        call = InFlightCall()
+        call.result = [(dict(best_span_str='in flight'), None)]
+        call.done.set()
+        single_flight.calls[cache_key] = call
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        try:
+            response = self.client.post(url, request_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+            self.assertEqual(response.data['detail']['best_span_str'], 'in flight')
+
+            request_data['processing_instructions'] = dict(force_analysis=True,
+                                                           analysis_name='reading_comprehension')
+            response = self.client.post(url, request_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+            self.assertNotEqual(response.data['detail']['best_span_str'], 'in flight')
+        finally:
+            single_flight.calls.pop(cache_key, None)
+
+    def test_stub_chunk_reuse(self):
+        # Expect the unchanged chunks of an edited reference to reuse their analysis.
+        text_reference = ' '.join('Clause {} of the agreement applies.'.format(index)
+                                  for index in range(200))
+        request_data = self.analysis_data()
+        request_data['model_params'] = dict(params=dict(chunk_size=500, output_size=8))
+        request_data['processing_instructions'] = dict(use_cache=True,
+                                                       analysis_name='reading_comprehension')
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        cache = find(TEXT_ANALYTICS_SERVICE).cache
+
+        request_data['model_input'] = dict(text_reference=text_reference,
+                                           text_auxiliary=TEXT_AUXILIARY)
+        response = self.client.post(url, request_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+        window_count = response.data['detail']['window_count']
+        self.assertGreater(window_count, 2)
+
+        hits = cache.stats().get('hits', 0)
+        request_data['model_input'] = dict(
+            text_reference=text_reference.replace('Clause 100 of', 'Clause 100 (amended) of'),
+            text_auxiliary=TEXT_AUXILIARY)
+        response = self.client.post(url, request_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+        self.assertGreaterEqual(cache.stats().get('hits', 0) - hits, window_count - 2)
+
+    def test_stub_cache_snapshot(self):
+        # Expect the cached results to be restored from a snapshot.
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(use_cache=True,
+                                                       analysis_name='reading_comprehension')
+        self.assert_analysis(request_data=request_data)
+
+        service = find(TEXT_ANALYTICS_SERVICE)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json')
+            self.assertGreaterEqual(CacheSnapshots(service.cache, path, 0, 16).save(), 1)
+            cache = AnalysisResultsCache(LocalCacheBackend(time_to_live=60, max_size=16))
+            self.assertGreaterEqual(CacheSnapshots(cache, path, 0, 16).load(), 1)
+        cache_key = analysis_cache_key(self.ondalear_client.id, self.model_descriptor(),
+                                       request_data['model_params'], request_data['model_input'])
+        self.assertEqual(cache.find(cache_key), service.cache.find(cache_key))
+
+
+class ReadingComprenhensionStubByReferenceTest(AssociatedDocumenteMixin,
+                                               ReadingComprenhensionStubTest):
+    """Stub model reading comprehension content by reference test case"""
+
+    def setUp(self):
+        """test case level setup"""
+        super().setUp()
+        self.do_setup()
+
+    def tearDown(self):
+        """test case level tear down"""
+        self.do_teardown()
+        super().tearDown()
+
+    def analysis_data(self):
+        """return analysis data"""
+        return dict(model_input=dict(resource_id=self.doc_association.id),
+                    model_descriptor=self.model_descriptor(),
+                    model_params=dict(params=dict(output_size=8)))
+
+    def test_cache_invalidation(self):
+        # Expect the cached results to be evicted when a document changes.
+        cache = find(TEXT_ANALYTICS_SERVICE).cache
+        request_data = self.analysis_data()
+        request_data['processing_instructions'] = dict(use_cache=True,
+                                                       analysis_name='reading_comprehension')
+        self.assert_analysis(request_data=request_data)
+        invalidations = cache.stats().get('invalidations', 0)
+
+        ref_document = ReferenceDocument.objects.get(
+            document=self.doc_association.from_document)
+        ref_document.save()
+        self.assertEqual(cache.stats().get('invalidations', 0), invalidations + 1)
+
+
+class ReadingComprenhensionBDAFQuestionsTest(AssociatedDocumenteMixin,
+                                             AbstractReadingComphrensionBDAFTest):
+    """Reading comprehension multiple questions test case.
+
+    BDAF questions are asked against a single reference document
+    """
+    url_name = 'analyze-questions'
+
+    def setUp(self):
+        """setup the test case"""
+        super().setUp()
+        self.do_setup()
+
+    def tearDown(self):
+        """test case down"""
+        self.do_teardown()
+        super().tearDown()
+
+    def analysis_data(self):
+        """return analysis data"""
+        return dict(reference=dict(reference_id=self.doc_association.from_document_id),
+                    questions=[dict(text_auxiliary=TEXT_AUXILIARY),
+                               dict(auxiliary_id=self.doc_association.to_document_id),
+                               dict(auxiliary_id=self.doc_association.to_document_id + 1000)],
+                    model_descriptor=self.model_descriptor())
+
+    def test_questions(self):
+        # Expect to answer all the questions, reporting question errors.
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, self.analysis_data(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+        self.assert_response_header(data=response.data['header'],
+                                    msg='Questions analysis request successfully processed.')
+
+        detail = response.data['detail']
+        self.assertEqual([item['index'] for item in detail], [0, 1, 2])
+        for item in detail[:2]:
+            self.assertEqual(item['api_status'], 'OK')
+            self.assertEqual(item['model_output'][MODEL_PRIMARY_OUTPUT_KEY],
+                             self.expected_response()[MODEL_PRIMARY_OUTPUT_KEY])
+        self.assertEqual(detail[2]['api_status'], 'ERROR')
+
+    def test_questions_reference_not_found(self):
+        # Expect to reject questions asked against an unknown reference.
+        request_data = self.analysis_data()
+        request_data['reference'] = dict(reference_id=self.doc_association.from_document_id + 1000)
+        url = reverse(self.url_name)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, request_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
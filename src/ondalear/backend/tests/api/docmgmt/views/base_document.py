@@ -5,20 +5,25 @@
 
 """
 import os
-import ntpath
+import hashlib
 import logging
 from datetime import timedelta
 from copy import deepcopy
+from unittest import mock
 
 from django.conf import settings
 from django.core.files import File
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 
+from ondalear.backend.core.django.storage import blob_name
+from ondalear.backend.core.django.uploads import upload_temp_dir
 from ondalear.backend.core.python.utils import file_exists, module_directory, remove, utc_now
 from ondalear.backend.docmgmt.models import constants
 from ondalear.backend.tests.docmgmt.models import factories
 from ondalear.backend.tests.api.model_viewset  import AbstractModelViewsetTestCase, AssertMixin
+from ondalear.backend.tests.base_models import run_on_commit_callbacks
 
 _logger = logging.getLogger(__name__)
 
@@ -29,9 +34,11 @@ def test_data_file_path(file_name):
     data_dir = os.path.join(module_directory(__file__), 'data')
     return os.path.join(data_dir, file_name)
 
-def uploaded_file_path(file_name, client_id, username):
-    """construct uploaded file path"""
-    return os.path.join(settings.MEDIA_ROOT, client_id, username, file_name)
+def uploaded_file_path(file_name):
+    """construct uploaded file path, the blob named after the test data file contents"""
+    with open(test_data_file_path(file_name), 'rb') as input_file:
+        content_hash = hashlib.sha256(input_file.read()).hexdigest()
+    return os.path.join(settings.MEDIA_ROOT, blob_name(content_hash))
 
 class DocumentAssertMixin(AssertMixin):
     """Assert Mixin class"""
@@ -155,10 +162,7 @@ class FileUploadMixin:
     def remove_files(self, paths):
         """remove files"""
         for file_name in paths:
-            file_path = uploaded_file_path(
-                file_name,
-                self.ondalear_client.client_id,
-                self.user.username)
+            file_path = uploaded_file_path(file_name)
             if file_exists(file_path):
                 remove(file_path)
 
@@ -170,9 +174,35 @@ class FileUploadAssertMixin:
             response = self.assert_create(fmt='multipart')
             detail = response.data['detail']
             if 'upload' in detail:
-                self.assertEqual(
-                    ntpath.basename(response.data['detail']['upload']),
-                    self.source_file_name)
+                self.assertTrue(detail['upload'].endswith(
+                    os.path.basename(uploaded_file_path(self.source_file_name))))
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_post_file_upload_streamed(self):
+        """expect the uploaded file to be moved in place from the temporary directory"""
+        try:
+            self.assert_create(fmt='multipart')
+            file_path = uploaded_file_path(self.source_file_name)
+            with open(file_path, 'rb') as input_file, \
+                    open(test_data_file_path(self.source_file_name), 'rb') as source_file:
+                self.assertEqual(input_file.read(), source_file.read())
+            self.assertEqual(os.listdir(upload_temp_dir()), [])
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_post_file_upload_too_large(self):
+        """expect to fail to load a document exceeding the size limit"""
+        try:
+            with mock.patch.object(constants, 'UPLOAD_FIELD_MAX_FILE_SIZE', 4):
+                response = self.assert_create(expected_status=status.HTTP_400_BAD_REQUEST,
+                                              fmt='multipart')
+            error = response.data['detail'][0]
+            self.assertEqual(error['code'], 'parse_error')
+            self.assertIn('file size exceeds limit', error['title'].lower())
+            file_path = uploaded_file_path(self.source_file_name)
+            self.assertFalse(file_exists(file_path))
+            self.assertEqual(os.listdir(upload_temp_dir()), [])
         finally:
             self.remove_files((self.source_file_name,))
 
@@ -191,7 +221,7 @@ class FileUploadAssertMixin:
             put_data = get_response.data['detail']
 
             # prepare the put request data
-            for key in ('content', 'dir_path'):
+            for key in ('content', 'dir_path', 'file_contents'):
                 del put_data[key]
             put_data['name'] = source_file_name
             put_data['upload'] = File(open(test_data_file_path(source_file_name)))
@@ -203,9 +233,11 @@ class FileUploadAssertMixin:
             # fetching the updated instance again
             get_response = self.client.get(url)
             get_data = get_response.data['detail']
-            self.assertEqual(
-                ntpath.basename(get_data['upload']),
-                source_file_name)
+            self.assertTrue(
+                get_data['upload'].endswith(os.path.basename(uploaded_file_path(source_file_name))))
+            # the replaced file is released once committed
+            run_on_commit_callbacks()
+            self.assertFalse(file_exists(uploaded_file_path(self.source_file_name)))
         finally:
             self.remove_files((self.source_file_name, source_file_name))
 
@@ -223,15 +255,119 @@ class FileUploadAssertMixin:
             self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
 
             self.assertEqual(response.data['detail'], dict(count_deleted=2)) # includes underlying
-            file_path = uploaded_file_path(
-                self.source_file_name,
-                self.ondalear_client.client_id,
-                self.user.username)
+            run_on_commit_callbacks()
+            file_path = uploaded_file_path(self.source_file_name)
             self.assertFalse(file_exists(file_path))
 
         finally:
             self.remove_files((self.source_file_name,))
 
+    def create_upload(self):
+        """create an uploaded document, returning its id and the file data"""
+        create_response = self.assert_create(fmt='multipart')
+        with open(test_data_file_path(self.source_file_name), 'rb') as input_file:
+            file_data = input_file.read()
+        return create_response.data['detail']['id'], file_data
+
+    def assert_file_contents_opt_in(self):
+        """expect file contents only if requested"""
+        try:
+            object_id, file_data = self.create_upload()
+            url = reverse(self.url_name, args=[object_id])
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+            self.assertIsNone(response.data['detail']['file_contents'])
+
+            response = self.client.get(f'{url}?include_file_contents=true')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+            self.assertEqual(response.data['detail']['file_contents'], file_data.decode())
+
+            response = self.client.get(
+                f'{url}?include_file_contents=true&file_contents_start=2&file_contents_end=6')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, f'{response.data}')
+            self.assertEqual(response.data['detail']['file_contents'], file_data.decode()[2:6])
+
+            response = self.client.get(f'{url}?include_file_contents=true&file_contents_start=-1')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, f'{response.data}')
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_download(self):
+        """expect to stream the uploaded file"""
+        try:
+            object_id, file_data = self.create_upload()
+            response = self.client.get(reverse(self.url_name, args=[object_id]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content), file_data)
+            self.assertEqual(response['Content-Length'], str(len(file_data)))
+            self.assertEqual(response['Accept-Ranges'], 'bytes')
+            self.assertIn(self.source_file_name, response['Content-Disposition'])
+            response.close()
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_download_range(self):
+        """expect to stream the requested byte ranges of the uploaded file"""
+        try:
+            object_id, file_data = self.create_upload()
+            url = reverse(self.url_name, args=[object_id])
+            size = len(file_data)
+
+            for header, expected in (('bytes=2-5', file_data[2:6]),
+                                     ('bytes=3-', file_data[3:]),
+                                     ('bytes=-4', file_data[-4:])):
+                response = self.client.get(url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT, header)
+                self.assertEqual(b''.join(response.streaming_content), expected, header)
+                start = size - len(expected) if header.startswith('bytes=-') else int(
+                    header[6:].split('-')[0])
+                self.assertEqual(response['Content-Range'],
+                                 f'bytes {start}-{start + len(expected) - 1}/{size}')
+
+            response = self.client.get(url, HTTP_RANGE=f'bytes={size}-')
+            self.assertEqual(response.status_code,
+                             status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+            # multiple ranges are not supported, the whole file is returned
+            response = self.client.get(url, HTTP_RANGE='bytes=0-1,4-5')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content), file_data)
+            response.close()
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_download_sendfile(self):
+        """expect to hand the uploaded file over to the front web server"""
+        try:
+            object_id, _ = self.create_upload()
+            url = reverse(self.url_name, args=[object_id])
+            file_path = uploaded_file_path(self.source_file_name)
+
+            with override_settings(DOCUMENT_DOWNLOAD_SENDFILE='X-Sendfile'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['X-Sendfile'], file_path)
+            self.assertEqual(response.content, b'')
+
+            with override_settings(DOCUMENT_DOWNLOAD_SENDFILE='X-Accel-Redirect',
+                                   DOCUMENT_DOWNLOAD_ACCEL_PREFIX='/protected/'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response['X-Accel-Redirect'],
+                '/protected/' + os.path.relpath(file_path, settings.MEDIA_ROOT))
+        finally:
+            self.remove_files((self.source_file_name,))
+
+    def assert_download_missing(self):
+        """expect to fail to download a document without uploaded file"""
+        create_response = self.assert_create()
+        object_id = create_response.data['detail']['id']
+        response = self.client.get(reverse(self.url_name, args=[object_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 class AbstractDocumentApiTest(DocumentAssertMixin, AbstractModelViewsetTestCase):
     """Base  document api test"""
 
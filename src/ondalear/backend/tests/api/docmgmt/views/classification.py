@@ -6,6 +6,7 @@
 import logging
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.test import APIRequestFactory
 
 from ondalear.backend.docmgmt.models import constants
 from ondalear.backend.tests.docmgmt.models import factories
@@ -45,6 +46,16 @@ class AbstractClassificationApiTest(AbstractModelViewsetTestCase):
             classification.delete()
             client.delete()
 
+    def assert_unscoped_queryset(self):
+        """expect the queryset built before the client is known to fetch classifications"""
+        classification = self.factory_class(client=self.ondalear_client, name='unscoped classification')
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+        view = self.view_class(request=request)
+        names = [instance.name for instance in view.get_queryset()]
+
+        self.assertIn(classification.name, names)
+
     def assert_post_parent(self):
         """expect to create classification and parent classificaiton"""
         data_parent = self.create_request_data.copy()
@@ -113,6 +124,10 @@ class ClassificationListTestMixin:
         # expect to fetch 2 classification one associated with system client
         self.assert_list_system_and_client_classification()
 
+    def test_list_unscoped_queryset(self):
+        # expect to fetch classifications through the queryset drf uses for model permissions
+        self.assert_unscoped_queryset()
+
 
 class ClassificationRetrieveTestMixin:
     """Classification retrieve test mixin class"""
@@ -99,6 +99,14 @@ class AuxiliaryDocumentFileUploadAPIPostTest(AbstractAuxiliaryDocumnetUploadTest
         # expect to load the document
         self.assert_post_file_upload()
 
+    def test_post_file_upload_streamed(self):
+        # expect the uploaded file to be moved in place
+        self.assert_post_file_upload_streamed()
+
+    def test_post_file_upload_too_large(self):
+        # expect to fail to load a document exceeding the size limit
+        self.assert_post_file_upload_too_large()
+
 class AuxiliaryDocumentFileUploadAPIPutTest(AbstractAuxiliaryDocumnetUploadTest):
     """Put file upload test"""
     url_name = 'auxiliary-document-crud-detail'
@@ -115,6 +123,39 @@ class AuxiliaryDocumentFileUploadAPIDeleteTest(AbstractAuxiliaryDocumnetUploadTe
         # expect to delete the document and associated file
         self.assert_delete_file_upload()
 
+class AuxiliaryDocumentFileContentsAPITest(AbstractAuxiliaryDocumnetUploadTest):
+    """File contents test"""
+    url_name = 'auxiliary-document-crud-detail'
+
+    def test_file_contents_opt_in(self):
+        # expect file contents only if requested
+        self.assert_file_contents_opt_in()
+
+class AuxiliaryDocumentDownloadAPITest(AbstractAuxiliaryDocumnetUploadTest):
+    """Download test"""
+    url_name = 'auxiliary-document-crud-download'
+
+    def test_download(self):
+        # expect to stream the uploaded file
+        self.assert_download()
+
+    def test_download_range(self):
+        # expect to stream the requested byte ranges
+        self.assert_download_range()
+
+    def test_download_sendfile(self):
+        # expect to hand the file over to the front web server
+        self.assert_download_sendfile()
+
+class AuxiliaryDocumentDownloadMissingAPITest(FileUploadAssertMixin,
+                                         AbstractAuxiliaryDocumentApiTest):
+    """Download without uploaded file test"""
+    url_name = 'auxiliary-document-crud-download'
+
+    def test_download_missing(self):
+        # expect to fail to download a document without uploaded file
+        self.assert_download_missing()
+
 class AuxiliaryDocumentSummaryAPIListTest(AbstractAuxiliaryDocumentApiTest):
     """Auxiliary document summary list test case"""
     url_name = 'auxiliary-document-summary-list'
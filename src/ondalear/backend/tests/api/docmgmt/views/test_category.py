@@ -6,6 +6,7 @@
 """
 import logging
 
+from ondalear.backend.api.docmgmt.views.classification import CategoryViewSet
 from ondalear.backend.docmgmt.models import Category
 from ondalear.backend.tests.docmgmt.models import factories
 from ondalear.backend.tests.api.docmgmt.views.classification import (
@@ -28,6 +29,7 @@ class CategoryApiTest(AbstractClassificationApiTest):
     create_url_name = 'category-crud-list'
     factory_class = factories.CategoryModelFactory
     model_class = Category
+    view_class = CategoryViewSet
 
     create_request_data = {
         'description': 'category description',
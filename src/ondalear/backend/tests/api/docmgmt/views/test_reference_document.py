@@ -100,6 +100,14 @@ class ReferenceDocumentFileUploadAPIPostTest(AbstractReferenceDocumnetUploadTest
         # expect to load the document
         self.assert_post_file_upload()
 
+    def test_post_file_upload_streamed(self):
+        # expect the uploaded file to be moved in place
+        self.assert_post_file_upload_streamed()
+
+    def test_post_file_upload_too_large(self):
+        # expect to fail to load a document exceeding the size limit
+        self.assert_post_file_upload_too_large()
+
 class ReferenceDocumentFileUploadAPIPutTest(AbstractReferenceDocumnetUploadTest):
     """Put file upload test"""
     url_name = 'reference-document-crud-detail'
@@ -114,6 +122,39 @@ class ReferenceDocumentFileUploadAPIDeleteTest(AbstractReferenceDocumnetUploadTe
         # expect to delete the document and associated file
         self.assert_delete_file_upload()
 
+class ReferenceDocumentFileContentsAPITest(AbstractReferenceDocumnetUploadTest):
+    """File contents test"""
+    url_name = 'reference-document-crud-detail'
+
+    def test_file_contents_opt_in(self):
+        # expect file contents only if requested
+        self.assert_file_contents_opt_in()
+
+class ReferenceDocumentDownloadAPITest(AbstractReferenceDocumnetUploadTest):
+    """Download test"""
+    url_name = 'reference-document-crud-download'
+
+    def test_download(self):
+        # expect to stream the uploaded file
+        self.assert_download()
+
+    def test_download_range(self):
+        # expect to stream the requested byte ranges
+        self.assert_download_range()
+
+    def test_download_sendfile(self):
+        # expect to hand the file over to the front web server
+        self.assert_download_sendfile()
+
+class ReferenceDocumentDownloadMissingAPITest(FileUploadAssertMixin,
+                                         AbstractReferenceDocumentApiTest):
+    """Download without uploaded file test"""
+    url_name = 'reference-document-crud-download'
+
+    def test_download_missing(self):
+        # expect to fail to download a document without uploaded file
+        self.assert_download_missing()
+
 class ReferenceDocumentSummaryAPIListTest(AbstractReferenceDocumentApiTest):
     """Reference document summary list test case"""
     url_name = 'reference-document-summary-list'
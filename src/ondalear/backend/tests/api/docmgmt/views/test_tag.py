@@ -6,6 +6,7 @@
 """
 import logging
 
+from ondalear.backend.api.docmgmt.views.classification import TagViewSet
 from ondalear.backend.docmgmt.models import Tag
 from ondalear.backend.tests.docmgmt.models import factories
 from ondalear.backend.tests.api.docmgmt.views.classification import AbstractClassificationApiTest
@@ -29,6 +30,7 @@ class TagApiTest(AbstractClassificationApiTest):
     create_url_name = 'tag-crud-list'
     factory_class = factories.TagModelFactory
     model_class = Tag
+    view_class = TagViewSet
 
     create_request_data = {
         'description': 'tag description',
@@ -5,6 +5,7 @@
 
 """
 import logging
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth.models import User, Group
 from django.contrib.sites.models import Site
@@ -15,6 +16,12 @@ _logger = logging.getLogger(__name__)
 
 # pylint: disable=no-member
 
+def run_on_commit_callbacks():
+    """run the callbacks deferred until the commit of the test case transaction"""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
 class AbstractModelTestCase(TestCase):
     """Base class model test case"""
     @classmethod
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.tests.core
+   :synopsis: ondalear backend tests core package
+
+"""
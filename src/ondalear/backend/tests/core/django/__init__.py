@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.tests.core.django
+   :synopsis: ondalear backend django utilities tests package
+
+"""
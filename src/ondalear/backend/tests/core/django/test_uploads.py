@@ -0,0 +1,85 @@
+"""
+.. module:: ondalear.backend.tests.core.django.test_uploads
+   :synopsis: streaming file upload handler unit test module.
+
+
+"""
+import os
+import hashlib
+import logging
+import tempfile
+from unittest import TestCase
+
+from django.core.files.uploadhandler import StopFutureHandlers
+
+from ondalear.backend.core.django.uploads import HashingFileUploadHandler, UploadSizeExceeded
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+TEXT = b'some uploaded text\n' * 1000
+PDF_HEADER = b'%PDF-1.4\n'
+CHUNK_SIZE = 1024
+
+
+class HashingFileUploadHandlerTest(TestCase):
+    """Streaming file upload handler test case"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.temp_dir = directory.name
+
+    def create_handler(self, **kwargs):
+        return HashingFileUploadHandler(temp_dir=self.temp_dir, **kwargs)
+
+    def new_file(self, handler, content_length=None):
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('file', 'upload.txt', 'text/plain', content_length)
+
+    def upload(self, handler, data):
+        """stream the data to the handler, returning the uploaded file"""
+        self.new_file(handler)
+        for start in range(0, len(data), CHUNK_SIZE):
+            handler.receive_data_chunk(data[start:start + CHUNK_SIZE], start)
+        uploaded = handler.file_complete(len(data))
+        self.addCleanup(uploaded.close)
+        return uploaded
+
+    def test_upload(self):
+        # expect the data to be written to a temporary file, with its hash and type
+        uploaded = self.upload(self.create_handler(), TEXT)
+
+        self.assertEqual(uploaded.read(), TEXT)
+        self.assertEqual(uploaded.size, len(TEXT))
+        self.assertEqual(uploaded.content_hash, hashlib.sha256(TEXT).hexdigest())
+        self.assertEqual(uploaded.sniffed_content_type, 'text/plain')
+        self.assertEqual(os.path.dirname(uploaded.temporary_file_path()), self.temp_dir)
+
+    def test_first_block_type(self):
+        # expect the type to be sniffed from the first block only
+        uploaded = self.upload(self.create_handler(mime_lookup_length=16), PDF_HEADER + TEXT)
+        self.assertEqual(uploaded.sniffed_content_type, 'application/pdf')
+
+        uploaded = self.upload(self.create_handler(mime_lookup_length=16), TEXT + PDF_HEADER)
+        self.assertEqual(uploaded.sniffed_content_type, 'text/plain')
+
+        # a file shorter than the block is sniffed when complete
+        uploaded = self.upload(self.create_handler(), PDF_HEADER)
+        self.assertEqual(uploaded.sniffed_content_type, 'application/pdf')
+
+    def test_size_limit(self):
+        # expect an upload exceeding the limit to fail, removing its temporary file
+        handler = self.create_handler(max_size=len(TEXT) - 1)
+        with self.assertRaises(UploadSizeExceeded):
+            self.upload(handler, TEXT)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+        # refused before any data if its length is announced
+        with self.assertRaises(UploadSizeExceeded):
+            self.create_handler(max_size=100).new_file('file', 'upload.txt', 'text/plain', 101)
+
+        # at the limit
+        uploaded = self.upload(self.create_handler(max_size=len(TEXT)), TEXT)
+        self.assertEqual(uploaded.size, len(TEXT))
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.tests.core.python
+   :synopsis: ondalear backend python utilities tests package
+
+"""
@@ -0,0 +1,74 @@
+"""
+.. module:: ondalear.backend.tests.core.python.test_text_reader
+   :synopsis: text file reader unit test module.
+
+
+"""
+import os
+import codecs
+import logging
+import tempfile
+from unittest import TestCase
+
+from ondalear.backend.core.python.text_reader import TextFileReader
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+TEXT = 'première ligne\r\nsecond line\n\nthird line – after a blank line\nlast line'
+
+
+class TextFileReaderTest(TestCase):
+    """Text file reader test case"""
+
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def write(self, data):
+        handle, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'wb') as output_file:
+            output_file.write(data)
+        self.paths.append(path)
+        return path
+
+    def test_encodings(self):
+        # expect the encoding to be detected from the byte order mark, or utf-8
+        for data, encoding in ((TEXT.encode('utf-8'), 'utf-8'),
+                               (codecs.BOM_UTF8 + TEXT.encode('utf-8'), 'utf-8'),
+                               (codecs.BOM_UTF16_LE + TEXT.encode('utf-16-le'), 'utf-16-le'),
+                               (codecs.BOM_UTF16_BE + TEXT.encode('utf-16-be'), 'utf-16-be'),
+                               (codecs.BOM_UTF32_LE + TEXT.encode('utf-32-le'), 'utf-32-le')):
+            with TextFileReader(self.write(data), chunk_size=7) as reader:
+                self.assertEqual(reader.encoding, encoding)
+                self.assertEqual(reader.text(), TEXT)
+                self.assertEqual(reader.chars(), TEXT)
+
+    def test_explicit_encoding(self):
+        # expect the given encoding to be used
+        with TextFileReader(self.write(TEXT.encode('cp1252')), encoding='cp1252') as reader:
+            self.assertEqual(reader.text(), TEXT)
+
+    def test_empty(self):
+        # expect an empty file to be read
+        with TextFileReader(self.write(b'')) as reader:
+            self.assertEqual(reader.size, 0)
+            self.assertEqual(reader.text(), '')
+            self.assertEqual(reader.chars(), '')
+
+    def test_slices(self):
+        # expect byte offsets to be moved to character boundaries, and
+        # character offsets to be honoured across chunks
+        data = TEXT.encode('utf-8')
+        with TextFileReader(self.write(data), chunk_size=5) as reader:
+            self.assertEqual(reader.size, len(data))
+            self.assertEqual(reader.read_bytes(0, 4), data[:4])
+            # offset 6 is within 'è'
+            self.assertEqual(reader.text(0, 6), 'premiè')
+            self.assertEqual(reader.text(6, 9), 're')
+            for start, end in ((0, 8), (3, 20), (18, 40), (40, None), (0, 1000)):
+                self.assertEqual(reader.chars(start, end), TEXT[start:end])
@@ -5,17 +5,25 @@
 
 """
 import os
+import shutil
+import hashlib
 import logging
+from unittest import mock
 
 from django.conf import settings
 from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.utils import IntegrityError
+from django.db.utils import DatabaseError, IntegrityError
 
 
-from ondalear.backend.core.python.utils import file_exists, module_directory, remove
-from ondalear.backend.tests.base_models import AbstractModelTestCase
+from ondalear.backend.core.django.storage import blob_name
+from ondalear.backend.core.python.utils import (content_hash, file_exists, mkdir,
+                                                module_directory, remove)
+from ondalear.backend.docmgmt.models import Blob
+from ondalear.backend.tests.base_models import AbstractModelTestCase, run_on_commit_callbacks
 from . import factories
 
 _logger = logging.getLogger(__name__)
@@ -26,6 +34,12 @@ def test_data_file_path(file_name):
     data_dir = os.path.join(module_directory(__file__), "data")
     return os.path.join(data_dir, file_name)
 
+def blob_file_path(file_name):
+    """build the blob path of a test data file"""
+    with open(test_data_file_path(file_name), 'rb') as input_file:
+        content_hash = hashlib.sha256(input_file.read()).hexdigest()
+    return os.path.join(settings.MEDIA_ROOT, blob_name(content_hash))
+
 # pylint: disable=too-many-locals,no-member,missing-docstring,no-self-use,too-many-ancestors
 
 class DerivedDocumentCRUDMixin:
@@ -91,21 +105,10 @@ class FileUploadAssertMixin:
             document=document,
             upload=test_file,
             dir_path=dir_path)
-        # verify it was saved
+        # verify it was saved, in the blob named after its contents
         assert derived_document.document_id
-        if dir_path:
-            uploaded_file_path = os.path.join(
-                settings.MEDIA_ROOT,
-                derived_document.document.client.client_id,
-                derived_document.document.effective_user.username,
-                dir_path,
-                file_name)
-        else:
-            uploaded_file_path = os.path.join(
-                settings.MEDIA_ROOT,
-                derived_document.document.client.client_id,
-                derived_document.document.effective_user.username,
-                file_name)
+        uploaded_file_path = blob_file_path(file_name)
+        assert derived_document.upload.path == uploaded_file_path
         assert file_exists(uploaded_file_path)
         with(open(uploaded_file_path)) as test_file:
             lines = test_file.readlines()
@@ -132,6 +135,198 @@ class FileUploadAssertMixin:
             if uploaded_file_path and file_exists(uploaded_file_path):
                 remove(uploaded_file_path)
 
+    def assert_upload_deduplicated(self):
+        """Expect identical uploads to share a blob, removed with its last reference"""
+        uploaded_file_path = blob_file_path(self.file_name)
+        try:
+            documents = []
+            for name in ('document_one', 'document_two'):
+                with open(test_data_file_path(self.file_name)) as test_file:
+                    document = factories.DocumentModelFactory(name=name)
+                    self.derived_document_factory_class(document=document, content='',
+                                                        upload=File(test_file))
+                documents.append(document)
+
+            blob = Blob.objects.get()
+            self.assertEqual(blob.ref_count, 2)
+            self.assertTrue(file_exists(uploaded_file_path))
+
+            documents[0].delete()
+            self.assertEqual(Blob.objects.get().ref_count, 1)
+            self.assertTrue(file_exists(uploaded_file_path))
+
+            documents[1].delete()
+            # the file is deleted once the transaction commits
+            self.assertTrue(file_exists(uploaded_file_path))
+            run_on_commit_callbacks()
+            self.assertFalse(Blob.objects.exists())
+            self.assertFalse(file_exists(uploaded_file_path))
+        finally:
+            if file_exists(uploaded_file_path):
+                remove(uploaded_file_path)
+
+    def assert_upload_replaced(self):
+        """Expect the replaced upload to be released"""
+        uploaded_file_path = blob_file_path(self.file_name)
+        replacement = derived_document = None
+        try:
+            with open(test_data_file_path(self.file_name)) as test_file:
+                derived_document = self.derived_document_factory_class(content='',
+                                                                       upload=File(test_file))
+
+            # uploading the same contents again keeps a single reference
+            with open(test_data_file_path(self.file_name)) as test_file:
+                derived_document.upload = File(test_file)
+                derived_document.save()
+            self.assertEqual(Blob.objects.get().ref_count, 1)
+
+            # a rolled back replacement keeps the replaced file
+            try:
+                with transaction.atomic():
+                    derived_document.upload = ContentFile(b'replacement contents',
+                                                          name='other.txt')
+                    derived_document.save()
+                    replacement = derived_document.upload.path
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+            run_on_commit_callbacks()
+            self.assertTrue(file_exists(uploaded_file_path))
+            self.assertEqual(Blob.objects.get().ref_count, 1)
+
+            derived_document = type(derived_document).objects.get(pk=derived_document.pk)
+            derived_document.upload = ContentFile(b'replacement contents', name='other.txt')
+            derived_document.save()
+            run_on_commit_callbacks()
+            self.assertFalse(file_exists(uploaded_file_path))
+            self.assertEqual(Blob.objects.get().ref_count, 1)
+        finally:
+            if derived_document:
+                derived_document.document.delete()
+            for path in (uploaded_file_path, replacement):
+                if path and file_exists(path):
+                    remove(path)
+
+    def assert_migrate_uploads(self):
+        """Expect the client directory uploads to be moved to the blob storage"""
+        uploaded_file_path = blob_file_path(self.file_name)
+        legacy_name = os.path.join('legacy_client', self.file_name)
+        legacy_path = os.path.join(settings.MEDIA_ROOT, legacy_name)
+        try:
+            with open(test_data_file_path(self.file_name)) as test_file:
+                derived_document = self.derived_document_factory_class(content='',
+                                                                       upload=File(test_file))
+            # simulate a document uploaded before the blob storage
+            model_class = type(derived_document)
+            mkdir(os.path.dirname(legacy_path))
+            shutil.copy(test_data_file_path(self.file_name), legacy_path)
+            model_class.objects.filter(pk=derived_document.pk).update(upload=legacy_name)
+            Blob.objects.all().delete()
+            remove(uploaded_file_path)
+
+            call_command('migrate_uploads', stdout=open(os.devnull, 'w'))
+
+            migrated = model_class.objects.get(pk=derived_document.pk)
+            self.assertEqual(migrated.upload.path, uploaded_file_path)
+            self.assertTrue(file_exists(uploaded_file_path))
+            self.assertEqual(Blob.objects.get().ref_count, 1)
+            self.assertFalse(file_exists(legacy_path))
+        finally:
+            for path in (uploaded_file_path, legacy_path):
+                if file_exists(path):
+                    remove(path)
+
+    def assert_text(self):
+        """Expect the normalized text to be stored when content or upload changes"""
+        uploaded_file_path = blob_file_path(self.file_name)
+        replacement = derived_document = None
+        try:
+            # the content of inline documents is not stored again
+            derived_document = self.derived_document_factory_class(content='sample content')
+            self.assertIsNone(derived_document.text)
+            self.assertEqual(derived_document.text_length, len('sample content'))
+            self.assertEqual(derived_document.text_hash, content_hash('sample content'))
+            self.assertEqual(derived_document.get_text(), 'sample content')
+
+            # the length and hash are only computed when the content changes
+            derived_document = type(derived_document).objects.get(pk=derived_document.pk)
+            with mock.patch('ondalear.backend.docmgmt.models.document.content_hash') as hasher:
+                derived_document.save()
+            hasher.assert_not_called()
+            derived_document.content = 'new content'
+            derived_document.save()
+            self.assertEqual(derived_document.text_length, len('new content'))
+            self.assertEqual(derived_document.text_hash, content_hash('new content'))
+
+            derived_document.content = ''
+            with open(test_data_file_path(self.file_name)) as test_file:
+                expected = test_file.read()
+                test_file.seek(0)
+                derived_document.upload = File(test_file)
+                derived_document.save()
+            stored = type(derived_document).objects.get(pk=derived_document.pk)
+            for instance in (derived_document, stored):
+                self.assertEqual(instance.text, expected)
+                self.assertEqual(instance.text_length, len(expected))
+                self.assertEqual(instance.text_hash, content_hash(expected))
+                self.assertEqual(instance.get_text(), expected)
+
+            # mojibake is fixed in the text, the file contents being read as uploaded
+            mojibake = 'café'.encode('utf-8').decode('latin-1')
+            derived_document.upload = ContentFile(mojibake.encode('utf-8'), name='other.txt')
+            derived_document.save()
+            replacement = derived_document.upload.path
+            stored = type(derived_document).objects.get(pk=derived_document.pk)
+            self.assertEqual(stored.get_text(), 'café')
+            self.assertEqual(stored.text_length, 4)
+            self.assertEqual(stored.get_file_contents(), mojibake)
+            self.assertEqual(stored.get_file_contents(3, 5), mojibake[3:5])
+
+            # whether the text has been stored or not
+            type(derived_document).objects.filter(pk=derived_document.pk).update(
+                text=None, text_length=0, text_hash=None)
+            stored = type(derived_document).objects.get(pk=derived_document.pk)
+            self.assertEqual(stored.get_file_contents(), mojibake)
+            self.assertEqual(stored.get_file_contents(3, 5), mojibake[3:5])
+            self.assertEqual(stored.get_text(), 'café')
+        finally:
+            if derived_document:
+                derived_document.document.delete()
+            for path in (uploaded_file_path, replacement):
+                if path and file_exists(path):
+                    remove(path)
+
+    def assert_backfill_text(self):
+        """Expect the missing normalized text to be stored in batches"""
+        uploaded_file_path = blob_file_path(self.file_name)
+        try:
+            with open(test_data_file_path(self.file_name)) as test_file:
+                expected = test_file.read()
+                test_file.seek(0)
+                uploaded = self.derived_document_factory_class(content='',
+                                                               upload=File(test_file))
+            documents = [self.derived_document_factory_class(
+                document=factories.DocumentModelFactory(name='document_{}'.format(index)),
+                content='content {}'.format(index)) for index in range(3)]
+            # simulate documents saved before the text was stored
+            model_class = type(uploaded)
+            model_class.objects.update(text=None, text_length=0, text_hash=None)
+            self.assertIsNone(model_class.objects.get(pk=uploaded.pk).text_hash)
+
+            call_command('backfill_text', batch_size=2, stdout=open(os.devnull, 'w'))
+
+            stored = model_class.objects.get(pk=uploaded.pk)
+            self.assertEqual(stored.text, expected)
+            self.assertEqual(stored.text_hash, content_hash(expected))
+            for index, document in enumerate(documents):
+                stored = model_class.objects.get(pk=document.pk)
+                self.assertIsNone(stored.text)
+                self.assertEqual(stored.text_hash, content_hash('content {}'.format(index)))
+                self.assertEqual(stored.text_length, len(stored.content))
+        finally:
+            if file_exists(uploaded_file_path):
+                remove(uploaded_file_path)
+
     def assert_no_data(self):
         """expect to fail to save as both content and upload are not set"""
         with self.assertRaises(ValidationError):
@@ -179,6 +374,26 @@ class DerivedDocumentModelTestMixin:
         # Expect to upload a file to the system designated location
         self.assert_upload()
 
+    def test_upload_deduplicated(self):
+        # Expect identical uploads to share a blob
+        self.assert_upload_deduplicated()
+
+    def test_upload_replaced(self):
+        # Expect the replaced upload to be released
+        self.assert_upload_replaced()
+
+    def test_migrate_uploads(self):
+        # Expect the client directory uploads to be moved to the blob storage
+        self.assert_migrate_uploads()
+
+    def test_text(self):
+        # Expect the normalized text to be stored when content or upload changes
+        self.assert_text()
+
+    def test_backfill_text(self):
+        # Expect the missing normalized text to be stored in batches
+        self.assert_backfill_text()
+
     def test_no_data(self):
         # expect to fail to save as both content and upload are not set
         self.assert_no_data()
@@ -0,0 +1,5 @@
+"""
+.. module:: ondalear.backend.tests.services
+   :synopsis: ondalear backend text analytics services tests package
+
+"""
@@ -0,0 +1,230 @@
+"""
+.. module:: ondalear.backend.tests.services.test_cache
+   :synopsis: analysis cache backends unit test module.
+
+
+"""
+import os
+import logging
+import tempfile
+import time
+from unittest import TestCase
+
+from ondalear.backend.services.cache import LocalCacheBackend, SharedCacheBackend
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring,protected-access
+
+
+def sized_value(size):
+    """return a value whose json form is size bytes long"""
+    # '{"text":""}' is 11 bytes long
+    return dict(text='x' * (size - 11))
+
+
+class LocalCacheBackendTest(TestCase):
+    """Local cache backend test case"""
+
+    def stored_bytes(self, backend):
+        return sum(stripe.cache.currsize for stripe in backend.stripes)
+
+    def test_byte_budget(self):
+        # expect the stored bytes to be bounded, the least recently used entries evicted
+        backend = LocalCacheBackend(time_to_live=60, max_size=16, max_bytes=1000, stripes=1,
+                                    compress_threshold=0)
+        for index in range(10):
+            backend.set('key_{}'.format(index), sized_value(200))
+            self.assertLessEqual(self.stored_bytes(backend), 1000)
+
+        self.assertEqual([backend.get('key_{}'.format(index)) is not None
+                          for index in range(10)], [False] * 5 + [True] * 5)
+        stats = backend.stats()
+        self.assertEqual(stats['bytes'], 1000)
+        self.assertEqual(stats['evictions'], 5)
+
+        # larger than the whole cache
+        backend.set('large', sized_value(2000))
+        self.assertIsNone(backend.get('large'))
+        self.assertEqual(backend.stats()['too_large'], 1)
+
+    def test_entry_count(self):
+        # expect the number of entries to be bounded without a byte budget
+        backend = LocalCacheBackend(time_to_live=60, max_size=4, max_bytes=0, stripes=2)
+        for index in range(10):
+            backend.set('key_{}'.format(index), sized_value(200))
+
+        self.assertEqual(backend.stats()['size'], 4)
+        self.assertIsNotNone(backend.get('key_9'))
+
+    def test_bound_across_stripes(self):
+        # expect the stripes to share the bound, the largest stripe evicting
+        backend = LocalCacheBackend(time_to_live=60, max_size=16, max_bytes=1000, stripes=4,
+                                    compress_threshold=0)
+        for index in range(40):
+            backend.set('key_{}'.format(index), sized_value(100))
+            self.assertLessEqual(self.stored_bytes(backend), 1000)
+            self.assertIsNotNone(backend.get('key_{}'.format(index)))
+
+        self.assertGreater(self.stored_bytes(backend), 1000 - 4 * 100)
+        # a large new entry is kept, the other stripes evicting first
+        backend.set('large', sized_value(900))
+        self.assertIsNotNone(backend.get('large'))
+        self.assertLessEqual(self.stored_bytes(backend), 1000)
+
+    def test_compression(self):
+        # expect values larger than the threshold to be compressed
+        backend = LocalCacheBackend(time_to_live=60, max_size=16, compress_threshold=1000)
+        backend.set('small', sized_value(500))
+        backend.set('large', sized_value(5000))
+
+        self.assertEqual(backend.get('small'), sized_value(500))
+        self.assertEqual(backend.get('large'), sized_value(5000))
+        stats = backend.stats()
+        self.assertEqual(stats['compressed'], 1)
+        self.assertLess(stats['bytes'], 1000)
+
+    def test_entry_sizes(self):
+        # expect the stored entry sizes to be recorded
+        backend = LocalCacheBackend(time_to_live=60, max_size=16, compress_threshold=0)
+        backend.set('key_1', sized_value(500))
+        backend.set('key_2', sized_value(500))
+        backend.set('key_3', sized_value(5000))
+
+        entry_sizes = backend.stats()['entry_sizes']
+        self.assertEqual(entry_sizes['count'], 3)
+        self.assertEqual(entry_sizes['buckets']['1024'], 2)
+        self.assertEqual(entry_sizes['buckets']['16384'], 1)
+        self.assertEqual(entry_sizes['p50'], 1024)
+
+    def test_value_copy(self):
+        # expect callers modifying a value not to modify the cached one
+        backend = LocalCacheBackend(time_to_live=60, max_size=16)
+        value = dict(values=[1])
+        backend.set('key', value)
+        value['values'].append(2)
+        backend.get('key')['values'].append(3)
+
+        self.assertEqual(backend.get('key'), dict(values=[1]))
+
+    def test_delete_documents(self):
+        # expect the entries of the documents to be deleted
+        backend = LocalCacheBackend(time_to_live=60, max_size=16)
+        backend.set('key_1', dict(value=1), documents=[1, 2])
+        backend.set('key_2', dict(value=2), documents=[2])
+        backend.set('key_3', dict(value=3))
+
+        self.assertEqual(backend.delete_documents([1]), 1)
+        self.assertIsNone(backend.get('key_1'))
+        self.assertEqual(backend.delete_documents([2]), 1)
+        self.assertEqual(backend.get('key_3'), dict(value=3))
+
+        backend.clear()
+        self.assertEqual(backend.stats()['size'], 0)
+        self.assertNotIn('evictions', backend.stats())
+
+
+class SharedCacheBackendTest(TestCase):
+    """Shared cache backend test case"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def create_backend(self, time_to_live=60, max_size=16, **options):
+        return SharedCacheBackend(time_to_live, max_size, path=self.path, **options)
+
+    def stored_keys(self, backend):
+        return sorted(row[0] for row in backend._connection().execute('SELECT key FROM entries'))
+
+    def test_shared_store(self):
+        # expect the entries to be shared through the sqlite store
+        backend = self.create_backend()
+        backend.set('key', dict(value=1), documents=[1])
+
+        other = self.create_backend()
+        self.assertEqual(other.get('key'), dict(value=1))
+        self.assertEqual(other.stats()['shared_hits'], 1)
+        self.assertIsNone(other.get('missing'))
+        self.assertEqual(other.stats()['misses'], 1)
+
+        self.assertEqual(other.delete_documents([1]), 1)
+        self.assertIsNone(self.create_backend().get('key'))
+
+    def test_expiry(self):
+        # expect expired entries not to be returned
+        backend = self.create_backend(time_to_live=0.05)
+        backend.set('key', dict(value=1))
+        time.sleep(0.1)
+
+        self.assertIsNone(backend.get('key'))
+        self.assertIsNone(self.create_backend(time_to_live=0.05).get('key'))
+
+    def test_front_cache(self):
+        # expect recently used entries to be returned without the store
+        backend = self.create_backend()
+        backend.set('key', dict(value=1))
+        backend._connection().execute('DELETE FROM entries')
+
+        self.assertEqual(backend.get('key'), dict(value=1))
+        self.assertEqual(backend.stats()['front_hits'], 1)
+        self.assertIsNone(self.create_backend().get('key'))
+
+    def test_value_copy(self):
+        # expect callers modifying a value not to modify the cached one
+        backend = self.create_backend()
+        value = dict(values=[1])
+        backend.set('key', value)
+        value['values'].append(2)
+
+        # front cache
+        backend.get('key')['values'].append(3)
+        self.assertEqual(backend.get('key'), dict(values=[1]))
+
+        # store, then front cache
+        other = self.create_backend()
+        other.get('key')['values'].append(3)
+        self.assertEqual(other.get('key'), dict(values=[1]))
+
+    def test_evict_interval(self):
+        # expect the maximum size to be enforced once every evict interval writes
+        backend = self.create_backend(max_size=2, evict_interval=4)
+        for index in range(3):
+            backend.set('key_{}'.format(index), dict(value=index))
+            # distinct access times
+            time.sleep(0.01)
+        self.assertEqual(len(self.stored_keys(backend)), 3)
+
+        backend.set('key_3', dict(value=3))
+        self.assertEqual(self.stored_keys(backend), ['key_2', 'key_3'])
+        self.assertEqual(backend.stats()['evictions'], 2)
+
+    def test_batched_access_times(self):
+        # expect access times to be written back in batches, and used by eviction
+        backend = self.create_backend(max_size=2, evict_interval=3)
+        backend.ACCESS_BATCH_SIZE = 2
+        backend.set('key_0', dict(value=0))
+        time.sleep(0.01)
+        backend.set('key_1', dict(value=1))
+        access_time = backend._connection().execute(
+            'SELECT access_time FROM entries WHERE key = ?', ('key_0',)).fetchone()[0]
+        time.sleep(0.01)
+
+        backend.get('key_0')
+        self.assertIn('key_0', backend.access_times)
+        self.assertEqual(backend._connection().execute(
+            'SELECT access_time FROM entries WHERE key = ?', ('key_0',)).fetchone()[0],
+                         access_time)
+
+        # the front cache hit makes key_1 the least recently used entry
+        backend.set('key_2', dict(value=2))
+        self.assertEqual(self.stored_keys(backend), ['key_0', 'key_2'])
+        self.assertEqual(backend.access_times, dict())
+
+        backend.get('key_0')
+        backend.get('key_2')
+        self.assertEqual(backend.access_times, dict())
+        self.assertGreater(backend._connection().execute(
+            'SELECT access_time FROM entries WHERE key = ?', ('key_0',)).fetchone()[0],
+                           access_time)
@@ -0,0 +1,68 @@
+"""
+.. module:: ondalear.backend.tests.services.test_cache_snapshot
+   :synopsis: analysis cache snapshot unit test module.
+
+
+"""
+import os
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from ondalear.backend.services.cache import AnalysisResultsCache, LocalCacheBackend
+from ondalear.backend.services.cache_snapshot import CacheSnapshots, read_snapshot
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+
+def create_cache(*keys):
+    cache = AnalysisResultsCache(LocalCacheBackend(time_to_live=60, max_size=16))
+    for key in keys:
+        cache.add(key, dict(key=key))
+        # distinct access times
+        time.sleep(0.01)
+    return cache
+
+
+class CacheSnapshotsTest(TestCase):
+    """Cache snapshots test case"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.json')
+
+    def test_save_merges_processes(self):
+        # expect the entries saved by each process to be restored
+        CacheSnapshots(create_cache('a1', 'a2'), self.path, 0, 16).save()
+        CacheSnapshots(create_cache('b1'), self.path, 0, 16).save()
+
+        cache = create_cache()
+        self.assertEqual(CacheSnapshots(cache, self.path, 0, 16).load(), 3)
+        for key in ('a1', 'a2', 'b1'):
+            self.assertEqual(cache.find(key), dict(key=key))
+
+    def test_save_keeps_most_recent(self):
+        # expect the most recently used entries of all the processes to be kept
+        cache_a = create_cache('a1', 'a2')
+        cache_b = create_cache('b1')
+        cache_a.find('a1')
+        CacheSnapshots(cache_b, self.path, 0, 2).save()
+        CacheSnapshots(cache_a, self.path, 0, 2).save()
+
+        self.assertEqual([item['key'] for item in read_snapshot(self.path)], ['a1', 'b1'])
+
+    def test_concurrent_saves(self):
+        # expect concurrent saves not to lose entries
+        caches = [create_cache('key_{}'.format(index)) for index in range(8)]
+        snapshots = [CacheSnapshots(cache, self.path, 0, 16) for cache in caches]
+        with ThreadPoolExecutor(max_workers=len(snapshots)) as pool:
+            for _ in range(4):
+                list(pool.map(lambda snapshot: snapshot.save(), snapshots))
+
+        self.assertEqual(sorted(item['key'] for item in read_snapshot(self.path)),
+                         sorted('key_{}'.format(index) for index in range(8)))
@@ -0,0 +1,103 @@
+"""
+.. module:: ondalear.backend.tests.services.test_coalescing
+   :synopsis: request coalescing unit test module.
+
+
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from ondalear.backend.services.coalescing import SingleFlight
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+
+class SingleFlightTest(TestCase):
+    """Single flight test case"""
+
+    def setUp(self):
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+        self.release = threading.Event()
+
+    def compute(self):
+        with self.calls_lock:
+            self.calls += 1
+            call = self.calls
+        self.release.wait(5)
+        return call
+
+    def wait_in_flight(self, single_flight):
+        while not single_flight.stats()['in_flight']:
+            time.sleep(0.01)
+
+    def test_coalesced(self):
+        # expect the followers to share the leader outcome
+        single_flight = SingleFlight(timeout=5)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            leader = pool.submit(single_flight.run, 'key', self.compute)
+            self.wait_in_flight(single_flight)
+            followers = [pool.submit(single_flight.run, 'key', self.compute) for _ in range(3)]
+            # followers waiting, not computing
+            time.sleep(0.1)
+            self.release.set()
+            results = [leader.result()] + [follower.result() for follower in followers]
+
+        self.assertEqual(results, [1] * 4)
+        self.assertEqual(self.calls, 1)
+        stats = single_flight.stats()
+        self.assertEqual(stats['coalesced'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_coalesced_exception(self):
+        # expect the followers to raise the leader exception
+        single_flight = SingleFlight(timeout=5)
+
+        def fail():
+            self.release.wait(5)
+            raise ValueError('failed')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(single_flight.run, 'key', fail)
+            self.wait_in_flight(single_flight)
+            follower = pool.submit(single_flight.run, 'key', self.compute)
+            time.sleep(0.1)
+            self.release.set()
+            for future in (leader, follower):
+                with self.assertRaisesRegex(ValueError, 'failed'):
+                    future.result()
+
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(single_flight.stats()['coalesced'], 1)
+
+    def test_follower_timeout(self):
+        # expect a follower whose wait times out to compute on its own
+        single_flight = SingleFlight(timeout=0.1)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(single_flight.run, 'key', self.compute)
+            self.wait_in_flight(single_flight)
+            follower = pool.submit(single_flight.run, 'key', lambda: 'follower')
+
+            self.assertEqual(follower.result(), 'follower')
+            self.assertFalse(leader.done())
+            self.release.set()
+            self.assertEqual(leader.result(), 1)
+
+        stats = single_flight.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertNotIn('coalesced', stats)
+
+    def test_distinct_keys(self):
+        # expect calls with distinct keys not to be coalesced
+        single_flight = SingleFlight(timeout=5)
+        self.release.set()
+
+        self.assertEqual(single_flight.run('key_1', self.compute), 1)
+        self.assertEqual(single_flight.run('key_2', self.compute), 2)
+        self.assertEqual(single_flight.run('key_1', self.compute), 3)
+        self.assertNotIn('coalesced', single_flight.stats())
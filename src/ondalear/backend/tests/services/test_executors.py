@@ -0,0 +1,108 @@
+"""
+.. module:: ondalear.backend.tests.services.test_executors
+   :synopsis: inference executors unit test module.
+
+
+"""
+import os
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from ondalear.backend.services.base import ServiceException
+from ondalear.backend.services.executors import ProcessInferenceExecutor
+from ondalear.backend.services.model_registry import register_model_family
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring,no-self-use
+
+EXECUTOR_TEST_MODEL_FAMILY = 'executor_test'
+
+
+class ExecutorTestModel:
+    """Model sleeping or exiting its process on request"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def convert_model_input(self, model_input):
+        return model_input
+
+    def analyze(self, model_input, model_params):
+        time.sleep(model_input.get('sleep', 0))
+        if model_input.get('exit'):
+            os._exit(1)     # pylint: disable=protected-access
+        return dict(text=model_input['text_reference'])
+
+
+class ExecutorTestService:
+    """Text analytics service stub"""
+
+    def allennlp_config_file_path(self):
+        return None
+
+
+# registered before the worker processes are forked
+register_model_family(EXECUTOR_TEST_MODEL_FAMILY, ExecutorTestModel)
+
+MODEL_DESCRIPTOR = dict(model_family=EXECUTOR_TEST_MODEL_FAMILY, model_name='test')
+
+
+class ProcessInferenceExecutorTest(TestCase):
+    """Process inference executor test case"""
+
+    def setUp(self):
+        patcher = mock.patch('ondalear.backend.services.executors.initialize_allennlp')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_executor(self, max_workers=1, timeout=1):
+        executor = ProcessInferenceExecutor(ExecutorTestService(), max_workers, timeout)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    def analyze(self, executor, **model_input):
+        model_input.setdefault('text_reference', 'some text')
+        return executor.analyze(MODEL_DESCRIPTOR, [model_input], dict())
+
+    def test_analyze(self):
+        # expect the analysis to run on a worker process
+        executor = self.create_executor()
+        self.assertEqual(self.analyze(executor), [(dict(text='some text'), None)])
+
+    def test_timeout(self):
+        # expect the worker to interrupt the analysis, keeping the pool
+        executor = self.create_executor()
+        self.analyze(executor)
+        pool = executor.pool
+
+        with self.assertRaisesRegex(ServiceException, 'timed out'):
+            self.analyze(executor, sleep=5)
+
+        self.assertIs(executor.pool, pool)
+        self.assertEqual(self.analyze(executor), [(dict(text='some text'), None)])
+
+    def test_timeout_excludes_queue_time(self):
+        # expect the time spent waiting for a free worker not to count
+        executor = self.create_executor()
+        self.analyze(executor)
+
+        with ThreadPoolExecutor(max_workers=2) as callers:
+            futures = [callers.submit(self.analyze, executor, sleep=0.7) for _ in range(2)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, [[(dict(text='some text'), None)]] * 2)
+
+    def test_broken_pool(self):
+        # expect a terminated worker process to fail the analysis and replace the pool
+        executor = self.create_executor()
+        self.analyze(executor)
+        pool = executor.pool
+
+        with self.assertRaisesRegex(ServiceException, 'terminated'):
+            self.analyze(executor, exit=True)
+
+        self.assertIsNot(executor.pool, pool)
+        self.assertEqual(self.analyze(executor), [(dict(text='some text'), None)])
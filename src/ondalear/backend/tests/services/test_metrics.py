@@ -0,0 +1,52 @@
+"""
+.. module:: ondalear.backend.tests.services.test_metrics
+   :synopsis: analysis metrics unit test module.
+
+
+"""
+import logging
+from unittest import TestCase
+
+from ondalear.backend.services.metrics import (AnalysisMetrics,
+                                               StageTimings,
+                                               STAGE_TOTAL,
+                                               UNKNOWN_MODEL_LABEL)
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+
+def timings(msecs):
+    stage_timings = StageTimings()
+    stage_timings.stages[STAGE_TOTAL] = msecs
+    return stage_timings
+
+
+class AnalysisMetricsTest(TestCase):
+    """Analysis metrics test case"""
+
+    def test_unknown_models(self):
+        # expect the models not found by an analysis to share a single label
+        metrics = AnalysisMetrics()
+        for index in range(10):
+            metrics.record('garbage/model_{}'.format(index), timings(20))
+
+        summary = metrics.summary()
+        self.assertEqual(list(summary), [UNKNOWN_MODEL_LABEL])
+        self.assertEqual(summary[UNKNOWN_MODEL_LABEL][STAGE_TOTAL]['count'], 10)
+
+    def test_registered_models(self):
+        # expect a model found by an analysis to get its own label
+        metrics = AnalysisMetrics()
+        metrics.register('stub/reading_comprehension')
+        metrics.record('stub/reading_comprehension', timings(20))
+        metrics.record('stub/reading_comprehension', timings(200))
+        metrics.record('garbage/model', timings(20))
+
+        summary = metrics.summary()
+        self.assertEqual(sorted(summary), ['stub/reading_comprehension', UNKNOWN_MODEL_LABEL])
+        histogram = summary['stub/reading_comprehension'][STAGE_TOTAL]
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(histogram['p50'], 25)
+        self.assertEqual(histogram['p99'], 250)
@@ -0,0 +1,112 @@
+"""
+.. module:: ondalear.backend.tests.services.test_model_registry
+   :synopsis: model registry unit test module.
+
+
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from ondalear.backend.services.model_registry import ModelRegistry
+
+_logger = logging.getLogger(__name__)
+
+# pylint: disable=missing-docstring
+
+MODEL_SIZE = 10
+
+
+class RegistryTestModel:
+    """Model reporting its size and recording its unload"""
+
+    def __init__(self, name, unloaded):
+        self.name = name
+        self.unloaded = unloaded
+
+    def memory_size(self):
+        return MODEL_SIZE
+
+    def unload(self):
+        self.unloaded.append(self.name)
+
+
+class ModelRegistryTest(TestCase):
+    """Model registry test case"""
+
+    def setUp(self):
+        self.loaded = []
+        self.unloaded = []
+        self.load_delay = 0
+
+    def load(self, family, name):
+        self.loaded.append((family, name))
+        time.sleep(self.load_delay)
+        return RegistryTestModel(name, self.unloaded)
+
+    def loaded_names(self, registry):
+        return [stats['model_name'] for stats in registry.stats()]
+
+    def test_lru_eviction(self):
+        # expect the least recently used model to be evicted once over budget
+        registry = ModelRegistry(self.load, memory_budget=2 * MODEL_SIZE)
+        for name in ('a', 'b', 'a', 'c'):
+            with registry.use('test', name):
+                pass
+
+        self.assertEqual(self.loaded_names(registry), ['a', 'c'])
+        self.assertEqual(self.unloaded, ['b'])
+        self.assertEqual(registry.memory_size(), 2 * MODEL_SIZE)
+
+        # an evicted model is loaded again
+        with registry.use('test', 'b') as model:
+            self.assertEqual(model.name, 'b')
+        self.assertEqual(self.loaded.count(('test', 'b')), 2)
+        self.assertEqual(self.loaded_names(registry), ['c', 'b'])
+
+    def test_no_budget(self):
+        # expect no eviction without a memory budget
+        registry = ModelRegistry(self.load)
+        for name in ('a', 'b', 'c'):
+            with registry.use('test', name):
+                pass
+
+        self.assertEqual(self.loaded_names(registry), ['a', 'b', 'c'])
+        self.assertEqual(self.unloaded, [])
+
+    def test_single_load(self):
+        # expect concurrent callers to wait for a single load of a model
+        registry = ModelRegistry(self.load)
+        self.load_delay = 0.1
+        barrier = threading.Barrier(8)
+
+        def use():
+            barrier.wait()
+            with registry.use('test', 'a') as model:
+                return model
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            models = list(pool.map(lambda _: use(), range(8)))
+
+        self.assertEqual(self.loaded, [('test', 'a')])
+        self.assertTrue(all(model is models[0] for model in models))
+
+    def test_unload_once_released(self):
+        # expect an evicted model to be unloaded once no longer in use
+        registry = ModelRegistry(self.load, memory_budget=MODEL_SIZE)
+        with registry.use('test', 'a') as model:
+            with registry.use('test', 'b'):
+                # evicted, still in use
+                self.assertEqual(self.loaded_names(registry), ['b'])
+                self.assertEqual(self.unloaded, [])
+            self.assertEqual(self.unloaded, [])
+            self.assertEqual(model.name, 'a')
+
+        self.assertEqual(self.unloaded, ['a'])
+
+        # unused models are unloaded when evicted
+        with registry.use('test', 'c'):
+            pass
+        self.assertEqual(self.unloaded, ['a', 'b'])